@@ -1,17 +1,37 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from datetime import date, datetime, timedelta
 from pydantic import BaseModel
+import json
 from app.api import deps
-from app.models import Staff, Toilet, MajorCheckpoint, ClinicConfig
+from app.models import DEFAULT_CLINIC_ID, Staff, Toilet, MajorCheckpoint, ClinicConfig, Clinic
+from app.services import image_ingest, jobs
+from app.core import events
+from app.services.analytics import analytics_cache
+from app.services.reclassify import reclassify
+from app.services import clinic_settings, consistency, master_data, snapshots
+from app.services.replay import Schedule, replay
+from app.core.ratelimit import admission_stats
+from app.core import profiling, tenancy
+from app.core.tenancy import Tenant
+from app.core.timeutil import JST
+from app.core.config import settings
 from app.schemas import (
     StaffCreate, StaffUpdate, Staff as StaffSchema,
     ToiletCreate, ToiletUpdate, Toilet as ToiletSchema,
     MajorCheckpointCreate, MajorCheckpointUpdate, MajorCheckpoint as MajorCheckpointSchema,
-    ClinicConfig as ClinicConfigSchema, ClinicConfigUpdate
+    ClinicConfig as ClinicConfigSchema, ClinicConfigUpdate,
+    ClinicCreate, ClinicUpdate, Clinic as ClinicSchema,
+    BulkRequest, BulkResponse,
+    ReclassifyResponse, ConsistencyResponse
 )
 
+# Everything is scoped to the clinic of the X-Clinic header; endpoints that act on
+# the whole deployment additionally require the global admin
 router = APIRouter(dependencies=[Depends(deps.get_current_admin)])
+global_admin = [Depends(deps.get_global_admin)]
 
 # --- Staff ---
 class StaffReorderRequest(BaseModel):
@@ -20,24 +40,29 @@ class StaffReorderRequest(BaseModel):
 @router.get("/staff", response_model=List[StaffSchema])
 def get_admin_staff(
     include_inactive: bool = Query(False, description="Include inactive staff"),
+    clinic: Tenant = Depends(deps.get_clinic),
     db: Session = Depends(deps.get_db)
 ):
-    query = db.query(Staff)
+    query = db.query(Staff).filter(Staff.clinic_id == clinic.id)
     if not include_inactive:
         query = query.filter(Staff.is_active == True)
     return query.order_by(Staff.display_order).all()
 
 @router.post("/staff", response_model=StaffSchema)
-def create_staff(staff: StaffCreate, db: Session = Depends(deps.get_db)):
-    db_staff = Staff(**staff.model_dump())
+def create_staff(staff: StaffCreate, clinic: Tenant = Depends(deps.get_clinic), db: Session = Depends(deps.get_db)):
+    db_staff = Staff(clinic_id=clinic.id, **staff.model_dump())
     db.add(db_staff)
+    db.flush()
+    events.publish(db, events.MASTER_DATA_CHANGED, {"kind": "staff", "id": db_staff.id, "clinic_id": clinic.id})
     db.commit()
     db.refresh(db_staff)
     return db_staff
 
 @router.patch("/staff/{staff_id}", response_model=StaffSchema)
-def update_staff(staff_id: int, staff_in: StaffUpdate, db: Session = Depends(deps.get_db)):
-    db_staff = db.query(Staff).filter(Staff.id == staff_id).first()
+def update_staff(
+    staff_id: int, staff_in: StaffUpdate, clinic: Tenant = Depends(deps.get_clinic), db: Session = Depends(deps.get_db)
+):
+    db_staff = db.query(Staff).filter(Staff.id == staff_id, Staff.clinic_id == clinic.id).first()
     if not db_staff:
         raise HTTPException(status_code=404, detail="Staff not found")
     
@@ -45,49 +70,55 @@ def update_staff(staff_id: int, staff_in: StaffUpdate, db: Session = Depends(dep
     for key, value in update_data.items():
         setattr(db_staff, key, value)
     
+    events.publish(db, events.MASTER_DATA_CHANGED, {"kind": "staff", "id": staff_id, "clinic_id": clinic.id})
     db.commit()
     db.refresh(db_staff)
     return db_staff
 
 @router.delete("/staff/{staff_id}")
-def delete_staff(staff_id: int, db: Session = Depends(deps.get_db)):
-    db_staff = db.query(Staff).filter(Staff.id == staff_id).first()
+def delete_staff(staff_id: int, clinic: Tenant = Depends(deps.get_clinic), db: Session = Depends(deps.get_db)):
+    db_staff = db.query(Staff).filter(Staff.id == staff_id, Staff.clinic_id == clinic.id).first()
     if not db_staff:
         raise HTTPException(status_code=404, detail="Staff not found")
     
     db_staff.is_active = False
+    events.publish(db, events.MASTER_DATA_CHANGED, {"kind": "staff", "id": staff_id, "clinic_id": clinic.id})
     db.commit()
     return {"ok": True}
 
 @router.post("/staff/reorder")
-def reorder_staff(request: StaffReorderRequest, db: Session = Depends(deps.get_db)):
-    for index, staff_id in enumerate(request.staff_ids):
-        db_staff = db.query(Staff).filter(Staff.id == staff_id).first()
-        if db_staff:
-            db_staff.display_order = index + 1
+def reorder_staff(
+    request: StaffReorderRequest, clinic: Tenant = Depends(deps.get_clinic), db: Session = Depends(deps.get_db)
+):
+    master_data.reorder(db, Staff, clinic.id, request.staff_ids)
+    events.publish(db, events.MASTER_DATA_CHANGED, {"kind": "staff", "clinic_id": clinic.id})
     db.commit()
     return {"ok": True}
 
 # --- Toilets ---
 @router.get("/toilets", response_model=List[ToiletSchema])
-def get_admin_toilets(db: Session = Depends(deps.get_db)):
-    return db.query(Toilet).all()
+def get_admin_toilets(clinic: Tenant = Depends(deps.get_clinic), db: Session = Depends(deps.get_db)):
+    return db.query(Toilet).filter(Toilet.clinic_id == clinic.id).all()
 
 @router.post("/toilets", response_model=ToiletSchema)
-def create_toilet(toilet: ToiletCreate, db: Session = Depends(deps.get_db)):
-    count = db.query(Toilet).count()
+def create_toilet(toilet: ToiletCreate, clinic: Tenant = Depends(deps.get_clinic), db: Session = Depends(deps.get_db)):
+    count = db.query(Toilet).filter(Toilet.clinic_id == clinic.id).count()
     if count >= 2:
         raise HTTPException(status_code=400, detail="Max 2 toilets allowed")
     
-    db_toilet = Toilet(**toilet.model_dump())
+    db_toilet = Toilet(clinic_id=clinic.id, **toilet.model_dump())
     db.add(db_toilet)
+    db.flush()
+    events.publish(db, events.MASTER_DATA_CHANGED, {"kind": "toilet", "id": db_toilet.id, "clinic_id": clinic.id})
     db.commit()
     db.refresh(db_toilet)
     return db_toilet
 
 @router.patch("/toilets/{toilet_id}", response_model=ToiletSchema)
-def update_toilet(toilet_id: int, toilet_in: ToiletUpdate, db: Session = Depends(deps.get_db)):
-    db_toilet = db.query(Toilet).filter(Toilet.id == toilet_id).first()
+def update_toilet(
+    toilet_id: int, toilet_in: ToiletUpdate, clinic: Tenant = Depends(deps.get_clinic), db: Session = Depends(deps.get_db)
+):
+    db_toilet = db.query(Toilet).filter(Toilet.id == toilet_id, Toilet.clinic_id == clinic.id).first()
     if not db_toilet:
         raise HTTPException(status_code=404, detail="Toilet not found")
     
@@ -95,62 +126,307 @@ def update_toilet(toilet_id: int, toilet_in: ToiletUpdate, db: Session = Depends
     for key, value in update_data.items():
         setattr(db_toilet, key, value)
     
+    events.publish(db, events.MASTER_DATA_CHANGED, {"kind": "toilet", "id": toilet_id, "clinic_id": clinic.id})
     db.commit()
     db.refresh(db_toilet)
     return db_toilet
 
 # --- Major Checkpoints ---
 @router.get("/major-checkpoints", response_model=List[MajorCheckpointSchema])
-def get_major_checkpoints(db: Session = Depends(deps.get_db)):
-    return db.query(MajorCheckpoint).order_by(MajorCheckpoint.display_order).all()
+def get_major_checkpoints(clinic: Tenant = Depends(deps.get_clinic), db: Session = Depends(deps.get_db)):
+    return db.query(MajorCheckpoint).filter(MajorCheckpoint.clinic_id == clinic.id)\
+        .order_by(MajorCheckpoint.display_order).all()
+
+def _check_target_toilet(db: Session, clinic: Tenant, toilet_id: Optional[int]) -> None:
+    if toilet_id and not db.query(Toilet.id).filter(Toilet.id == toilet_id, Toilet.clinic_id == clinic.id).first():
+        raise HTTPException(status_code=404, detail="Toilet not found")
 
 @router.post("/major-checkpoints", response_model=MajorCheckpointSchema)
-def create_major_checkpoint(checkpoint: MajorCheckpointCreate, db: Session = Depends(deps.get_db)):
-    db_cp = MajorCheckpoint(**checkpoint.model_dump())
+def create_major_checkpoint(
+    checkpoint: MajorCheckpointCreate, clinic: Tenant = Depends(deps.get_clinic), db: Session = Depends(deps.get_db)
+):
+    _check_target_toilet(db, clinic, checkpoint.target_toilet_id)
+    db_cp = MajorCheckpoint(clinic_id=clinic.id, **checkpoint.model_dump())
     db.add(db_cp)
+    db.flush()
+    events.publish(db, events.MASTER_DATA_CHANGED, {"kind": "major_checkpoint", "id": db_cp.id, "clinic_id": clinic.id})
     db.commit()
     db.refresh(db_cp)
     return db_cp
 
 @router.patch("/major-checkpoints/{cp_id}", response_model=MajorCheckpointSchema)
-def update_major_checkpoint(cp_id: int, cp_in: MajorCheckpointUpdate, db: Session = Depends(deps.get_db)):
-    db_cp = db.query(MajorCheckpoint).filter(MajorCheckpoint.id == cp_id).first()
+def update_major_checkpoint(
+    cp_id: int, cp_in: MajorCheckpointUpdate, clinic: Tenant = Depends(deps.get_clinic), db: Session = Depends(deps.get_db)
+):
+    db_cp = db.query(MajorCheckpoint).filter(MajorCheckpoint.id == cp_id, MajorCheckpoint.clinic_id == clinic.id).first()
     if not db_cp:
         raise HTTPException(status_code=404, detail="Checkpoint not found")
     
     update_data = cp_in.model_dump(exclude_unset=True)
+    _check_target_toilet(db, clinic, update_data.get("target_toilet_id"))
     for key, value in update_data.items():
         setattr(db_cp, key, value)
     
+    events.publish(db, events.MASTER_DATA_CHANGED, {"kind": "major_checkpoint", "id": cp_id, "clinic_id": clinic.id})
     db.commit()
     db.refresh(db_cp)
     return db_cp
 
 @router.delete("/major-checkpoints/{cp_id}")
-def delete_major_checkpoint(cp_id: int, db: Session = Depends(deps.get_db)):
-    db_cp = db.query(MajorCheckpoint).filter(MajorCheckpoint.id == cp_id).first()
+def delete_major_checkpoint(cp_id: int, clinic: Tenant = Depends(deps.get_clinic), db: Session = Depends(deps.get_db)):
+    db_cp = db.query(MajorCheckpoint).filter(MajorCheckpoint.id == cp_id, MajorCheckpoint.clinic_id == clinic.id).first()
     if not db_cp:
         raise HTTPException(status_code=404, detail="Checkpoint not found")
     
     db.delete(db_cp)
+    events.publish(db, events.MASTER_DATA_CHANGED, {"kind": "major_checkpoint", "id": cp_id, "clinic_id": clinic.id})
     db.commit()
     return {"ok": True}
 
 # --- Settings ---
 @router.get("/settings", response_model=List[ClinicConfigSchema])
-def get_settings(db: Session = Depends(deps.get_db)):
-    return db.query(ClinicConfig).all()
+def get_settings(clinic: Tenant = Depends(deps.get_clinic), db: Session = Depends(deps.get_db)):
+    return db.query(ClinicConfig).filter(ClinicConfig.clinic_id == clinic.id).all()
 
 @router.post("/settings", response_model=ClinicConfigSchema)
-def update_setting(key: str, setting: ClinicConfigUpdate, db: Session = Depends(deps.get_db)):
-    db_setting = db.query(ClinicConfig).filter(ClinicConfig.key == key).first()
+def update_setting(
+    key: str, setting: ClinicConfigUpdate, clinic: Tenant = Depends(deps.get_clinic), db: Session = Depends(deps.get_db)
+):
+    try:
+        clinic_settings.validate(key, setting.value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    db_setting = db.query(ClinicConfig).filter(ClinicConfig.clinic_id == clinic.id, ClinicConfig.key == key).first()
     if not db_setting:
         # Create if not exists
-        db_setting = ClinicConfig(key=key, value=setting.value)
+        db_setting = ClinicConfig(clinic_id=clinic.id, key=key, value=setting.value)
         db.add(db_setting)
     else:
         db_setting.value = setting.value
     
+    events.publish(db, events.CONFIG_CHANGED, {"key": key, "clinic_id": clinic.id})
     db.commit()
     db.refresh(db_setting)
     return db_setting
+
+# --- Bulk master data ---
+@router.get("/bulk")
+def export_master_data(
+    ids: bool = Query(True, description="Include row ids (without: natural keys only, for loading into another clinic)"),
+    clinic: Tenant = Depends(deps.get_clinic),
+    db: Session = Depends(deps.get_db)
+):
+    """Staff, toilets, major checkpoints and settings of the clinic, in the shape POST /bulk takes"""
+    return master_data.export(db, clinic.id, with_ids=ids)
+
+@router.post("/bulk", response_model=BulkResponse)
+def import_master_data(
+    batch: BulkRequest,
+    dry_run: bool = Query(False, description="Only validate the batch"),
+    clinic: Tenant = Depends(deps.get_clinic),
+    db: Session = Depends(deps.get_db)
+):
+    """Upserts, reorders and deactivations of master data, validated as a whole and applied in one transaction"""
+    try:
+        result = master_data.apply(db, batch, clinic.id, dry_run=dry_run)
+    except master_data.BulkValidationError as e:
+        raise HTTPException(status_code=400, detail=e.errors)
+    if result.applied:
+        db.commit()
+    return result
+
+# --- Clinics (global admin) ---
+def _apply_clinic_fields(db_clinic: Clinic, data: dict) -> None:
+    password = data.pop("admin_password", None)
+    for key, value in data.items():
+        setattr(db_clinic, key, value)
+    if password is not None:
+        db_clinic.admin_password_hash = tenancy.hash_password(password) if password else None
+
+@router.get("/clinics", response_model=List[ClinicSchema], dependencies=global_admin)
+def get_clinics(db: Session = Depends(deps.get_db)):
+    return db.query(Clinic).order_by(Clinic.id).all()
+
+@router.post("/clinics", response_model=ClinicSchema, dependencies=global_admin)
+def create_clinic(clinic_in: ClinicCreate, db: Session = Depends(deps.get_db)):
+    if not tenancy.SLUG.match(clinic_in.slug):
+        raise HTTPException(status_code=400, detail="slug must be lowercase letters, digits and '-', not only digits")
+    if db.query(Clinic.id).filter(Clinic.slug == clinic_in.slug).first():
+        raise HTTPException(status_code=409, detail="Clinic slug already exists")
+    db_clinic = Clinic()
+    _apply_clinic_fields(db_clinic, clinic_in.model_dump())
+    db.add(db_clinic)
+    db.flush()
+    events.publish(db, events.MASTER_DATA_CHANGED, {"kind": "clinic", "id": db_clinic.id})
+    db.commit()
+    db.refresh(db_clinic)
+    return db_clinic
+
+@router.patch("/clinics/{clinic_id}", response_model=ClinicSchema, dependencies=global_admin)
+def update_clinic(clinic_id: int, clinic_in: ClinicUpdate, db: Session = Depends(deps.get_db)):
+    db_clinic = db.query(Clinic).filter(Clinic.id == clinic_id).first()
+    if not db_clinic:
+        raise HTTPException(status_code=404, detail="Clinic not found")
+    data = clinic_in.model_dump(exclude_unset=True)
+    if clinic_id == DEFAULT_CLINIC_ID and data.get("is_active") is False:
+        raise HTTPException(status_code=400, detail="The default clinic cannot be deactivated")
+    _apply_clinic_fields(db_clinic, data)
+    events.publish(db, events.MASTER_DATA_CHANGED, {"kind": "clinic", "id": clinic_id})
+    db.commit()
+    db.refresh(db_clinic)
+    return db_clinic
+
+# --- Reclassification ---
+@router.post("/reclassify", response_model=ReclassifyResponse)
+def reclassify_checks(
+    dry_run: bool = Query(True, description="Only report the differences"),
+    toilet_id: Optional[int] = None,
+    too_short_sec: Optional[int] = Query(None, description="Override CHECK_INTERVAL_TOO_SHORT_SEC"),
+    too_long_sec: Optional[int] = Query(None, description="Override CHECK_INTERVAL_TOO_LONG_SEC"),
+    clinic: Tenant = Depends(deps.get_clinic),
+    db: Session = Depends(deps.get_db)
+):
+    if too_short_sec is not None and too_long_sec is not None and too_short_sec > too_long_sec:
+        raise HTTPException(status_code=400, detail="too_short_sec must not exceed too_long_sec")
+    result = reclassify(
+        db,
+        dry_run=dry_run,
+        toilet_id=toilet_id,
+        too_short_sec=too_short_sec,
+        too_long_sec=too_long_sec,
+        clinic_id=clinic.id,
+    )
+    # Updates, snapshot invalidation and the event commit together
+    db.commit()
+    return result
+
+# --- Consistency ---
+@router.post("/consistency", response_model=ConsistencyResponse, dependencies=global_admin)
+def check_consistency(
+    dry_run: bool = Query(True, description="Only report the problems"),
+    day: Optional[date] = Query(None, description="Limit the scan to one JST day (default: everything)"),
+    db: Session = Depends(deps.get_db)
+):
+    return consistency.scan(db, day=day, dry_run=dry_run)
+
+# --- Dashboard snapshots ---
+@router.delete("/snapshots")
+def delete_snapshots(
+    day: Optional[date] = Query(None, description="JST day to rebuild (default: all days)"),
+    clinic: Tenant = Depends(deps.get_clinic),
+    db: Session = Depends(deps.get_db)
+):
+    """Drop the clinic's stored past-day dashboard views, e.g. after fixing check rows by hand."""
+    snapshots.invalidate(db, [day] if day else None, clinic.id)
+    db.commit()
+    return {"ok": True}
+
+# --- Replay ---
+@router.get("/replay")
+def replay_statuses(
+    start: date = Query(..., description="First JST day"),
+    end: Optional[date] = Query(None, description="Last JST day, inclusive (default: start)"),
+    toilet_id: Optional[int] = None,
+    detail: bool = Query(False, description="Include the per-minute status transitions"),
+    include_empty_days: bool = Query(False, description="Include days without checks"),
+    morning_start: Optional[str] = Query(None, description="Override MORNING_CHECK_START (HH:MM)"),
+    morning_deadline: Optional[str] = Query(None, description="Override MORNING_CHECK_DEADLINE"),
+    afternoon_start: Optional[str] = Query(None, description="Override AFTERNOON_CHECK_START"),
+    afternoon_deadline: Optional[str] = Query(None, description="Override AFTERNOON_CHECK_DEADLINE"),
+    regular_start: Optional[str] = Query(None, description="Override REGULAR_CHECK_START"),
+    regular_end: Optional[str] = Query(None, description="Override REGULAR_CHECK_END"),
+    regular_interval_minutes: Optional[int] = Query(None, description="Override REGULAR_CHECK_INTERVAL_MINUTES"),
+    lunch_start: Optional[str] = Query(None, description="Override LUNCH_BREAK_START"),
+    lunch_end: Optional[str] = Query(None, description="Override LUNCH_BREAK_END"),
+    clinic: Tenant = Depends(deps.get_clinic),
+    db: Session = Depends(deps.get_read_db)
+):
+    """What the morning / afternoon / regular statuses were (or would be with the overrides) minute by minute"""
+    end = end or start
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if (end - start).days >= 366:
+        raise HTTPException(status_code=400, detail="Range must be at most 366 days")
+    try:
+        schedule = Schedule.from_settings(
+            clinic.id,
+            morning_start=morning_start, morning_deadline=morning_deadline,
+            afternoon_start=afternoon_start, afternoon_deadline=afternoon_deadline,
+            regular_start=regular_start, regular_end=regular_end,
+            regular_interval_minutes=regular_interval_minutes,
+            lunch_start=lunch_start, lunch_end=lunch_end,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return replay(
+        db, start, end,
+        toilet_id=toilet_id,
+        schedule=schedule,
+        include_empty_days=include_empty_days,
+        detail=detail,
+        clinic_id=clinic.id,
+    )
+
+# --- Analytics ---
+@router.get("/analytics")
+def get_analytics(
+    start: Optional[date] = Query(None, description="First JST day (default: 90 days before end)"),
+    end: Optional[date] = Query(None, description="Last JST day, inclusive (default: today)"),
+    toilet_id: Optional[int] = None,
+    clinic: Tenant = Depends(deps.get_clinic),
+    db: Session = Depends(deps.get_read_db)
+):
+    end = end or datetime.now(JST).date()
+    start = start or end - timedelta(days=89)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return analytics_cache.get(db, start, end, toilet_id, clinic.id)
+
+# --- Metrics ---
+@router.get("/metrics", dependencies=global_admin)
+def get_metrics(db: Session = Depends(deps.get_db)):
+    return {
+        "ingest": image_ingest.ingest_stats.snapshot(),
+        "jobs": jobs.queue_stats(db),
+        "uploads": admission_stats.snapshot(),
+    }
+
+# --- Profiles ---
+PROFILE_FILES = {
+    "collapsed": (".collapsed", "text/plain"),
+    "sql": (".sql.json", "application/json"),
+    "pstats": (".pstats", "application/octet-stream"),
+}
+
+@router.get("/profiles", dependencies=global_admin)
+def get_profiles():
+    return profiling.list_profiles()
+
+@router.get("/profiles/{profile_id}", dependencies=global_admin)
+def get_profile(profile_id: str):
+    path = profiling.profile_path(profile_id, ".json")
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    with open(path, encoding="utf-8") as f:
+        summary = json.load(f)
+    summary["files"] = {
+        kind: f"{settings.API_V1_STR}/admin/profiles/{profile_id}/{kind}"
+        for kind, (suffix, _) in PROFILE_FILES.items()
+        if profiling.profile_path(profile_id, suffix)
+    }
+    return summary
+
+@router.get("/profiles/{profile_id}/{kind}", dependencies=global_admin)
+def get_profile_file(profile_id: str, kind: str):
+    if kind not in PROFILE_FILES:
+        raise HTTPException(status_code=404, detail="Unknown profile file")
+    suffix, media_type = PROFILE_FILES[kind]
+    path = profiling.profile_path(profile_id, suffix)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type=media_type, filename=f"{profile_id}{suffix}")
+
+# --- Jobs ---
+@router.get("/jobs/stats", dependencies=global_admin)
+def get_job_stats(db: Session = Depends(deps.get_db)):
+    return jobs.queue_stats(db)
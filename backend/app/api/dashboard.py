@@ -1,217 +1,58 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, func, and_
 from typing import List, Optional
 from datetime import datetime, date, time, timedelta, timezone
 import os
+from dataclasses import asdict
 from app.api import deps
 from app.core.config import settings
-from app.models import ToiletCheck, MajorCheckpoint, Toilet, Staff, CheckImage
+from app.models import ToiletCheck, MajorCheckpoint, Toilet, Staff, CheckImage, AlertTransition
 from app.schemas import (
     DashboardDayResponse, MajorCheckpointStatus, RealtimeAlert, TimelineItem,
-    SimpleStatusResponse, ScheduledCheckStatus, RegularCheckStatus, SimpleTimelineItem
+    SimpleStatusResponse, ScheduledCheckStatus, RegularCheckStatus, SimpleTimelineItem,
+    AlertHistoryItem, ContactSheetResponse
 )
+from app.core.tenancy import Tenant
+from app.core.timeutil import JST, Clock, day_bounds_utc, parse_time, to_jst
+from app.services.alerts import compute_realtime_levels, read_clinic_statuses, read_realtime_states
+from app.services.check_status import calculate_simple_statuses, fetch_day_checks
+from app.services import contact_sheet, snapshots
+from app.services.delta import CURSOR_HEADER, compute_delta
+from app.services.partitions import fetch_checks
 
 router = APIRouter()
 
-# JST timezone
-JST = timezone(timedelta(hours=9))
-
-
-def parse_time(time_str: str) -> time:
-    """Parse HH:MM string to time object"""
-    h, m = map(int, time_str.split(":"))
-    return time(h, m)
-
-
-def to_jst(dt: datetime) -> datetime:
-    """datetimeをJSTに変換"""
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=timezone.utc)
-    return dt.astimezone(JST)
-
-
-def calculate_scheduled_check_status(
-    checks: List[ToiletCheck],
-    start_time: time,
-    deadline: time,
-    now_jst: datetime
-) -> ScheduledCheckStatus:
-    """
-    朝チェック・午後チェックの状態を計算
-    - 開始時刻から警告（黄色）
-    - 期限を過ぎたらアラート（赤）
-    - チェック完了したら時刻表示（OK/緑）
-    """
-    time_range = f"{start_time.strftime('%H:%M')}〜{deadline.strftime('%H:%M')}"
-    
-    # この時間帯以降のチェックを探す（開始時刻以降なら期限超過でもOK）
-    matched_check = None
-    for check in checks:
-        check_jst = to_jst(check.checked_at)
-        check_time = check_jst.time()
-        if check_time >= start_time:
-            matched_check = check
-            break
-    
-    if matched_check:
-        # チェック完了 → OK（緑）+ 時刻表示
-        check_jst = to_jst(matched_check.checked_at)
-        check_time_str = check_jst.strftime("%H:%M")
-        
-        return ScheduledCheckStatus(
-            status="ok",
-            time=check_time_str,
-            deadline=deadline.strftime("%H:%M"),
-            time_range=time_range
-        )
-    else:
-        # 未実施
-        now_time = now_jst.time()
-        if now_time < start_time:
-            # 開始時刻前 → 待機中（グレー）
-            status = "pending"
-        elif now_time <= deadline:
-            # 開始〜期限内 → 警告（黄色）
-            status = "warning"
-        else:
-            # 期限超過 → アラート（赤）
-            status = "alert"
-        
-        return ScheduledCheckStatus(
-            status=status,
-            time=None,
-            deadline=deadline.strftime("%H:%M"),
-            time_range=time_range
-        )
-
-
-def calculate_elapsed_excluding_lunch(last_check_jst: datetime, now_jst: datetime) -> int:
-    """
-    昼休み (12:00-14:00) を除外した経過時間（分）を計算
-    """
-    lunch_start = time(12, 0)
-    lunch_end = time(14, 0)
-    
-    total_minutes = 0
-    current = last_check_jst
-    
-    while current < now_jst:
-        current_time = current.time()
-        
-        # 昼休み中の場合はスキップ
-        if lunch_start <= current_time < lunch_end:
-            # 昼休み終了まで進める
-            lunch_end_dt = datetime.combine(current.date(), lunch_end).replace(tzinfo=JST)
-            if lunch_end_dt > now_jst:
-                break
-            current = lunch_end_dt
-            continue
-        
-        # 次の1分を加算
-        next_minute = current + timedelta(minutes=1)
-        
-        # 昼休み開始前で、次の1分が昼休み中なら昼休み開始まで
-        if current_time < lunch_start and next_minute.time() >= lunch_start:
-            lunch_start_dt = datetime.combine(current.date(), lunch_start).replace(tzinfo=JST)
-            minutes_to_lunch = int((lunch_start_dt - current).total_seconds() / 60)
-            total_minutes += minutes_to_lunch
-            current = lunch_start_dt
-            continue
-        
-        # 通常の1分加算
-        if next_minute > now_jst:
-            remaining = int((now_jst - current).total_seconds() / 60)
-            total_minutes += remaining
-            break
-        
-        total_minutes += 1
-        current = next_minute
-    
-    return total_minutes
-
-
-def calculate_regular_check_status(
-    last_check: Optional[ToiletCheck],
-    now_jst: datetime
-) -> RegularCheckStatus:
-    """
-    定期チェックの状態を計算
-    """
-    regular_start = parse_time(settings.REGULAR_CHECK_START)
-    regular_end = parse_time(settings.REGULAR_CHECK_END)
-    threshold = settings.REGULAR_CHECK_INTERVAL_MINUTES
-    
-    now_time = now_jst.time()
-    is_active = regular_start <= now_time <= regular_end
-    
-    if not last_check:
-        # チェックなし - 営業開始からの経過時間
-        if is_active:
-            start_dt = datetime.combine(now_jst.date(), regular_start).replace(tzinfo=JST)
-            elapsed = calculate_elapsed_excluding_lunch(start_dt, now_jst)
-        else:
-            elapsed = 0
-    else:
-        last_check_jst = to_jst(last_check.checked_at)
-        elapsed = calculate_elapsed_excluding_lunch(last_check_jst, now_jst)
-    
-    # ステータス判定
-    if elapsed <= threshold:
-        status = "ok"
-    elif elapsed <= threshold * 2:
-        status = "warning"
-    else:
-        status = "alert"
-    
-    return RegularCheckStatus(
-        status=status,
-        minutes_elapsed=elapsed,
-        next_check_in=threshold - elapsed,
-        threshold=threshold,
-        is_active=is_active
-    )
-
-
 @router.get("/simple-status", response_model=SimpleStatusResponse)
-def get_simple_status(db: Session = Depends(deps.get_db)):
+def get_simple_status(
+    response: Response,
+    since: Optional[str] = None,
+    clock: Clock = Depends(deps.get_clock),
+    clinic: Tenant = Depends(deps.get_clinic),
+    db: Session = Depends(deps.get_read_db)
+):
     """
     シンプルなアラート状態を返す（トイレ1つ前提）
+
+    since に前回の cursor を渡すと、新しいタイムライン項目と変化した状態だけを返す。
+    何も変わっていなければ 304
+    at を指定するとその時刻の表示を再現する（管理者のみ）
     """
-    now_utc = datetime.now(timezone.utc)
+    now_utc = clock.now()
     now_jst = now_utc.astimezone(JST)
     today = now_jst.date()
     
     # 本日のチェックを取得
-    day_checks = db.query(ToiletCheck).filter(
-        func.date(ToiletCheck.checked_at) == today
-    ).order_by(ToiletCheck.checked_at).all()
-    
-    # 時刻設定を取得
-    morning_start = parse_time(settings.MORNING_CHECK_START)
-    morning_deadline = parse_time(settings.MORNING_CHECK_DEADLINE)
-    afternoon_start = parse_time(settings.AFTERNOON_CHECK_START)
-    afternoon_deadline = parse_time(settings.AFTERNOON_CHECK_DEADLINE)
-    
-    # 朝チェック判定（8:00〜14:00のチェックを対象）
-    morning_checks = [c for c in day_checks 
-                      if morning_start <= to_jst(c.checked_at).time() < afternoon_start]
-    
-    morning_status = calculate_scheduled_check_status(
-        morning_checks, morning_start, morning_deadline, now_jst
-    )
-    
-    # 午後チェック判定（14:00〜のチェックを対象）
-    afternoon_checks = [c for c in day_checks 
-                        if to_jst(c.checked_at).time() >= afternoon_start]
-    
-    afternoon_status = calculate_scheduled_check_status(
-        afternoon_checks, afternoon_start, afternoon_deadline, now_jst
-    )
-    
-    # 定期チェック判定
+    day_checks = fetch_day_checks(db, today, clinic.id)
+    if clock.simulated:
+        day_checks = _checks_until(day_checks, now_utc)
     last_check = day_checks[-1] if day_checks else None
-    regular_status = calculate_regular_check_status(last_check, now_jst)
+
+    # 朝・午後・定期チェックの状態（評価済みの状態があればそれを使う）
+    statuses = None if clock.simulated else read_clinic_statuses(db, now_utc, last_check, clinic.id)
+    if statuses is None:
+        statuses = calculate_simple_statuses(day_checks, now_jst, clinic.id)
+    morning_status, afternoon_status, regular_status = statuses
     
     # タイムライン作成（新しい順）
     timeline = []
@@ -219,6 +60,7 @@ def get_simple_status(db: Session = Depends(deps.get_db)):
         check_jst = to_jst(check.checked_at)
         staff_icon = check.staff.icon_code if check.staff else "❓"
         timeline.append(SimpleTimelineItem(
+            id=check.id,
             time=check_jst.strftime("%H:%M"),
             staff_icon=staff_icon
         ))
@@ -228,43 +70,87 @@ def get_simple_status(db: Session = Depends(deps.get_db)):
     if last_check:
         last_check_at = to_jst(last_check.checked_at).isoformat()
     
+    status = [today, morning_status, afternoon_status, regular_status, last_check_at]
+    delta = compute_delta(timeline, status, since)
+    if delta.not_modified:
+        return Response(status_code=304, headers={CURSOR_HEADER: str(delta.cursor)})
+    response.headers[CURSOR_HEADER] = str(delta.cursor)
+
     return SimpleStatusResponse(
         date=today.isoformat(),
         current_time=now_jst.strftime("%H:%M"),
-        morning_check=morning_status,
-        afternoon_check=afternoon_status,
-        regular_check=regular_status,
+        morning_check=morning_status if delta.status_changed else None,
+        afternoon_check=afternoon_status if delta.status_changed else None,
+        regular_check=regular_status if delta.status_changed else None,
         last_check_at=last_check_at,
-        timeline=timeline
+        timeline=delta.timeline,
+        cursor=str(delta.cursor),
+        is_delta=delta.is_delta
     )
 
 
 @router.get("/day", response_model=DashboardDayResponse)
 def get_dashboard_day(
+    response: Response,
     date_str: str, # YYYY-MM-DD
     toilet_id: Optional[int] = None,
-    db: Session = Depends(deps.get_db)
+    since: Optional[str] = None, # cursor from the previous response
+    if_none_match: Optional[str] = Header(None),
+    clock: Clock = Depends(deps.get_clock),
+    clinic: Tenant = Depends(deps.get_clinic),
+    db: Session = Depends(deps.get_read_db)
 ):
     try:
         target_date = datetime.strptime(date_str, "%Y-%m-%d").date()
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format")
 
+    current_dt = clock.now()
+
+    # Completed past days are served from a stored snapshot
+    if not clock.simulated and snapshots.is_final(target_date, current_dt):
+        return _day_snapshot_response(db, clinic.id, target_date, toilet_id, since, if_none_match, current_dt)
+
+    checkpoint_statuses, alerts, timeline = _build_day(db, clinic.id, target_date, toilet_id, current_dt, clock.simulated)
+
+    # Delta sync: only what changed since the client's cursor, or 304
+    delta = compute_delta(timeline, [target_date, toilet_id, checkpoint_statuses, alerts], since)
+    if delta.not_modified:
+        return Response(status_code=304, headers={CURSOR_HEADER: str(delta.cursor)})
+    response.headers[CURSOR_HEADER] = str(delta.cursor)
+
+    return DashboardDayResponse(
+        major_checkpoints=checkpoint_statuses if delta.status_changed else None,
+        realtime_alerts=alerts if delta.status_changed else None,
+        timeline=delta.timeline,
+        cursor=str(delta.cursor),
+        is_delta=delta.is_delta
+    )
+
+
+def _checks_until(checks: list, now_utc: datetime) -> list:
+    """Checks that existed at `now_utc` (time travel)"""
+    return [c for c in checks if to_jst(c.checked_at) <= now_utc]
+
+
+def _build_day(
+    db: Session, clinic_id: int, target_date: date, toilet_id: Optional[int], current_dt: datetime, simulated: bool = False
+):
+    """Checkpoint statuses, realtime alerts and timeline (newest first) of a JST day of one clinic."""
     # 1. Major Checkpoints Status
-    major_checkpoints = db.query(MajorCheckpoint).filter(MajorCheckpoint.is_active == True).order_by(MajorCheckpoint.display_order).all()
+    major_checkpoints = db.query(MajorCheckpoint)\
+        .filter(MajorCheckpoint.clinic_id == clinic_id, MajorCheckpoint.is_active == True)\
+        .order_by(MajorCheckpoint.display_order).all()
     checkpoint_statuses = []
     
     # Get all checks for the day
-    day_checks_query = db.query(ToiletCheck).filter(func.date(ToiletCheck.checked_at) == target_date)
-    if toilet_id:
-        day_checks_query = day_checks_query.filter(ToiletCheck.toilet_id == toilet_id)
-    day_checks = day_checks_query.all()
+    # (JST day as a checked_at range: uses the index / partition pruning, reads the archive if needed)
+    day_checks = fetch_checks(db, *day_bounds_utc(target_date), toilet_id=toilet_id, clinic_id=clinic_id)
+    if simulated:
+        day_checks = _checks_until(day_checks, current_dt)
 
-    current_dt = datetime.now(timezone.utc)
-    is_today = target_date == current_dt.date()
-
-    # Define JST
-    JST = timezone(timedelta(hours=9))
+    today_jst = current_dt.astimezone(JST).date()
+    is_today = target_date == today_jst
 
     for cp in major_checkpoints:
         # Filter checks within this checkpoint's time window
@@ -303,7 +189,7 @@ def get_dashboard_day(
                     status = "pending" # Current window, not done yet
                 else:
                     status = "missed" # Past window
-            elif target_date < current_dt.date():
+            elif target_date < today_jst:
                 status = "missed" # Past day
             else:
                 status = "pending" # Future day
@@ -315,48 +201,28 @@ def get_dashboard_day(
         ))
 
     # 2. Realtime Alerts (Only for today)
+    # Read the precomputed per-toilet state; recompute only if it is stale
     alerts = []
     if is_today:
-        # Get all active toilets
-        toilets = db.query(Toilet).filter(Toilet.is_active == True).all()
-        if toilet_id:
-            toilets = [t for t in toilets if t.id == toilet_id]
-            
-        for toilet in toilets:
-            # Get last check for this toilet
-            last_check = db.query(ToiletCheck)\
-                .filter(ToiletCheck.toilet_id == toilet.id)\
-                .order_by(desc(ToiletCheck.checked_at))\
-                .first()
-            
-            elapsed_minutes = 0
-            if last_check:
-                last_at = last_check.checked_at
-                if last_at.tzinfo is None:
-                    last_at = last_at.replace(tzinfo=timezone.utc)
-                delta = current_dt - last_at
-                elapsed_minutes = int(delta.total_seconds() / 60)
-            else:
-                # No check ever? Or just today? 
-                # Logic says "from previous check". If no check today, maybe check yesterday?
-                # Let's assume "last check ever".
-                pass 
-                # If no check ever, maybe we should alert if it's been a long time since opening?
-                # For simplicity, if no check exists, ignore or treat as very long?
-                # Let's ignore for now to avoid noise on fresh install.
-
-            if elapsed_minutes >= 90:
-                alerts.append(RealtimeAlert(
-                    toilet_name=toilet.name,
-                    minutes_elapsed=elapsed_minutes,
-                    alert_level="alert"
-                ))
-            elif elapsed_minutes >= 75:
-                alerts.append(RealtimeAlert(
-                    toilet_name=toilet.name,
-                    minutes_elapsed=elapsed_minutes,
-                    alert_level="warning"
-                ))
+        states = None if simulated else read_realtime_states(db, current_dt, toilet_id, clinic_id)
+        if states is not None:
+            for state in states:
+                if state.level in ("warning", "alert"):
+                    alerts.append(RealtimeAlert(
+                        toilet_name=state.detail["toilet_name"],
+                        minutes_elapsed=state.minutes_elapsed,
+                        alert_level=state.level,
+                        since=state.since
+                    ))
+        else:
+            for item in compute_realtime_levels(db, current_dt, toilet_id, clinic_id):
+                if item.level in ("warning", "alert"):
+                    alerts.append(RealtimeAlert(
+                        toilet_name=item.toilet.name,
+                        minutes_elapsed=item.minutes_elapsed,
+                        alert_level=item.level,
+                        since=item.entered_at
+                    ))
 
     # 3. Timeline
     timeline = []
@@ -404,11 +270,117 @@ def get_dashboard_day(
             checked_at=check.checked_at,
             staff_icon=staff_icon,
             status_type=check.status_type,
-            thumbnails=thumbs
+            thumbnails=thumbs,
+            suspected_duplicate=any(img.near_duplicate_of_id for img in check.images)
         ))
 
-    return DashboardDayResponse(
-        major_checkpoints=checkpoint_statuses,
-        realtime_alerts=alerts,
-        timeline=timeline
+    return checkpoint_statuses, alerts, timeline
+
+
+def _day_snapshot_response(
+    db: Session,
+    clinic_id: int,
+    target_date: date,
+    toilet_id: Optional[int],
+    since: Optional[str],
+    if_none_match: Optional[str],
+    current_dt: datetime,
+) -> Response:
+    """Serve a completed day from its snapshot, building it on first request."""
+    definitions = snapshots.definitions_digest(db, clinic_id)
+    snapshot = snapshots.load(db, target_date, toilet_id, definitions, clinic_id)
+    if snapshot is None:
+        checkpoint_statuses, alerts, timeline = _build_day(db, clinic_id, target_date, toilet_id, current_dt)
+        delta = compute_delta(timeline, [target_date, toilet_id, checkpoint_statuses, alerts], None)
+        body = DashboardDayResponse(
+            major_checkpoints=checkpoint_statuses,
+            realtime_alerts=alerts,
+            timeline=timeline,
+            cursor=str(delta.cursor),
+            is_delta=False
+        ).model_dump_json()
+        snapshot = snapshots.save(target_date, toilet_id, definitions, str(delta.cursor), body, clinic_id)
+
+    headers = {**snapshot.headers, CURSOR_HEADER: snapshot.cursor}
+    if snapshot.matches(if_none_match) or since == snapshot.cursor:
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+
+@router.get("/day/contact-sheet", response_model=ContactSheetResponse)
+def get_day_contact_sheet(
+    date_str: str,
+    clinic: Tenant = Depends(deps.get_clinic),
+    db: Session = Depends(deps.get_read_db),
+    primary: Session = Depends(deps.get_db)
+):
+    """
+    All of the day's timeline thumbnails as one sprite image plus tile offsets,
+    so the timeline needs one image request instead of two per check. An
+    up-to-date sheet is served from the replica's view; building it reads the primary.
+    """
+    try:
+        target_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+
+    sheet = contact_sheet.get_sheet(db, target_date, clinic.id, primary=primary)
+    if sheet is None:
+        raise HTTPException(status_code=404, detail="No checks on this day")
+    return ContactSheetResponse(
+        date=sheet.date,
+        version=sheet.version,
+        url=sheet.url,
+        tile_size=sheet.tile_size,
+        width=sheet.width,
+        height=sheet.height,
+        tiles=[asdict(t) for t in sheet.tiles]
+    )
+
+
+@router.get("/alerts/history", response_model=List[AlertHistoryItem])
+def get_alert_history(
+    date_str: str, # YYYY-MM-DD (JST)
+    toilet_id: Optional[int] = None,
+    clinic: Tenant = Depends(deps.get_clinic),
+    db: Session = Depends(deps.get_read_db)
+):
+    """
+    指定日に発生した警告・アラートの開始時刻と継続時間
+    """
+    try:
+        target_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+
+    start_utc, end_utc = day_bounds_utc(target_date)
+    now_utc = datetime.now(timezone.utc)
+
+    query = db.query(AlertTransition).filter(
+        AlertTransition.clinic_id == clinic.id,
+        AlertTransition.level.in_(["warning", "alert"]),
+        AlertTransition.started_at < end_utc,
+        (AlertTransition.ended_at.is_(None)) | (AlertTransition.ended_at >= start_utc)
     )
+    if toilet_id:
+        query = query.filter(
+            (AlertTransition.toilet_id == toilet_id) | (AlertTransition.toilet_id.is_(None))
+        )
+    transitions = query.order_by(AlertTransition.started_at).all()
+
+    toilet_names = dict(db.query(Toilet.id, Toilet.name).filter(Toilet.clinic_id == clinic.id).all())
+    history = []
+    for tr in transitions:
+        started_at = to_jst(tr.started_at)
+        ended_at = to_jst(tr.ended_at) if tr.ended_at else None
+        duration = (ended_at or now_utc) - started_at
+        history.append(AlertHistoryItem(
+            kind=tr.kind,
+            toilet_id=tr.toilet_id,
+            toilet_name=toilet_names.get(tr.toilet_id),
+            level=tr.level,
+            started_at=started_at,
+            ended_at=ended_at,
+            duration_minutes=int(duration.total_seconds() / 60)
+        ))
+    return history
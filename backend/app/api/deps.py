@@ -1,12 +1,17 @@
-from typing import Generator, Annotated
-from fastapi import Depends, HTTPException, status
+from typing import Generator, Annotated, Optional
+from datetime import datetime
+from fastapi import Depends, Header, HTTPException, Query, status
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from sqlalchemy.orm import Session
-from app.db.session import SessionLocal
+from app.core import events, tenancy
+from app.core.tenancy import Tenant
+from app.db.session import SessionLocal, ReplicaSessionLocal, note_write, wrote_recently
 from app.core.config import settings
+from app.core.timeutil import Clock
 import secrets
 
 security = HTTPBasic()
+optional_security = HTTPBasic(auto_error=False)
 
 def get_db() -> Generator:
     try:
@@ -15,23 +20,85 @@ def get_db() -> Generator:
     finally:
         db.close()
 
-def get_current_admin(credentials: Annotated[HTTPBasicCredentials, Depends(security)]):
-    current_username_bytes = credentials.username.encode("utf8")
-    correct_username_bytes = settings.ADMIN_USERNAME.encode("utf8")
+def get_read_db(x_device_uuid: Optional[str] = Header(None)) -> Generator:
+    """
+    Read-only session for GET endpoints. Uses the replica, except for a device
+    that wrote within READ_YOUR_WRITES_SECONDS (so it sees its own check).
+    """
+    factory = SessionLocal if wrote_recently(x_device_uuid) else ReplicaSessionLocal
+    try:
+        db = factory()
+        yield db
+    finally:
+        db.close()
+
+@events.subscribe(events.CHECK_CREATED)
+def _note_device_write(payload: dict) -> None:
+    # The device's next read may hit another worker process
+    note_write(payload.get("device_uuid"))
+
+def get_clinic(
+    x_clinic: Optional[str] = Header(None, description="Clinic slug or id (default: the default clinic)")
+) -> Tenant:
+    """Clinic (tenant) the request is for, from the X-Clinic header."""
+    clinic = tenancy.resolve(x_clinic)
+    if clinic is None:
+        raise HTTPException(status_code=404, detail="Clinic not found")
+    return clinic
+
+def verify_admin(username: str, password: str) -> bool:
+    """Global admin account from the settings (every clinic, deployment-wide maintenance)."""
     is_correct_username = secrets.compare_digest(
-        current_username_bytes, correct_username_bytes
+        username.encode("utf8"), settings.ADMIN_USERNAME.encode("utf8")
     )
-    
-    current_password_bytes = credentials.password.encode("utf8")
-    correct_password_bytes = settings.ADMIN_PASSWORD.encode("utf8")
     is_correct_password = secrets.compare_digest(
-        current_password_bytes, correct_password_bytes
+        password.encode("utf8"), settings.ADMIN_PASSWORD.encode("utf8")
     )
-    
-    if not (is_correct_username and is_correct_password):
+    return is_correct_username and is_correct_password
+
+def is_admin(clinic: Tenant, credentials: Optional[HTTPBasicCredentials]) -> bool:
+    """Global admin, or the admin account of the clinic."""
+    if credentials is None:
+        return False
+    return verify_admin(credentials.username, credentials.password) \
+        or tenancy.verify_clinic_admin(clinic, credentials.username, credentials.password)
+
+def get_current_admin(
+    credentials: Annotated[HTTPBasicCredentials, Depends(security)],
+    clinic: Tenant = Depends(get_clinic),
+):
+    """Global admin, or the admin account of the requested clinic."""
+    if not is_admin(clinic, credentials):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Basic"},
         )
     return credentials.username
+
+def get_global_admin(credentials: Annotated[HTTPBasicCredentials, Depends(security)]):
+    """Deployment-wide endpoints (clinics, jobs, consistency, profiles): global admin only."""
+    if not verify_admin(credentials.username, credentials.password):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Global admin required",
+        )
+    return credentials.username
+
+def get_clock(
+    at: Optional[datetime] = Query(None, description="Render as of this instant (ISO 8601, JST if no offset); admin only"),
+    credentials: Optional[HTTPBasicCredentials] = Depends(optional_security),
+    clinic: Tenant = Depends(get_clinic),
+) -> Clock:
+    """
+    Current time for the request; tests override this dependency. `at=` replays
+    a past moment, which skips snapshots and evaluated alert states and rebuilds
+    the view, so it is only honored for admins of the clinic.
+    """
+    if at is not None and not is_admin(clinic, credentials):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="at= requires admin credentials",
+            headers={"WWW-Authenticate": "Basic"},
+        )
+    return Clock(at)
@@ -2,15 +2,17 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from typing import List
 from app.api import deps
+from app.core.tenancy import Tenant
 from app.models import Toilet, Staff
 from app.schemas import Toilet as ToiletSchema, Staff as StaffSchema
 
 router = APIRouter()
 
 @router.get("/toilets", response_model=List[ToiletSchema])
-def get_toilets(db: Session = Depends(deps.get_db)):
-    return db.query(Toilet).filter(Toilet.is_active == True).all()
+def get_toilets(clinic: Tenant = Depends(deps.get_clinic), db: Session = Depends(deps.get_read_db)):
+    return db.query(Toilet).filter(Toilet.clinic_id == clinic.id, Toilet.is_active == True).all()
 
 @router.get("/staff", response_model=List[StaffSchema])
-def get_staff(db: Session = Depends(deps.get_db)):
-    return db.query(Staff).filter(Staff.is_active == True).order_by(Staff.display_order).all()
+def get_staff(clinic: Tenant = Depends(deps.get_clinic), db: Session = Depends(deps.get_read_db)):
+    return db.query(Staff).filter(Staff.clinic_id == clinic.id, Staff.is_active == True)\
+        .order_by(Staff.display_order).all()
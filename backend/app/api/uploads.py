@@ -0,0 +1,192 @@
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Request, Response
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from datetime import datetime, timezone
+import logging
+import uuid
+from typing import Optional
+from app.api import deps
+from app.core.config import settings
+from app.core.ratelimit import admit_new_check
+from app.core.tenancy import Tenant
+from app.db.session import note_write
+from app.models import ToiletCheck, UploadSession, Toilet, Staff
+from app.schemas import UploadCreate, UploadPart, UploadSessionResponse, CheckResponse
+from app.services import uploads
+from app.services.check_recorder import record_check
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Resumable upload protocol (tus-style):
+#   POST   /uploads/                       -> create session, declare part sizes
+#   HEAD   /uploads/{id}/parts/{index}     -> Upload-Offset of that part
+#   PATCH  /uploads/{id}/parts/{index}     -> append chunk at Upload-Offset
+#   POST   /uploads/{id}/finalize          -> create the check from the parts
+
+
+def _get_upload(db: Session, upload_id: str) -> UploadSession:
+    upload = db.query(UploadSession).filter(UploadSession.id == upload_id).first()
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    return upload
+
+
+def _part_size(upload: UploadSession, index: int) -> int:
+    if not 0 <= index < len(upload.part_sizes):
+        raise HTTPException(status_code=404, detail="Part not found")
+    return upload.part_sizes[index]
+
+
+def _finalized_check(db: Session, upload_id: str) -> Optional[ToiletCheck]:
+    """Check of a session finalized by a concurrent request, re-read outside this transaction."""
+    db.rollback()
+    upload = _get_upload(db, upload_id)
+    if upload.check_id is None:
+        return None
+    return db.query(ToiletCheck).filter(ToiletCheck.id == upload.check_id).first()
+
+
+def _session_response(upload: UploadSession) -> UploadSessionResponse:
+    return UploadSessionResponse(
+        upload_id=upload.id,
+        parts=[
+            UploadPart(index=i, size=size, offset=uploads.part_offset(upload.id, i))
+            for i, size in enumerate(upload.part_sizes)
+        ],
+        expires_at=uploads.expires_at(upload),
+        check_id=upload.check_id
+    )
+
+
+@router.post("/", response_model=UploadSessionResponse, status_code=201)
+def create_upload(
+    upload_in: UploadCreate,
+    request: Request,
+    clinic: Tenant = Depends(deps.get_clinic),
+    db: Session = Depends(deps.get_db)
+):
+    admit_new_check(request, upload_in.device_uuid)
+    part_count = len(upload_in.part_sizes)
+    if part_count < 2:
+        raise HTTPException(status_code=400, detail="At least 2 images are required")
+    if part_count > settings.UPLOAD_MAX_PARTS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.UPLOAD_MAX_PARTS} images are allowed")
+    if any(size <= 0 or size > settings.UPLOAD_MAX_PART_BYTES for size in upload_in.part_sizes):
+        raise HTTPException(status_code=400, detail="Invalid part size")
+
+    if not db.query(Toilet).filter(Toilet.id == upload_in.toilet_id, Toilet.clinic_id == clinic.id).first():
+        raise HTTPException(status_code=404, detail="Toilet not found")
+    if not db.query(Staff).filter(Staff.id == upload_in.staff_id, Staff.clinic_id == clinic.id).first():
+        raise HTTPException(status_code=404, detail="Staff not found")
+
+    # The session id is the capability for the later calls; it remembers its clinic
+    upload = UploadSession(id=uuid.uuid4().hex, clinic_id=clinic.id, **upload_in.model_dump())
+    uploads.create_staging(upload.id, part_count)
+    db.add(upload)
+    db.commit()
+    db.refresh(upload)
+    return _session_response(upload)
+
+
+@router.get("/{upload_id}", response_model=UploadSessionResponse)
+def get_upload(upload_id: str, db: Session = Depends(deps.get_db)):
+    return _session_response(_get_upload(db, upload_id))
+
+
+@router.head("/{upload_id}/parts/{index}")
+def get_part_offset(upload_id: str, index: int, db: Session = Depends(deps.get_db)):
+    upload = _get_upload(db, upload_id)
+    size = _part_size(upload, index)
+    return Response(headers={
+        "Upload-Offset": str(uploads.part_offset(upload_id, index)),
+        "Upload-Length": str(size),
+        "Cache-Control": "no-store",
+    })
+
+
+@router.patch("/{upload_id}/parts/{index}", status_code=204)
+def upload_chunk(
+    upload_id: str,
+    index: int,
+    chunk: bytes = Body(..., media_type="application/offset+octet-stream"),
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    db: Session = Depends(deps.get_db)
+):
+    upload = _get_upload(db, upload_id)
+    if upload.check_id:
+        raise HTTPException(status_code=409, detail="Upload already finalized")
+    size = _part_size(upload, index)
+
+    try:
+        new_offset = uploads.append_chunk(upload_id, index, upload_offset, chunk, size)
+    except uploads.OffsetMismatch as e:
+        raise HTTPException(
+            status_code=409,
+            detail=str(e),
+            headers={"Upload-Offset": str(e.current)}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Keep the session alive while chunks keep arriving
+    upload.updated_at = datetime.now(timezone.utc)
+    db.commit()
+
+    return Response(status_code=204, headers={"Upload-Offset": str(new_offset)})
+
+
+@router.post("/{upload_id}/finalize", response_model=CheckResponse)
+def finalize_upload(upload_id: str, response: Response, db: Session = Depends(deps.get_db)):
+    upload = _get_upload(db, upload_id)
+
+    # Finalize is idempotent: a client that lost the response can retry
+    if upload.check_id:
+        return db.query(ToiletCheck).filter(ToiletCheck.id == upload.check_id).first()
+
+    incomplete = [
+        i for i, size in enumerate(upload.part_sizes)
+        if uploads.part_offset(upload_id, i) != size
+    ]
+    if incomplete:
+        # The staging files are gone once a concurrent finalize has committed
+        check = _finalized_check(db, upload_id)
+        if check:
+            return check
+        raise HTTPException(status_code=409, detail=f"Parts not complete: {incomplete}")
+
+    try:
+        payloads = uploads.read_parts(upload_id, len(upload.part_sizes))
+    except FileNotFoundError:
+        check = _finalized_check(db, upload_id)
+        if check:
+            return check
+        raise HTTPException(status_code=409, detail="Upload parts missing")
+    try:
+        recorded = record_check(
+            db, upload.toilet_id, upload.staff_id, upload.device_uuid, payloads, upload.clinic_id, commit=False
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error finalizing upload {upload_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # Claim the session in the check's transaction: a concurrent finalize blocks on the
+    # row until this commits and then finds check_id set, so only one check is kept
+    claimed = db.execute(
+        update(UploadSession)
+        .where(UploadSession.id == upload_id, UploadSession.check_id.is_(None))
+        .values(check_id=recorded.check.id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        return _finalized_check(db, upload_id)
+    db.commit()
+    db.refresh(recorded.check)
+    note_write(upload.device_uuid)
+    uploads.remove_staging(upload_id)
+
+    response.headers["Server-Timing"] = f"ingest;dur={recorded.ingest_ms:.1f}"
+    response.headers["X-Image-Bytes-Saved"] = str(recorded.bytes_saved)
+    return recorded.check
@@ -0,0 +1,114 @@
+"""
+Maintenance commands.
+
+    python -m app.cli reclassify [--apply] [--clinic-id N] [--toilet-id N] [--too-short-sec S] [--too-long-sec S]
+    python -m app.cli partitions
+    python -m app.cli consistency [--apply] [--day YYYY-MM-DD]
+    python -m app.cli replay --start YYYY-MM-DD [--end YYYY-MM-DD] [--clinic-id N] [--toilet-id N] [--set morning_deadline=09:00 ...] [--detail]
+"""
+import argparse
+import json
+import logging
+from dataclasses import asdict
+from datetime import date
+
+from app.db.session import SessionLocal
+from app.models import DEFAULT_CLINIC_ID
+from app.services.consistency import scan
+from app.services.partitions import run_maintenance
+from app.services.reclassify import reclassify
+from app.services.replay import Schedule, replay
+
+
+def cmd_reclassify(args: argparse.Namespace) -> None:
+    db = SessionLocal()
+    try:
+        result = reclassify(
+            db,
+            dry_run=not args.apply,
+            toilet_id=args.toilet_id,
+            too_short_sec=args.too_short_sec,
+            too_long_sec=args.too_long_sec,
+            clinic_id=args.clinic_id,
+        )
+        db.commit()
+    finally:
+        db.close()
+    print(json.dumps(asdict(result), indent=2, ensure_ascii=False))
+
+
+def cmd_partitions(args: argparse.Namespace) -> None:
+    db = SessionLocal()
+    try:
+        result = run_maintenance(db)
+    finally:
+        db.close()
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+def cmd_consistency(args: argparse.Namespace) -> None:
+    db = SessionLocal()
+    try:
+        report = scan(db, day=args.day, dry_run=not args.apply)
+    finally:
+        db.close()
+    print(json.dumps(asdict(report), indent=2, ensure_ascii=False))
+
+
+def cmd_replay(args: argparse.Namespace) -> None:
+    overrides = dict(item.split("=", 1) for item in args.set)
+    schedule = Schedule.from_settings(args.clinic_id, **overrides)
+    db = SessionLocal()
+    try:
+        result = replay(
+            db, args.start, args.end or args.start,
+            toilet_id=args.toilet_id,
+            schedule=schedule,
+            include_empty_days=args.include_empty_days,
+            detail=args.detail,
+            clinic_id=args.clinic_id,
+        )
+        db.commit()
+    finally:
+        db.close()
+    print(json.dumps(asdict(result), indent=2, ensure_ascii=False))
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    p = subcommands.add_parser("reclassify", help="Recompute check intervals and status types")
+    p.add_argument("--apply", action="store_true", help="Write changes (default: dry run)")
+    p.add_argument("--clinic-id", type=int, help="Only this clinic (default: all clinics)")
+    p.add_argument("--toilet-id", type=int)
+    p.add_argument("--too-short-sec", type=int)
+    p.add_argument("--too-long-sec", type=int)
+    p.set_defaults(func=cmd_reclassify)
+
+    p = subcommands.add_parser("partitions", help="Archive checks of old months")
+    p.set_defaults(func=cmd_partitions)
+
+    p = subcommands.add_parser("consistency", help="Reconcile image files with image rows")
+    p.add_argument("--apply", action="store_true", help="Repair (default: report only)")
+    p.add_argument("--day", type=date.fromisoformat, help="Only this JST day (YYYY-MM-DD)")
+    p.set_defaults(func=cmd_consistency)
+
+    p = subcommands.add_parser("replay", help="Replay the check statuses of past days minute by minute")
+    p.add_argument("--start", type=date.fromisoformat, required=True, help="First JST day")
+    p.add_argument("--end", type=date.fromisoformat, help="Last JST day (default: start)")
+    p.add_argument("--clinic-id", type=int, default=DEFAULT_CLINIC_ID)
+    p.add_argument("--toilet-id", type=int)
+    p.add_argument("--set", action="append", default=[], metavar="FIELD=VALUE",
+                   help="Schedule override, e.g. morning_deadline=09:00 or regular_interval_minutes=45")
+    p.add_argument("--include-empty-days", action="store_true")
+    p.add_argument("--detail", action="store_true", help="Include the status transitions of each day")
+    p.set_defaults(func=cmd_replay)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
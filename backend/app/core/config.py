@@ -7,6 +7,8 @@ class Settings(BaseSettings):
     
     # Database
     DATABASE_URL: str
+    DATABASE_REPLICA_URL: Optional[str] = None  # read replica for dashboard / reporting GETs
+    READ_YOUR_WRITES_SECONDS: int = 10  # after a device's own write, its reads go to the primary
     
     # Security
     ADMIN_USERNAME: str = "admin"
@@ -16,7 +18,76 @@ class Settings(BaseSettings):
     
     # Storage
     IMAGE_STORAGE_PATH: str = "/var/data/toilet-images"
+
+    # Image ingest (normalization in a process pool)
+    IMAGE_MAX_DIMENSION: int = 1280  # long edge, px
+    IMAGE_OUTPUT_FORMAT: str = "jpeg"  # jpeg (progressive) or webp
+    IMAGE_QUALITY: int = 75
+    IMAGE_MAX_PIXELS: int = 40_000_000  # reject decompression bombs
+    IMAGE_INGEST_WORKERS: int = 2
+
+    # Daily contact sheets (one sprite of all thumbnails per JST day)
+    CONTACT_SHEET_TILE_SIZE: int = 160  # px, square tiles
+    CONTACT_SHEET_COLUMNS: int = 8
+    CONTACT_SHEET_THUMBNAILS_PER_CHECK: int = 2
+
+    # Snapshots of completed past days on the dashboard
+    DASHBOARD_SNAPSHOTS_ENABLED: bool = True
+    DASHBOARD_SNAPSHOT_DELAY_SECONDS: int = 600  # after the JST day ends (replica lag, late jobs)
+    DASHBOARD_SNAPSHOT_MAX_AGE_SECONDS: int = 86400  # Cache-Control max-age; clients revalidate with the ETag
+
+    # Resumable uploads
+    UPLOAD_STAGING_PATH: str = "/var/data/toilet-images/.uploads"  # persistent disk; hidden dirs are not served under /images
+    UPLOAD_MAX_PART_BYTES: int = 20 * 1024 * 1024
+    UPLOAD_MAX_PARTS: int = 10
+    UPLOAD_SESSION_TTL_MINUTES: int = 60
+    UPLOAD_GC_INTERVAL_SECONDS: int = 300
+
+    # Upload admission control (in-memory, per process)
+    RATE_LIMIT_ENABLED: bool = True
+    UPLOAD_RATE_PER_DEVICE_PER_MINUTE: float = 6  # new checks per device
+    UPLOAD_BURST_PER_DEVICE: int = 3
+    UPLOAD_RATE_PER_IP_PER_MINUTE: float = 30  # new checks per client IP
+    UPLOAD_BURST_PER_IP: int = 10
+    UPLOAD_MAX_CONCURRENT: int = 4  # uploads / chunks / finalizes processed at once
+
+    # Background tasks
+    RUN_SCHEDULER: bool = True
+    SCHEDULER_LEADER_ELECTION: bool = True  # with several processes, only one runs periodic tasks (Postgres)
+
+    # Job queue
+    RUN_EMBEDDED_WORKER: bool = False  # run job worker threads inside the API process
+    JOB_WORKER_THREADS: int = 4
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0
+    JOB_RETRY_BASE_SECONDS: int = 5
+    JOB_RETRY_MAX_SECONDS: int = 600
+    JOB_VISIBILITY_TIMEOUT_SECONDS: int = 300  # running jobs older than this are requeued
+    JOB_RETENTION_DAYS: int = 7
+
+    # On-demand request profiling (admin auth + X-Profile header or ?profile=1)
+    PROFILING_ENABLED: bool = True
+    PROFILE_OUTPUT_PATH: str = "/var/data/toilet-images/.profiles"  # persistent disk; hidden dirs are not served under /images
+    PROFILE_SAMPLE_INTERVAL_MS: float = 2.0
+    PROFILE_MAX_KEPT: int = 50
+
+    # Archival of cold history
+    ARCHIVE_AFTER_MONTHS: int = 13  # whole JST months older than this move to the archive tables
+    ARCHIVE_BATCH_SIZE: int = 5000  # checks moved per transaction
+    PARTITION_MAINTENANCE_INTERVAL_SECONDS: int = 6 * 3600
+
+    # Image / record consistency scan
+    CONSISTENCY_SCAN_WORKERS: int = 8  # os.scandir walkers
+    CONSISTENCY_GRACE_SECONDS: int = 3600  # younger files and blobs are never repaired
+    CONSISTENCY_SCAN_INTERVAL_SECONDS: int = 24 * 3600  # report-only scan of the previous day
+
+    # Near-duplicate detection (perceptual hash)
+    NEAR_DUPLICATE_MAX_DISTANCE: int = 6  # Hamming distance (0-64)
+    NEAR_DUPLICATE_WINDOW: int = 200  # recent images kept per toilet
     
+    # Check interval classification (seconds since the toilet's previous check)
+    CHECK_INTERVAL_TOO_SHORT_SEC: int = 2700  # < 45 min -> TOO_SHORT
+    CHECK_INTERVAL_TOO_LONG_SEC: int = 5400  # > 90 min -> TOO_LONG
+
     # Alert System Settings
     MORNING_CHECK_START: str = "08:00"
     MORNING_CHECK_DEADLINE: str = "08:50"
@@ -28,6 +99,12 @@ class Settings(BaseSettings):
     LUNCH_BREAK_START: str = "12:00"
     LUNCH_BREAK_END: str = "14:00"
 
+    # Realtime alerts (minutes since the toilet's last check)
+    REALTIME_WARNING_MINUTES: int = 75
+    REALTIME_ALERT_MINUTES: int = 90
+    ALERT_EVALUATION_INTERVAL_SECONDS: int = 60
+    ALERT_STATE_MAX_AGE_SECONDS: int = 180  # older states are recomputed on read
+
     class Config:
         case_sensitive = True
         env_file = ".env"
@@ -0,0 +1,160 @@
+"""
+Internal event bus.
+
+Events tell every API worker / job worker process that shared data changed,
+so in-process state (caches, indexes, read-your-writes map) stays consistent
+when the app runs as several processes.
+
+    events.publish(db, events.CHECK_CREATED, {"check_id": 1})   # inside the writer's transaction
+    db.commit()                                                  # delivered only if this commits
+
+    @events.subscribe(events.CHECK_CREATED)
+    def on_check_created(payload: dict) -> None: ...
+
+On Postgres, `publish` issues `pg_notify` in the caller's transaction (so
+events are delivered on commit and dropped on rollback) and every process
+runs a listener thread on its own LISTEN connection. On other databases
+(local SQLite) events are dispatched in-process after the commit.
+Handlers run on the listener thread and must be quick.
+
+A NOTIFY payload must stay under 8000 bytes: day lists go through
+`event_days` (None stands for "all days"), and `publish` drops list values
+from any payload that would still be too long.
+"""
+import json
+import logging
+import select
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from app.db.session import engine
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "kj_events"
+
+CHECK_CREATED = "check.created"  # {check_id, clinic_id, toilet_id, date, device_uuid, images: [[image_id, phash]]}
+CHECKS_CHANGED = "checks.changed"  # {reason, days?, clinic_id?} bulk updates: reclassify, archival, repair; days None = all
+CONFIG_CHANGED = "config.changed"  # {key, clinic_id}
+MASTER_DATA_CHANGED = "master_data.changed"  # {kind: staff|toilet|major_checkpoint|clinic, id?, clinic_id?}
+
+MAX_EVENT_DAYS = 100  # longer day lists are sent as None ("all days")
+NOTIFY_MAX_BYTES = 7900  # pg_notify rejects payloads of 8000 bytes or more
+
+_subscribers: Dict[str, List[Callable[[dict], None]]] = defaultdict(list)
+_PENDING_KEY = "pending_events"
+
+
+def uses_notify() -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+def subscribe(event_type: str):
+    """Register `func(payload)` to run in every process when `event_type` is published."""
+    def decorator(func: Callable[[dict], None]):
+        _subscribers[event_type].append(func)
+        return func
+    return decorator
+
+
+def dispatch(event_type: str, payload: dict) -> None:
+    for func in list(_subscribers.get(event_type, [])):
+        try:
+            func(payload)
+        except Exception:
+            logger.error(f"Event handler {func.__name__} failed for {event_type}", exc_info=True)
+
+
+def event_days(days: Iterable[str]) -> Optional[List[str]]:
+    """Day list for an event payload; None ("all days") when it is too long to send."""
+    days = sorted(days)
+    return days if len(days) <= MAX_EVENT_DAYS else None
+
+
+def publish(db: Session, event_type: str, payload: Optional[dict] = None) -> None:
+    """Publish an event as part of the session's current transaction."""
+    payload = payload or {}
+    if uses_notify():
+        message = json.dumps({"type": event_type, "payload": payload}, default=str)
+        if len(message.encode("utf-8")) >= NOTIFY_MAX_BYTES:
+            # Lists (days, images) are hints; without them subscribers fall back to "everything"
+            logger.warning(f"Event {event_type} payload too long ({len(message)} chars), dropping its lists")
+            payload = {k: (None if isinstance(v, list) else v) for k, v in payload.items()}
+            message = json.dumps({"type": event_type, "payload": payload}, default=str)
+        db.execute(text("SELECT pg_notify(:channel, :message)"), {"channel": CHANNEL, "message": message})
+    else:
+        db.info.setdefault(_PENDING_KEY, []).append((event_type, payload))
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_pending(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    for event_type, payload in pending or []:
+        dispatch(event_type, payload)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_pending(session: Session, previous_transaction) -> None:
+    # A rolled back savepoint (begin_nested) does not undo the outer transaction
+    if previous_transaction.nested:
+        return
+    session.info.pop(_PENDING_KEY, None)
+
+
+class Listener:
+    """LISTENs on the event channel and dispatches notifications (Postgres only)."""
+
+    def __init__(self, poll_seconds: float = 5.0):
+        self.poll_seconds = poll_seconds
+        self._backoff = 1.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _listen(self) -> None:
+        conn = engine.raw_connection()
+        try:
+            dbapi_conn = conn.dbapi_connection
+            dbapi_conn.autocommit = True
+            with dbapi_conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            logger.info(f"Listening for events on {CHANNEL}")
+            self._backoff = 1.0
+            while not self._stop.is_set():
+                ready, _, _ = select.select([dbapi_conn], [], [], self.poll_seconds)
+                if not ready:
+                    continue
+                dbapi_conn.poll()
+                while dbapi_conn.notifies:
+                    notify = dbapi_conn.notifies.pop(0)
+                    try:
+                        message = json.loads(notify.payload)
+                    except ValueError:
+                        logger.warning(f"Ignoring malformed event: {notify.payload[:200]}")
+                        continue
+                    dispatch(message["type"], message.get("payload") or {})
+        finally:
+            conn.invalidate()  # never hand a LISTEN connection back to the pool
+
+    def run_forever(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.error(f"Event listener disconnected, reconnecting in {self._backoff:.0f}s", exc_info=True)
+                # Events may have been missed while disconnected: drop caches in this process
+                dispatch(CHECKS_CHANGED, {"reason": "listener_reconnect"})
+                self._stop.wait(self._backoff)
+                self._backoff = min(self._backoff * 2, 60.0)
+
+    def start(self) -> None:
+        if not uses_notify():
+            return
+        self._thread = threading.Thread(target=self.run_forever, name="event-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
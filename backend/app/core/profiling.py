@@ -0,0 +1,380 @@
+"""
+On-demand profiling of a single request.
+
+An admin adds `X-Profile: 1` (or `?profile=1`) plus admin Basic auth to any
+API request. That one request is then profiled and the response carries
+`X-Profile-Id` and a `Link` to the result:
+
+- `{id}.collapsed`: collapsed stacks ("a;b;c 12") sampled from the threads
+  running the endpoint, for flamegraph.pl / speedscope / inferno.
+- `{id}.sql.json`: every SQL statement with its start offset and duration.
+- `{id}.pstats`: with `X-Profile: cprofile`, a deterministic cProfile of the
+  endpoint function instead of sampling (open with snakeviz / pstats).
+- `{id}.json`: request summary.
+
+Files are written to PROFILE_OUTPUT_PATH (a hidden directory on the image
+disk by default, so they survive restarts; the /images mount does not serve
+it) and listed at GET /api/admin/profiles. Requests without the flag
+only pay for one header lookup: the sampler thread and the SQL hooks exist
+only while a profiled request is in flight.
+"""
+import base64
+import contextvars
+import cProfile
+import functools
+import inspect
+import json
+import logging
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import List, Optional, Set
+from urllib.parse import parse_qsl
+
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.db.session import engine, replica_engine
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID = re.compile(r"^\d{8}T\d{6}-[0-9a-f]{8}$")
+MODES = {"1": "sample", "true": "sample", "sample": "sample", "cprofile": "cprofile"}
+
+_current: contextvars.ContextVar[Optional["Profile"]] = contextvars.ContextVar("profile", default=None)
+_active = 0
+_active_lock = threading.Lock()
+
+
+class Profile:
+    def __init__(self, method: str, path: str, query: str, mode: str):
+        now = datetime.now(timezone.utc)
+        self.id = f"{now:%Y%m%dT%H%M%S}-{secrets.token_hex(4)}"
+        self.created_at = now
+        self.method = method
+        self.path = path
+        self.query = query
+        self.mode = mode
+        self.started = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.status: Optional[int] = None
+        self.threads: Set[int] = set()
+        self.samples: Counter = Counter()
+        self.sql: List[dict] = []
+        self.cprofile: Optional[cProfile.Profile] = None
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    # --- Sampling ---
+
+    def start(self) -> None:
+        if self.mode == "sample":
+            self._sampler = threading.Thread(target=self._sample_loop, name=f"profile-{self.id}", daemon=True)
+            self._sampler.start()
+
+    def finish(self, status: Optional[int]) -> None:
+        self.duration_ms = self.elapsed_ms()
+        self.status = status
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join()
+
+    def _sample_loop(self) -> None:
+        interval = settings.PROFILE_SAMPLE_INTERVAL_MS / 1000
+        while not self._stop.wait(interval):
+            with self.lock:
+                threads = list(self.threads)
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            for thread_id in threads:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.samples[_collapse(frame)] += 1
+
+    # --- Output ---
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "created_at": self.created_at.isoformat(),
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "mode": self.mode,
+            "status": self.status,
+            "duration_ms": round(self.duration_ms or 0, 2),
+            "samples": sum(self.samples.values()),
+            "sample_interval_ms": settings.PROFILE_SAMPLE_INTERVAL_MS,
+            "sql_count": len(self.sql),
+            "sql_ms": round(sum(q["duration_ms"] for q in self.sql), 2),
+        }
+
+    def save(self) -> None:
+        os.makedirs(settings.PROFILE_OUTPUT_PATH, exist_ok=True)
+        base = os.path.join(settings.PROFILE_OUTPUT_PATH, self.id)
+        if self.samples:
+            with open(f"{base}.collapsed", "w", encoding="utf-8") as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(f"{base}.pstats")
+        with open(f"{base}.sql.json", "w", encoding="utf-8") as f:
+            json.dump(self.sql, f, indent=1, ensure_ascii=False)
+        with open(f"{base}.json", "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=1, ensure_ascii=False)
+        prune_profiles()
+
+
+def _collapse(frame) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename != __file__:
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    stack.reverse()
+    return ";".join(stack)
+
+
+# --- SQL timeline (hooks installed only while a profile is active) ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    if profile is not None and context is not None:
+        context._profile_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    started = getattr(context, "_profile_start", None)
+    if profile is None or started is None:
+        return
+    finished = time.perf_counter()
+    with profile.lock:
+        profile.sql.append({
+            "start_ms": round((started - profile.started) * 1000, 2),
+            "duration_ms": round((finished - started) * 1000, 2),
+            "rowcount": cursor.rowcount,
+            "executemany": executemany,
+            "database": "replica" if conn.engine is not engine else "primary",
+            "statement": statement,  # parameters are not recorded
+        })
+
+
+def _engines() -> list:
+    return [engine] if replica_engine is engine else [engine, replica_engine]
+
+
+def _hooks_acquire() -> None:
+    global _active
+    with _active_lock:
+        _active += 1
+        if _active == 1:
+            for e in _engines():
+                event.listen(e, "before_cursor_execute", _before_cursor_execute)
+                event.listen(e, "after_cursor_execute", _after_cursor_execute)
+
+
+def _hooks_release() -> None:
+    global _active
+    with _active_lock:
+        _active -= 1
+        if _active == 0:
+            for e in _engines():
+                event.remove(e, "before_cursor_execute", _before_cursor_execute)
+                event.remove(e, "after_cursor_execute", _after_cursor_execute)
+
+
+# --- Trigger ---
+
+def _requested_mode(scope) -> Optional[str]:
+    value = None
+    for name, header_value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            value = header_value.decode("latin-1")
+            break
+    if value is None and b"profile=" in scope.get("query_string", b""):
+        value = dict(parse_qsl(scope["query_string"].decode("latin-1"))).get("profile")
+    return MODES.get(value.strip().lower()) if value else None
+
+
+def _is_admin(scope) -> bool:
+    from app.api.deps import verify_admin
+
+    for name, value in scope["headers"]:
+        if name != b"authorization":
+            continue
+        scheme, _, encoded = value.decode("latin-1").partition(" ")
+        if scheme.lower() != "basic":
+            return False
+        try:
+            username, _, password = base64.b64decode(encoded).decode("utf-8").partition(":")
+        except ValueError:
+            return False
+        return verify_admin(username, password)
+    return False
+
+
+def _finish_profile(profile: Profile, status: Optional[int]) -> None:
+    profile.finish(status)
+    _hooks_release()
+    try:
+        profile.save()
+    except OSError:
+        logger.error(f"Profile {profile.id}: cannot write output", exc_info=True)
+    logger.info(f"Profiled {profile.method} {profile.path}: {profile.duration_ms:.0f} ms, "
+                f"{len(profile.sql)} queries -> {profile.id}")
+
+
+class ProfilingMiddleware:
+    """Profiles requests carrying the profile flag and valid admin credentials."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.PROFILING_ENABLED:
+            return await self.app(scope, receive, send)
+        mode = _requested_mode(scope)
+        if mode is None or not _is_admin(scope):
+            return await self.app(scope, receive, send)
+
+        query = "&".join(
+            f"{k}={v}" for k, v in parse_qsl(scope.get("query_string", b"").decode("latin-1")) if k != "profile"
+        )
+        profile = Profile(scope["method"], scope["path"], query, mode)
+        token = _current.set(profile)
+        _hooks_acquire()
+        profile.start()
+        finished = False
+
+        async def finish(status: Optional[int]) -> None:
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            # Joining the sampler and writing the files block: keep them off the event loop
+            await run_in_threadpool(_finish_profile, profile, status)
+
+        async def send_with_link(message):
+            if message["type"] == "http.response.start":
+                await finish(message["status"])
+                link = f"<{settings.API_V1_STR}/admin/profiles/{profile.id}>; rel=\"profile\""
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile.id.encode("latin-1")),
+                    (b"link", link.encode("latin-1")),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_link)
+        finally:
+            await finish(None)
+            _current.reset(token)
+
+
+def _profiled_call(func):
+    """Wrap an endpoint so the thread running it is sampled (or cProfiled) when profiling."""
+    def enter(profile: "Profile") -> int:
+        thread_id = threading.get_ident()
+        with profile.lock:
+            profile.threads.add(thread_id)
+        return thread_id
+
+    def leave(profile: "Profile", thread_id: int) -> None:
+        with profile.lock:
+            profile.threads.discard(thread_id)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            profile = _current.get()
+            if profile is None:
+                return await func(*args, **kwargs)
+            # Async endpoints share the event loop thread: results may include other requests
+            if profile.mode == "cprofile":
+                profile.cprofile = cProfile.Profile()
+                profile.cprofile.enable()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    profile.cprofile.disable()
+            thread_id = enter(profile)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                leave(profile, thread_id)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = _current.get()
+        if profile is None:
+            return func(*args, **kwargs)
+        if profile.mode == "cprofile":
+            profile.cprofile = cProfile.Profile()
+            return profile.cprofile.runcall(func, *args, **kwargs)
+        thread_id = enter(profile)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            leave(profile, thread_id)
+    return wrapper
+
+
+def instrument_routes(app: FastAPI) -> None:
+    """Hook every API endpoint function. Call after all routers are included."""
+    for route in app.routes:
+        if isinstance(route, APIRoute) and route.dependant.call is not None:
+            route.dependant.call = _profiled_call(route.dependant.call)
+
+
+# --- Stored profiles ---
+
+def profile_path(profile_id: str, suffix: str) -> Optional[str]:
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(settings.PROFILE_OUTPUT_PATH, f"{profile_id}{suffix}")
+    return path if os.path.exists(path) else None
+
+
+def list_profiles() -> List[dict]:
+    try:
+        names = sorted((n for n in os.listdir(settings.PROFILE_OUTPUT_PATH) if n.endswith(".json")
+                        and not n.endswith(".sql.json")), reverse=True)
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in names:
+        try:
+            with open(os.path.join(settings.PROFILE_OUTPUT_PATH, name), encoding="utf-8") as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def prune_profiles() -> None:
+    """Keep the newest PROFILE_MAX_KEPT profiles."""
+    ids = [p["id"] for p in list_profiles()]
+    for profile_id in ids[settings.PROFILE_MAX_KEPT:]:
+        for suffix in (".json", ".sql.json", ".collapsed", ".pstats"):
+            try:
+                os.remove(os.path.join(settings.PROFILE_OUTPUT_PATH, f"{profile_id}{suffix}"))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,224 @@
+"""
+In-memory admission control for the upload path.
+
+- Token buckets per device UUID and per client IP limit how often new checks
+  (one-shot uploads and resumable upload sessions) can be started.
+- A global ceiling bounds how many uploads are processed at once, so an
+  upload storm cannot take every threadpool worker from the dashboard reads.
+
+Upload requests with large bodies (the multipart check upload, chunk PATCHes
+and finalize) are admitted by `UploadAdmissionMiddleware`, keyed on the
+path, before the body is read or parsed: a rejected request costs no form
+parsing and no spooled temp files. The multipart upload is charged to the
+device named by the X-Device-UUID header; without it, the device bucket is
+charged from the form field after parsing.
+
+Rejected requests get 429 with Retry-After. State is per process: with
+WEB_CONCURRENCY > 1 the effective limits are multiplied by the worker count.
+"""
+import math
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from app.core.config import settings
+
+IDLE_BUCKET_SECONDS = 600
+MAX_BUCKETS = 10_000
+DEVICE_HEADER = "x-device-uuid"
+
+# Guarded upload routes: (method, path, starts a new check)
+GUARDED_ROUTES = [
+    ("POST", re.compile(rf"^{re.escape(settings.API_V1_STR)}/checks/?$"), True),
+    ("PATCH", re.compile(rf"^{re.escape(settings.API_V1_STR)}/uploads/[^/]+/parts/\d+$"), False),
+    ("POST", re.compile(rf"^{re.escape(settings.API_V1_STR)}/uploads/[^/]+/finalize$"), False),
+]
+
+
+@dataclass
+class TokenBucket:
+    tokens: float
+    updated: float
+
+
+class RateLimiter:
+    """Token bucket per key: `rate_per_minute` refill, up to `burst` tokens."""
+
+    def __init__(self, name: str, rate_per_minute: float, burst: int):
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> Optional[float]:
+        """Take a token. Returns None if allowed, else seconds until a token is available."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= MAX_BUCKETS:
+                    self._prune(now)
+                bucket = self._buckets[key] = TokenBucket(tokens=self.burst, updated=now)
+            else:
+                bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+                bucket.updated = now
+
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return None
+            return (1 - bucket.tokens) / self.rate if self.rate > 0 else 60.0
+
+    def _prune(self, now: float) -> None:
+        for key in [k for k, b in self._buckets.items() if now - b.updated > IDLE_BUCKET_SECONDS]:
+            del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class ConcurrencyLimit:
+    """Non-blocking ceiling on simultaneous operations."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+
+class AdmissionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.slots_granted = 0
+        self.rejected: Dict[str, int] = {"device": 0, "ip": 0, "concurrency": 0}
+
+    def record(self, rejected_by: Optional[str] = None) -> None:
+        with self._lock:
+            if rejected_by is None:
+                self.slots_granted += 1
+            else:
+                self.rejected[rejected_by] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": settings.RATE_LIMIT_ENABLED,
+                "slots_granted": self.slots_granted,
+                "rejected": dict(self.rejected),
+                "in_flight": upload_concurrency.in_flight,
+                "peak_in_flight": upload_concurrency.peak,
+                "max_concurrent": upload_concurrency.limit,
+                "tracked_devices": len(device_limiter),
+                "tracked_ips": len(ip_limiter),
+            }
+
+
+device_limiter = RateLimiter("device", settings.UPLOAD_RATE_PER_DEVICE_PER_MINUTE, settings.UPLOAD_BURST_PER_DEVICE)
+ip_limiter = RateLimiter("ip", settings.UPLOAD_RATE_PER_IP_PER_MINUTE, settings.UPLOAD_BURST_PER_IP)
+upload_concurrency = ConcurrencyLimit(settings.UPLOAD_MAX_CONCURRENT)
+admission_stats = AdmissionStats()
+
+
+def client_ip(request: Request) -> str:
+    # Behind Render's proxy the client address is the last X-Forwarded-For entry
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        return forwarded.split(",")[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _too_many(rejected_by: str, retry_after: float) -> HTTPException:
+    admission_stats.record(rejected_by)
+    return HTTPException(
+        status_code=429,
+        detail=f"Too many uploads ({rejected_by}), retry later",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+def _admit_ip(request: Request) -> None:
+    retry_after = ip_limiter.acquire(client_ip(request))
+    if retry_after is not None:
+        raise _too_many("ip", retry_after)
+
+
+def admit_device(request: Request, device_uuid: str) -> None:
+    """Charge the device bucket, unless the admission middleware already did for this device."""
+    if not settings.RATE_LIMIT_ENABLED or request.scope.get("state", {}).get("admitted_device") == device_uuid:
+        return
+    retry_after = device_limiter.acquire(device_uuid)
+    if retry_after is not None:
+        raise _too_many("device", retry_after)
+
+
+def admit_new_check(request: Request, device_uuid: str) -> None:
+    """Charge the IP and device buckets for starting a new check; raises 429 if empty."""
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    _admit_ip(request)
+    admit_device(request, device_uuid)
+
+
+def _guarded_route(scope) -> Optional[bool]:
+    """None if the request is not a guarded upload, else whether it starts a new check."""
+    for method, path, new_check in GUARDED_ROUTES:
+        if scope["method"] == method and path.match(scope["path"]):
+            return new_check
+    return None
+
+
+class UploadAdmissionMiddleware:
+    """Admits guarded upload requests (concurrency slot, IP / device buckets) before their body is read."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED:
+            return await self.app(scope, receive, send)
+        new_check = _guarded_route(scope)
+        if new_check is None:
+            return await self.app(scope, receive, send)
+
+        request = Request(scope)
+        if not upload_concurrency.try_acquire():
+            return await _reject(_too_many("concurrency", 1), scope, receive, send)
+        try:
+            if new_check:
+                _admit_ip(request)
+                device_uuid = request.headers.get(DEVICE_HEADER)
+                if device_uuid:
+                    admit_device(request, device_uuid)
+                    scope.setdefault("state", {})["admitted_device"] = device_uuid
+        except HTTPException as e:
+            upload_concurrency.release()
+            return await _reject(e, scope, receive, send)
+
+        admission_stats.record()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            upload_concurrency.release()
+
+
+async def _reject(e: HTTPException, scope, receive, send) -> None:
+    response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+    await response(scope, receive, send)
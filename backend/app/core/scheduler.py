@@ -0,0 +1,111 @@
+"""
+Minimal in-process periodic task runner.
+
+Tasks are plain sync callables registered with `every(seconds)`; they run
+in the threadpool on the API process's event loop so they never block
+request handling.
+
+When several API processes run, only the leader runs tasks: on Postgres the
+leader is the process holding a session-level advisory lock on a dedicated
+connection. If it dies, the lock is released and another process takes over
+on its next tick.
+"""
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.db.session import engine
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PeriodicTask:
+    name: str
+    interval: float
+    func: Callable[[], None]
+
+
+_tasks: List[PeriodicTask] = []
+_running: List[asyncio.Task] = []
+
+LEADER_LOCK_KEY = 0x4B4A5343  # "KJSC"
+_leader_conn: Optional[Connection] = None
+_leader_lock = threading.Lock()
+
+
+def every(seconds: float, name: str = None):
+    def decorator(func: Callable[[], None]) -> Callable[[], None]:
+        _tasks.append(PeriodicTask(name=name or func.__name__, interval=seconds, func=func))
+        return func
+    return decorator
+
+
+def is_leader() -> bool:
+    """Whether this process should run the periodic tasks."""
+    global _leader_conn
+    if not settings.SCHEDULER_LEADER_ELECTION or engine.dialect.name != "postgresql":
+        return True
+
+    with _leader_lock:
+        if _leader_conn is not None:
+            try:
+                _leader_conn.execute(text("SELECT 1"))
+                return True
+            except Exception:
+                logger.warning("Lost scheduler leader connection", exc_info=True)
+                _leader_conn.invalidate()
+                _leader_conn = None
+
+        conn = engine.connect()
+        try:
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": LEADER_LOCK_KEY}).scalar()
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return False
+        logger.info("This process is now the scheduler leader")
+        _leader_conn = conn
+        return True
+
+
+def _release_leadership() -> None:
+    global _leader_conn
+    with _leader_lock:
+        if _leader_conn is not None:
+            # Closing the connection for real releases the advisory lock
+            _leader_conn.invalidate()
+            _leader_conn = None
+
+
+async def _run(task: PeriodicTask) -> None:
+    while True:
+        await asyncio.sleep(task.interval)
+        try:
+            if await run_in_threadpool(is_leader):
+                await run_in_threadpool(task.func)
+        except Exception:
+            logger.error(f"Periodic task {task.name} failed", exc_info=True)
+
+
+def start() -> None:
+    for task in _tasks:
+        logger.info(f"Scheduling {task.name} every {task.interval}s")
+        _running.append(asyncio.create_task(_run(task)))
+
+
+def stop() -> None:
+    for running in _running:
+        running.cancel()
+    _running.clear()
+    _release_leadership()
@@ -0,0 +1,48 @@
+"""
+The public /images mount.
+
+Everything under IMAGE_STORAGE_PATH is served as is, except hidden
+directories (names starting with "."). Private files that have to live on
+the same persistent disk (partial resumable uploads, request profiles) go
+into one of those; the app refuses to start if a private path would be served.
+"""
+import os
+
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+from app.core.config import settings
+
+
+def _hidden(relative_path: str) -> bool:
+    return any(part.startswith(".") for part in relative_path.split(os.sep) if part not in ("", "."))
+
+
+class PublicFiles(StaticFiles):
+    """StaticFiles that never serves anything inside a hidden directory (or a hidden file)."""
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if _hidden(path):
+            raise HTTPException(status_code=404)
+        return await super().get_response(path, scope)
+
+
+def served_publicly(path: str) -> bool:
+    """Whether files under `path` would be reachable through the /images mount."""
+    root = os.path.realpath(settings.IMAGE_STORAGE_PATH)
+    target = os.path.realpath(path)
+    if os.path.commonpath([root, target]) != root:
+        return False
+    return not _hidden(os.path.relpath(target, root))
+
+
+def ensure_private(*setting_names: str) -> None:
+    """Refuse to start when one of the given path settings would be served by the mount."""
+    for name in setting_names:
+        if served_publicly(getattr(settings, name)):
+            raise RuntimeError(
+                f"{name}={getattr(settings, name)} would be served under /images: "
+                f"use a path outside IMAGE_STORAGE_PATH or a hidden directory (e.g. {settings.IMAGE_STORAGE_PATH}/.private)"
+            )
@@ -0,0 +1,202 @@
+"""
+Clinics (tenants) served by one deployment.
+
+Every master-data and check row carries a `clinic_id`. Requests select their
+clinic with the `X-Clinic` header (slug or id); requests without it use the
+default clinic, which owns all data from before multi-clinic support, so
+existing single-clinic frontends keep working unchanged.
+
+Clinics are few and rarely change, so they are cached per process and
+reloaded when a MASTER_DATA_CHANGED event of kind "clinic" arrives.
+
+Admin credentials:
+- each clinic can have its own admin account (password stored as PBKDF2)
+- ADMIN_USERNAME / ADMIN_PASSWORD from Settings remain the global admin,
+  valid for every clinic and the only account for deployment-wide
+  maintenance (clinics, jobs, consistency, profiles)
+
+Files written per clinic (image blobs, contact sheets) live under
+`clinics/{id}/` in IMAGE_STORAGE_PATH; the default clinic keeps the
+original top-level layout.
+"""
+import base64
+import hashlib
+import hmac
+import logging
+import re
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.core import events
+from app.db.session import SessionLocal
+from app.models import DEFAULT_CLINIC_ID, Clinic
+
+logger = logging.getLogger(__name__)
+
+CLINIC_HEADER = "X-Clinic"
+CLINICS_DIR = "clinics"
+SLUG = re.compile(r"^(?!\d+$)[a-z0-9][a-z0-9-]{0,49}$")  # all-digit values are ids
+PBKDF2_ITERATIONS = 200_000
+
+
+@dataclass(frozen=True)
+class Tenant:
+    id: int
+    slug: str
+    name: str
+    admin_username: Optional[str] = None
+    admin_password_hash: Optional[str] = None
+
+    @property
+    def storage_prefix(self) -> str:
+        return storage_prefix(self.id)
+
+
+def storage_prefix(clinic_id: int) -> str:
+    """Directory (relative to IMAGE_STORAGE_PATH) for the clinic's files."""
+    return "" if clinic_id == DEFAULT_CLINIC_ID else f"{CLINICS_DIR}/{clinic_id}"
+
+
+# --- Passwords ---
+
+def hash_password(password: str) -> str:
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, PBKDF2_ITERATIONS)
+    return "$".join([
+        "pbkdf2_sha256", str(PBKDF2_ITERATIONS),
+        base64.b64encode(salt).decode("ascii"), base64.b64encode(digest).decode("ascii"),
+    ])
+
+
+def verify_password(password: str, hashed: Optional[str]) -> bool:
+    if not hashed:
+        return False
+    try:
+        algorithm, iterations, salt, expected = hashed.split("$")
+        if algorithm != "pbkdf2_sha256":
+            return False
+        digest = hashlib.pbkdf2_hmac(
+            "sha256", password.encode("utf-8"), base64.b64decode(salt), int(iterations)
+        )
+    except ValueError:
+        return False
+    return secrets.compare_digest(digest, base64.b64decode(expected))
+
+
+# PBKDF2 is slow by design: a successful login is remembered for a short while so an
+# admin page's burst of requests does not pay for it each time. Only successes are
+# kept, keyed on the account (username + stored hash, so a password change drops it),
+# with an HMAC of the password under a per-process random key: nothing in the cache
+# allows testing password guesses outside this process.
+VERIFIED_TTL_SECONDS = 300
+VERIFIED_CACHE_SIZE = 256
+_verified_key = secrets.token_bytes(32)
+_verified_lock = threading.Lock()
+_verified: Dict[Tuple[str, str], Tuple[bytes, float]] = {}  # (username, stored hash) -> (password mac, expiry)
+
+
+def _password_mac(password: str) -> bytes:
+    return hmac.new(_verified_key, password.encode("utf-8"), hashlib.sha256).digest()
+
+
+def verify_clinic_admin(clinic: Tenant, username: str, password: str) -> bool:
+    if not clinic.admin_username or not clinic.admin_password_hash:
+        return False
+    if not secrets.compare_digest(username.encode("utf-8"), clinic.admin_username.encode("utf-8")):
+        return False
+    key = (username, clinic.admin_password_hash)
+    mac = _password_mac(password)
+    now = time.monotonic()
+    with _verified_lock:
+        cached = _verified.get(key)
+    if cached is not None and cached[1] > now and secrets.compare_digest(cached[0], mac):
+        return True
+    if not verify_password(password, clinic.admin_password_hash):
+        return False
+    with _verified_lock:
+        if len(_verified) >= VERIFIED_CACHE_SIZE:
+            _verified.clear()
+        _verified[key] = (mac, now + VERIFIED_TTL_SECONDS)
+    return True
+
+
+# --- Clinic cache ---
+
+_lock = threading.Lock()
+_by_id: Optional[Dict[int, Tenant]] = None
+_by_slug: Dict[str, Tenant] = {}
+
+
+def _tenant(clinic: Clinic) -> Tenant:
+    return Tenant(
+        id=clinic.id,
+        slug=clinic.slug,
+        name=clinic.name,
+        admin_username=clinic.admin_username,
+        admin_password_hash=clinic.admin_password_hash,
+    )
+
+
+def _load() -> Dict[int, Tenant]:
+    global _by_id, _by_slug
+    with _lock:
+        if _by_id is None:
+            db = SessionLocal()
+            try:
+                tenants = [_tenant(c) for c in db.query(Clinic).filter(Clinic.is_active == True).all()]
+            finally:
+                db.close()
+            _by_id = {t.id: t for t in tenants}
+            _by_slug = {t.slug: t for t in tenants}
+        return _by_id
+
+
+def resolve(ref: Optional[str]) -> Optional[Tenant]:
+    """Active clinic for an X-Clinic value (slug or id); the default clinic when empty."""
+    by_id = _load()
+    ref = (ref or "").strip()
+    if not ref:
+        return by_id.get(DEFAULT_CLINIC_ID)
+    if ref.isdigit():
+        return by_id.get(int(ref))
+    return _by_slug.get(ref)
+
+
+def active_clinic_ids() -> List[int]:
+    return sorted(_load())
+
+
+def invalidate() -> None:
+    global _by_id
+    with _lock:
+        _by_id = None
+
+
+@events.subscribe(events.MASTER_DATA_CHANGED)
+def _on_master_data_changed(payload: dict) -> None:
+    if payload.get("kind") == "clinic":
+        invalidate()
+
+
+def ensure_default_clinic(engine: Engine) -> None:
+    """Create the default clinic that pre-existing rows (clinic_id = 1) belong to."""
+    db = Session(bind=engine)
+    try:
+        if db.get(Clinic, DEFAULT_CLINIC_ID) is None:
+            logger.info("Creating default clinic")
+            db.add(Clinic(id=DEFAULT_CLINIC_ID, slug="default", name="Default clinic"))
+            db.commit()
+            if engine.dialect.name == "postgresql":
+                # id was set explicitly: move the sequence past it
+                db.execute(text("SELECT setval(pg_get_serial_sequence('clinics', 'id'), "
+                                "(SELECT MAX(id) FROM clinics))"))
+                db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,48 @@
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional, Tuple
+
+# JST timezone
+JST = timezone(timedelta(hours=9))
+
+
+def parse_time(time_str: str) -> time:
+    """Parse HH:MM string to time object"""
+    h, m = map(int, time_str.split(":"))
+    return time(h, m)
+
+
+def to_jst(dt: datetime) -> datetime:
+    """datetimeをJSTに変換"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(JST)
+
+
+def day_bounds_utc(target_date: date) -> Tuple[datetime, datetime]:
+    """JSTの1日 [00:00, 翌00:00) をUTCの範囲で返す"""
+    start = datetime.combine(target_date, time(0, 0)).replace(tzinfo=JST)
+    end = start + timedelta(days=1)
+    return start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+
+
+class Clock:
+    """
+    現在時刻の取得元。エンドポイントは依存性として受け取る。
+    at を指定するとその時刻で固定（過去の画面の再現・テスト用）
+    """
+
+    def __init__(self, at: Optional[datetime] = None):
+        if at is not None and at.tzinfo is None:
+            at = at.replace(tzinfo=JST)  # タイムゾーンなしはJSTとみなす
+        self.at = at.astimezone(timezone.utc) if at is not None else None
+
+    @property
+    def simulated(self) -> bool:
+        return self.at is not None
+
+    def now(self) -> datetime:
+        """現在時刻（UTC）"""
+        return self.at if self.at is not None else datetime.now(timezone.utc)
+
+    def now_jst(self) -> datetime:
+        return self.now().astimezone(JST)
@@ -0,0 +1,112 @@
+import logging
+from sqlalchemy import UniqueConstraint, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateTable
+from app.db.base import Base
+
+logger = logging.getLogger(__name__)
+
+
+def add_missing_columns(engine: Engine) -> None:
+    """
+    Add columns that exist on the models but not yet in the database.
+
+    `Base.metadata.create_all` only creates missing tables, so new nullable
+    columns on existing tables are added here with ALTER TABLE.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    logger.warning(f"Cannot add NOT NULL column {table.name}.{column.name} without a default")
+                    continue
+
+                col_type = column.type.compile(dialect=engine.dialect)
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                logger.info(f"Adding column: {ddl}")
+                conn.execute(text(ddl))
+
+
+def add_missing_indexes(engine: Engine) -> None:
+    """Create indexes declared on the models that existing tables don't have yet."""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            logger.info(f"Creating index {index.name} on {table.name}")
+            index.create(bind=engine)
+
+
+def _declared_unique_column_sets(table) -> set:
+    declared = {frozenset(c.name for c in constraint.columns)
+                for constraint in table.constraints if isinstance(constraint, UniqueConstraint)}
+    declared |= {frozenset(c.name for c in index.columns) for index in table.indexes if index.unique}
+    declared |= {frozenset([c.name]) for c in table.columns if c.unique or c.primary_key}
+    return declared
+
+
+def drop_stale_unique_constraints(engine: Engine) -> None:
+    """
+    Drop unique constraints / indexes the models no longer declare.
+
+    Used when uniqueness moves from a column to a wider key (e.g. icon_code
+    -> (clinic_id, icon_code)); the new key is created by add_missing_indexes.
+    SQLite cannot drop a constraint of its CREATE TABLE, so such tables are
+    rebuilt from the model (run add_missing_columns first).
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        declared = _declared_unique_column_sets(table)
+        stale = [(c["name"], "constraint") for c in inspector.get_unique_constraints(table.name)
+                 if frozenset(c["column_names"]) not in declared]
+        stale += [(i["name"], "index") for i in inspector.get_indexes(table.name)
+                  if i.get("unique") and not i.get("duplicates_constraint")
+                  and frozenset(i["column_names"]) not in declared]
+        if engine.dialect.name == "sqlite":
+            if any(kind == "constraint" for _, kind in stale):
+                _rebuild_sqlite_table(engine, table)
+                stale = [(name, kind) for name, kind in stale if kind == "index"]
+            stale = [(name, kind) for name, kind in stale if name is not None]
+        for name, kind in stale:
+            if name is None:
+                logger.warning(f"Cannot drop unnamed stale unique {kind} on {table.name}")
+                continue
+            ddl = f'ALTER TABLE {table.name} DROP CONSTRAINT "{name}"' if kind == "constraint" else f'DROP INDEX "{name}"'
+            logger.info(f"Dropping stale unique {kind}: {ddl}")
+            with engine.begin() as conn:
+                conn.execute(text(ddl))
+
+
+def _rebuild_sqlite_table(engine: Engine, table) -> None:
+    """Recreate a SQLite table with the model's DDL, keeping its rows (indexes come back via add_missing_indexes)."""
+    tmp = f"_rebuild_{table.name}"
+    ddl = str(CreateTable(table).compile(dialect=engine.dialect)).strip()
+    ddl = ddl.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {tmp} ", 1)
+    columns = ", ".join(c.name for c in table.columns)
+    logger.info(f"Rebuilding SQLite table {table.name} to drop stale unique constraints")
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {tmp}"))
+        conn.execute(text(ddl))
+        conn.execute(text(f"INSERT INTO {tmp} ({columns}) SELECT {columns} FROM {table.name}"))
+        conn.execute(text(f"DROP TABLE {table.name}"))
+        conn.execute(text(f"ALTER TABLE {tmp} RENAME TO {table.name}"))
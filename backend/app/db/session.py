@@ -1,3 +1,6 @@
+import threading
+import time
+from typing import Dict, Optional
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
@@ -5,9 +8,41 @@ from app.core.config import settings
 engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Read replica (falls back to the primary when not configured)
+replica_engine = (
+    create_engine(settings.DATABASE_REPLICA_URL, pool_pre_ping=True)
+    if settings.DATABASE_REPLICA_URL else engine
+)
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+# Read-your-writes: devices that wrote recently read from the primary
+# until the replica has had time to catch up. Per process, in memory.
+_recent_writes: Dict[str, float] = {}
+_recent_writes_lock = threading.Lock()
+
+def note_write(device_uuid: Optional[str]) -> None:
+    if not device_uuid or replica_engine is engine:
+        return
+    now = time.monotonic()
+    with _recent_writes_lock:
+        _recent_writes[device_uuid] = now
+        # Drop expired entries so the map stays small
+        if len(_recent_writes) > 1000:
+            cutoff = now - settings.READ_YOUR_WRITES_SECONDS
+            for key in [k for k, t in _recent_writes.items() if t < cutoff]:
+                del _recent_writes[key]
+
+def wrote_recently(device_uuid: Optional[str]) -> bool:
+    if not device_uuid:
+        return False
+    with _recent_writes_lock:
+        written_at = _recent_writes.get(device_uuid)
+    return written_at is not None and time.monotonic() - written_at < settings.READ_YOUR_WRITES_SECONDS
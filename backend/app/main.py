@@ -1,14 +1,24 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from app.core.config import settings
-from app.api import checks, dashboard, admin, master
+from app.api import checks, dashboard, admin, master, uploads
+from app.core import events, scheduler
+from app.core.profiling import ProfilingMiddleware, instrument_routes
+from app.core.ratelimit import UploadAdmissionMiddleware
+from app.core.static_files import PublicFiles, ensure_private
 from app.db.base import Base
 from app.db.session import engine
+from app.db.migrate import add_missing_columns, add_missing_indexes, drop_stale_unique_constraints
+from app.core.tenancy import ensure_default_clinic
+from app.services import image_ingest, jobs
 import os
 
 # Create tables
 Base.metadata.create_all(bind=engine)
+add_missing_columns(engine)
+drop_stale_unique_constraints(engine)
+add_missing_indexes(engine)
+ensure_default_clinic(engine)
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -23,23 +33,56 @@ origins = [
     "*" # Allow all for now for PWA/easy dev
 ]
 
+# Upload admission before the body is parsed (inside CORS, so 429s carry the CORS headers)
+app.add_middleware(UploadAdmissionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # The frontend is served from another origin: response headers it reads must be exposed
+    expose_headers=["Upload-Offset", "Retry-After", "X-Dashboard-Cursor", "X-Profile-Id", "Link", "Server-Timing"],
 )
 
-# Mount Static Files (Images)
+# Per-request profiling (only for admin requests that ask for it)
+app.add_middleware(ProfilingMiddleware)
+
+# Mount Static Files (Images); hidden directories (upload staging, profiles) are not served
+ensure_private("UPLOAD_STAGING_PATH", "PROFILE_OUTPUT_PATH")
 os.makedirs(settings.IMAGE_STORAGE_PATH, exist_ok=True)
-app.mount("/images", StaticFiles(directory=settings.IMAGE_STORAGE_PATH), name="images")
+app.mount("/images", PublicFiles(directory=settings.IMAGE_STORAGE_PATH), name="images")
 
 # Include Routers
 app.include_router(checks.router, prefix=f"{settings.API_V1_STR}/checks", tags=["checks"])
+app.include_router(uploads.router, prefix=f"{settings.API_V1_STR}/uploads", tags=["uploads"])
 app.include_router(dashboard.router, prefix=f"{settings.API_V1_STR}/dashboard", tags=["dashboard"])
 app.include_router(admin.router, prefix=f"{settings.API_V1_STR}/admin", tags=["admin"])
 app.include_router(master.router, prefix=f"{settings.API_V1_STR}", tags=["master"]) # /api/toilets, /api/staff
+instrument_routes(app)
+
+embedded_worker = None
+event_listener = events.Listener()
+
+@app.on_event("startup")
+def start_background_tasks():
+    global embedded_worker
+    jobs.load_handlers()
+    event_listener.start()
+    if settings.RUN_SCHEDULER:
+        scheduler.start()
+    if settings.RUN_EMBEDDED_WORKER:
+        embedded_worker = jobs.Worker()
+        embedded_worker.start()
+
+@app.on_event("shutdown")
+def stop_background_tasks():
+    scheduler.stop()
+    event_listener.stop()
+    if embedded_worker:
+        embedded_worker.stop()
+    image_ingest.shutdown_pool()
 
 @app.get("/")
 def root():
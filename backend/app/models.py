@@ -1,14 +1,33 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Time
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Date, DateTime, Time, JSON, Text, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.base import Base
 
+DEFAULT_CLINIC_ID = 1 # rows from before multi-clinic support belong here
+
+def clinic_column():
+    """Tenant column; existing rows are migrated into the default clinic."""
+    return Column(Integer, ForeignKey("clinics.id"), nullable=False, server_default=str(DEFAULT_CLINIC_ID))
+
+class Clinic(Base):
+    __tablename__ = "clinics"
+
+    id = Column(Integer, primary_key=True, index=True)
+    slug = Column(String(50), unique=True, nullable=False) # X-Clinic header value
+    name = Column(String(100), nullable=False)
+    admin_username = Column(String(100), nullable=True) # NULL = only the global admin can manage it
+    admin_password_hash = Column(String(200), nullable=True) # pbkdf2_sha256$iterations$salt$hash
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 class Staff(Base):
     __tablename__ = "staff"
 
     id = Column(Integer, primary_key=True, index=True)
+    clinic_id = clinic_column()
     internal_name = Column(String(100), nullable=False)
-    icon_code = Column(String(50), nullable=False, unique=True)
+    icon_code = Column(String(50), nullable=False)
     is_active = Column(Boolean, default=True)
     display_order = Column(Integer)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -16,10 +35,16 @@ class Staff(Base):
 
     checks = relationship("ToiletCheck", back_populates="staff")
 
+    __table_args__ = (
+        Index("ux_staff_clinic_icon_code", "clinic_id", "icon_code", unique=True),
+        Index("ix_staff_clinic_display_order", "clinic_id", "display_order"),
+    )
+
 class Toilet(Base):
     __tablename__ = "toilets"
 
     id = Column(Integer, primary_key=True, index=True)
+    clinic_id = clinic_column()
     name = Column(String(100), nullable=False)
     floor = Column(String(50))
     is_active = Column(Boolean, default=True)
@@ -30,6 +55,10 @@ class Toilet(Base):
     major_checkpoints = relationship("MajorCheckpoint", back_populates="target_toilet")
     # devices = relationship("Device", back_populates="assigned_toilet") # Not used yet
 
+    __table_args__ = (
+        Index("ix_toilets_clinic_id", "clinic_id", "id"),
+    )
+
 class Device(Base):
     __tablename__ = "devices"
 
@@ -46,10 +75,11 @@ class ToiletCheck(Base):
     __tablename__ = "toilet_checks"
 
     id = Column(Integer, primary_key=True, index=True)
+    clinic_id = clinic_column()
     toilet_id = Column(Integer, ForeignKey("toilets.id"), nullable=False)
     device_id = Column(Integer, ForeignKey("devices.id"), nullable=True)
     staff_id = Column(Integer, ForeignKey("staff.id"), nullable=False)
-    checked_at = Column(DateTime(timezone=True), nullable=False)
+    checked_at = Column(DateTime(timezone=True), nullable=False, index=True)
     interval_sec_from_prev = Column(Integer, nullable=True)
     status_type = Column(String(20), nullable=False) # NORMAL, TOO_SHORT, TOO_LONG
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -59,22 +89,90 @@ class ToiletCheck(Base):
     staff = relationship("Staff", back_populates="checks")
     images = relationship("CheckImage", back_populates="check", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_toilet_checks_toilet_checked_at", "toilet_id", "checked_at"),
+        Index("ix_toilet_checks_clinic_checked_at", "clinic_id", "checked_at"),
+    )
+
+class ImageBlob(Base):
+    __tablename__ = "image_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    clinic_id = clinic_column() # blobs are deduplicated within a clinic only
+    sha256 = Column(String(64), nullable=False)
+    path = Column(String(500), nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    phash = Column(String(16), nullable=True) # 64-bit dHash (hex)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    images = relationship("CheckImage", back_populates="blob")
+
+    __table_args__ = (
+        Index("ux_image_blobs_clinic_sha256", "clinic_id", "sha256", unique=True),
+    )
+
 class CheckImage(Base):
     __tablename__ = "check_images"
 
     id = Column(Integer, primary_key=True, index=True)
     check_id = Column(Integer, ForeignKey("toilet_checks.id"), nullable=False)
+    blob_id = Column(Integer, ForeignKey("image_blobs.id"), nullable=True)
     image_path = Column(String(500), nullable=False)
     image_type = Column(String(20), nullable=False) # sheet, overview, extra
     order_index = Column(Integer, nullable=False)
+    near_duplicate_of_id = Column(Integer, ForeignKey("check_images.id"), nullable=True)
+    near_duplicate_distance = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     check = relationship("ToiletCheck", back_populates="images")
+    blob = relationship("ImageBlob", back_populates="images")
+
+# Cold history moved out of toilet_checks / check_images (see services/partitions.py).
+# Same columns and ids as the live tables, so archived checks render like live ones.
+class ToiletCheckArchive(Base):
+    __tablename__ = "toilet_checks_archive"
+
+    id = Column(Integer, primary_key=True) # id from toilet_checks
+    clinic_id = clinic_column()
+    toilet_id = Column(Integer, ForeignKey("toilets.id"), nullable=False)
+    device_id = Column(Integer, ForeignKey("devices.id"), nullable=True)
+    staff_id = Column(Integer, ForeignKey("staff.id"), nullable=False)
+    checked_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    interval_sec_from_prev = Column(Integer, nullable=True)
+    status_type = Column(String(20), nullable=False)
+    created_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    toilet = relationship("Toilet")
+    staff = relationship("Staff")
+    images = relationship("CheckImageArchive", back_populates="check")
+
+    __table_args__ = (
+        Index("ix_toilet_checks_archive_clinic_checked_at", "clinic_id", "checked_at"),
+    )
+
+class CheckImageArchive(Base):
+    __tablename__ = "check_images_archive"
+
+    id = Column(Integer, primary_key=True) # id from check_images
+    check_id = Column(Integer, ForeignKey("toilet_checks_archive.id"), nullable=False, index=True)
+    blob_id = Column(Integer, ForeignKey("image_blobs.id"), nullable=True)
+    image_path = Column(String(500), nullable=False)
+    image_type = Column(String(20), nullable=False)
+    order_index = Column(Integer, nullable=False)
+    near_duplicate_of_id = Column(Integer, nullable=True)
+    near_duplicate_distance = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True))
+
+    check = relationship("ToiletCheckArchive", back_populates="images")
+    blob = relationship("ImageBlob")
 
 class MajorCheckpoint(Base):
     __tablename__ = "major_checkpoints"
 
     id = Column(Integer, primary_key=True, index=True)
+    clinic_id = clinic_column()
     name = Column(String(100), nullable=False)
     start_time = Column(Time, nullable=False)
     end_time = Column(Time, nullable=False)
@@ -86,10 +184,107 @@ class MajorCheckpoint(Base):
 
     target_toilet = relationship("Toilet", back_populates="major_checkpoints")
 
+    __table_args__ = (
+        Index("ix_major_checkpoints_clinic_display_order", "clinic_id", "display_order"),
+    )
+
 class ClinicConfig(Base):
     __tablename__ = "clinic_config"
 
     id = Column(Integer, primary_key=True, index=True)
-    key = Column(String(100), unique=True, nullable=False)
+    clinic_id = clinic_column()
+    key = Column(String(100), nullable=False)
     value = Column(String(500), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ux_clinic_config_clinic_key", "clinic_id", "key", unique=True),
+    )
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+
+    id = Column(String(32), primary_key=True) # uuid4 hex
+    clinic_id = clinic_column()
+    toilet_id = Column(Integer, ForeignKey("toilets.id"), nullable=False)
+    staff_id = Column(Integer, ForeignKey("staff.id"), nullable=False)
+    device_uuid = Column(String(255), nullable=False)
+    part_sizes = Column(JSON, nullable=False) # [bytes, ...] in image order
+    check_id = Column(Integer, ForeignKey("toilet_checks.id"), nullable=True) # set on finalize
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_type = Column(String(50), nullable=False)
+    payload = Column(JSON, nullable=False)
+    status = Column(String(20), nullable=False, default="queued") # queued, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_after = Column(DateTime(timezone=True), nullable=False)
+    locked_by = Column(String(100), nullable=True)
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
+class AlertState(Base):
+    __tablename__ = "alert_states"
+
+    id = Column(Integer, primary_key=True, index=True)
+    clinic_id = clinic_column()
+    alert_key = Column(String(50), nullable=False) # realtime:{toilet_id}, regular, morning, afternoon
+    kind = Column(String(20), nullable=False) # realtime, regular, morning, afternoon
+    toilet_id = Column(Integer, ForeignKey("toilets.id"), nullable=True) # NULL = clinic-wide
+    level = Column(String(20), nullable=False) # ok, pending, warning, alert
+    since = Column(DateTime(timezone=True), nullable=False) # when the current level was entered
+    minutes_elapsed = Column(Integer, nullable=True)
+    detail = Column(JSON, nullable=True) # serialized status shown on the dashboard
+    evaluated_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ux_alert_states_clinic_key", "clinic_id", "alert_key", unique=True),
+    )
+
+class AlertTransition(Base):
+    __tablename__ = "alert_transitions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    clinic_id = clinic_column()
+    alert_key = Column(String(50), nullable=False)
+    kind = Column(String(20), nullable=False)
+    toilet_id = Column(Integer, ForeignKey("toilets.id"), nullable=True)
+    from_level = Column(String(20), nullable=True)
+    level = Column(String(20), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    ended_at = Column(DateTime(timezone=True), nullable=True) # NULL = still in this level
+
+    __table_args__ = (
+        Index("ix_alert_transitions_started_at", "started_at"),
+        Index("ix_alert_transitions_key_started_at", "alert_key", "started_at"),
+        Index("ix_alert_transitions_clinic_started_at", "clinic_id", "started_at"),
+    )
+
+class DashboardSnapshot(Base):
+    __tablename__ = "dashboard_snapshots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    clinic_id = clinic_column()
+    day = Column(Date, nullable=False) # JST day
+    toilet_id = Column(Integer, nullable=False, default=0) # 0 = all toilets
+    definitions_digest = Column(String(12), nullable=False) # checkpoints / staff icons it was built with
+    etag = Column(String(32), nullable=False)
+    cursor = Column(String(64), nullable=False)
+    body = Column(Text, nullable=False) # serialized DashboardDayResponse
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("clinic_id", "day", "toilet_id", name="uq_dashboard_snapshots_clinic_day_toilet"),
+    )
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, ConfigDict
-from typing import Optional, List
+from typing import Any, Optional, List, Dict
 from datetime import datetime, time
 
 # --- Staff ---
@@ -51,6 +51,7 @@ class CheckImage(BaseModel):
     image_path: str
     image_type: str
     order_index: int
+    near_duplicate_of_id: Optional[int] = None
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -73,6 +74,30 @@ class CheckResponse(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+class NormalizedChecksResponse(BaseModel):
+    # GET /checks?shape=normalized: sparse check rows, staff / toilets as side tables
+    checks: List[Dict[str, Any]]
+    staff: Optional[List[Dict[str, Any]]] = None
+    toilets: Optional[List[Dict[str, Any]]] = None
+
+# --- Resumable Upload ---
+class UploadCreate(BaseModel):
+    toilet_id: int
+    staff_id: int
+    device_uuid: str
+    part_sizes: List[int]  # bytes per image, in order
+
+class UploadPart(BaseModel):
+    index: int
+    size: int
+    offset: int
+
+class UploadSessionResponse(BaseModel):
+    upload_id: str
+    parts: List[UploadPart]
+    expires_at: datetime
+    check_id: Optional[int] = None
+
 # --- Major Checkpoint ---
 class MajorCheckpointBase(BaseModel):
     name: str
@@ -114,6 +139,107 @@ class ClinicConfig(ClinicConfigBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+# --- Clinic (tenant) ---
+class ClinicBase(BaseModel):
+    slug: str
+    name: str
+    admin_username: Optional[str] = None
+    is_active: Optional[bool] = True
+
+class ClinicCreate(ClinicBase):
+    admin_password: Optional[str] = None
+
+class ClinicUpdate(BaseModel):
+    name: Optional[str] = None
+    admin_username: Optional[str] = None
+    admin_password: Optional[str] = None
+    is_active: Optional[bool] = None
+
+class Clinic(ClinicBase):
+    id: int
+    created_at: datetime
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+# --- Bulk master data ---
+class BulkStaff(BaseModel):
+    id: Optional[int] = None  # None: matched by icon_code, created when new
+    internal_name: Optional[str] = None
+    icon_code: Optional[str] = None
+    display_order: Optional[int] = None
+    is_active: Optional[bool] = None
+
+class BulkToilet(BaseModel):
+    id: Optional[int] = None  # None: matched by name
+    name: Optional[str] = None
+    floor: Optional[str] = None
+    is_active: Optional[bool] = None
+
+class BulkMajorCheckpoint(BaseModel):
+    id: Optional[int] = None  # None: matched by name
+    name: Optional[str] = None
+    start_time: Optional[time] = None
+    end_time: Optional[time] = None
+    target_toilet_id: Optional[int] = None
+    target_toilet_name: Optional[str] = None  # instead of target_toilet_id, e.g. a toilet of the same batch
+    is_active: Optional[bool] = None
+    display_order: Optional[int] = None
+
+class BulkOrder(BaseModel):
+    staff: Optional[List[int]] = None
+    major_checkpoints: Optional[List[int]] = None
+
+class BulkDeactivate(BaseModel):
+    staff: List[int] = []
+    toilets: List[int] = []
+    major_checkpoints: List[int] = []
+
+class BulkRequest(BaseModel):
+    staff: List[BulkStaff] = []
+    toilets: List[BulkToilet] = []
+    major_checkpoints: List[BulkMajorCheckpoint] = []
+    settings: List[ClinicConfigBase] = []
+    order: BulkOrder = BulkOrder()
+    deactivate: BulkDeactivate = BulkDeactivate()
+
+class BulkResponse(BaseModel):
+    created: Dict[str, int]
+    updated: Dict[str, int]
+    reordered: Dict[str, int]
+    deactivated: Dict[str, int]
+    applied: bool
+    elapsed_ms: float
+
+    model_config = ConfigDict(from_attributes=True)
+
+# --- Reclassification ---
+class ReclassifyResponse(BaseModel):
+    total: int
+    changed: int
+    interval_changed: int
+    transitions: Dict[str, int]  # "NORMAL->TOO_SHORT": count
+    samples: List[dict]
+    applied: bool
+    elapsed_ms: float
+    changed_days: List[str]  # YYYY-MM-DD (JST)
+
+    model_config = ConfigDict(from_attributes=True)
+
+class ConsistencyResponse(BaseModel):
+    scope: str  # "all" or YYYY-MM-DD (JST)
+    files_scanned: int
+    image_rows: int
+    blob_rows: int
+    counts: Dict[str, int]  # problem kind -> count
+    samples: Dict[str, List[Any]]
+    repaired: Dict[str, int]
+    applied: bool
+    elapsed_ms: float
+    affected_days: List[str]
+
+    model_config = ConfigDict(from_attributes=True)
+
 # --- Dashboard ---
 class MajorCheckpointStatus(BaseModel):
     name: str
@@ -124,6 +250,7 @@ class RealtimeAlert(BaseModel):
     toilet_name: str
     minutes_elapsed: int
     alert_level: str # warning, alert
+    since: Optional[datetime] = None # when this level was entered
 
 class TimelineItem(BaseModel):
     id: int
@@ -131,11 +258,31 @@ class TimelineItem(BaseModel):
     staff_icon: str
     status_type: str
     thumbnails: List[str]
+    suspected_duplicate: bool = False
 
 class DashboardDayResponse(BaseModel):
-    major_checkpoints: List[MajorCheckpointStatus]
-    realtime_alerts: List[RealtimeAlert]
+    # since= で差分取得した場合、変化のない項目は None、timeline は新しい分のみ
+    major_checkpoints: Optional[List[MajorCheckpointStatus]] = None
+    realtime_alerts: Optional[List[RealtimeAlert]] = None
     timeline: List[TimelineItem]
+    cursor: Optional[str] = None
+    is_delta: bool = False
+
+# --- Contact Sheet ---
+class ContactSheetTile(BaseModel):
+    image_id: int
+    check_id: int
+    x: int
+    y: int
+
+class ContactSheetResponse(BaseModel):
+    date: str  # YYYY-MM-DD (JST)
+    version: int
+    url: str  # sprite image, cacheable forever (versioned file name)
+    tile_size: int
+    width: int
+    height: int
+    tiles: List[ContactSheetTile]
 
 # --- Simple Status (New Alert System) ---
 class ScheduledCheckStatus(BaseModel):
@@ -143,6 +290,7 @@ class ScheduledCheckStatus(BaseModel):
     time: Optional[str] = None  # HH:MM
     deadline: str  # HH:MM
     time_range: str  # "08:00〜08:50"
+    since: Optional[datetime] = None  # この状態になった時刻
 
 class RegularCheckStatus(BaseModel):
     status: str  # ok, warning, alert
@@ -150,16 +298,31 @@ class RegularCheckStatus(BaseModel):
     next_check_in: int  # マイナス=超過
     threshold: int
     is_active: bool
+    since: Optional[datetime] = None  # この状態になった時刻
 
 class SimpleTimelineItem(BaseModel):
+    id: Optional[int] = None
     time: str  # HH:MM
     staff_icon: str
 
 class SimpleStatusResponse(BaseModel):
     date: str  # YYYY-MM-DD
     current_time: str  # HH:MM
-    morning_check: ScheduledCheckStatus
-    afternoon_check: ScheduledCheckStatus
-    regular_check: RegularCheckStatus
+    # since= で差分取得した場合、変化のない項目は None、timeline は新しい分のみ
+    morning_check: Optional[ScheduledCheckStatus] = None
+    afternoon_check: Optional[ScheduledCheckStatus] = None
+    regular_check: Optional[RegularCheckStatus] = None
     last_check_at: Optional[str] = None  # ISO format
     timeline: List[SimpleTimelineItem]
+    cursor: Optional[str] = None
+    is_delta: bool = False
+
+# --- Alert History ---
+class AlertHistoryItem(BaseModel):
+    kind: str  # realtime, regular, morning, afternoon
+    toilet_id: Optional[int] = None
+    toilet_name: Optional[str] = None
+    level: str  # warning, alert
+    started_at: datetime
+    ended_at: Optional[datetime] = None  # None = 継続中
+    duration_minutes: int
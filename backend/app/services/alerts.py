@@ -0,0 +1,264 @@
+"""
+アラート状態の事前計算（状態遷移の記録付き）
+
+スケジューラが1分ごとに各クリニックの各トイレ・各チェック種別の状態を評価し、
+現在の状態を alert_states に、状態が変わった時刻を alert_transitions に保存する。
+ダッシュボードは alert_states を読むだけで現在の状態と継続時間がわかる。
+alert_key はクリニック内で一意（realtime:{toilet_id}, morning, ...）。
+スケジューラとジョブが同じクリニックを同時に評価しないよう、評価はクリニックごとの
+ロック（Postgres ではアドバイザリロック）の中で行う。
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core import scheduler, tenancy
+from app.core.config import settings
+from app.core.timeutil import JST, to_jst
+from app.db.session import SessionLocal
+from app.models import DEFAULT_CLINIC_ID, AlertState, AlertTransition, Toilet, ToiletCheck
+from app.schemas import RegularCheckStatus, ScheduledCheckStatus
+from app.services import jobs
+from app.services.check_status import calculate_simple_statuses, fetch_day_checks
+
+logger = logging.getLogger(__name__)
+
+CLINIC_KINDS = ("morning", "afternoon", "regular")
+ALERTS_LOCK_NAMESPACE = 0x4B4A414C  # "KJAL", advisory lock per clinic
+_evaluate_lock = threading.Lock()  # SQLite: このプロセス内の評価を直列化
+
+
+class RealtimeLevel(NamedTuple):
+    toilet: Toilet
+    level: str  # ok, warning, alert
+    minutes_elapsed: int
+    entered_at: Optional[datetime]  # when this level started, if derivable
+
+
+def _aware(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is not None and dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def realtime_level(minutes_elapsed: int) -> str:
+    if minutes_elapsed >= settings.REALTIME_ALERT_MINUTES:
+        return "alert"
+    if minutes_elapsed >= settings.REALTIME_WARNING_MINUTES:
+        return "warning"
+    return "ok"
+
+
+def compute_realtime_levels(
+    db: Session, now_utc: datetime, toilet_id: Optional[int] = None, clinic_id: int = DEFAULT_CLINIC_ID
+) -> List[RealtimeLevel]:
+    """有効な各トイレの、最終チェックからの経過時間によるレベル"""
+    toilets_query = db.query(Toilet).filter(Toilet.clinic_id == clinic_id, Toilet.is_active == True)
+    if toilet_id:
+        toilets_query = toilets_query.filter(Toilet.id == toilet_id)
+    toilets = toilets_query.all()
+
+    last_checks = dict(
+        db.query(ToiletCheck.toilet_id, func.max(ToiletCheck.checked_at))
+        .filter(ToiletCheck.clinic_id == clinic_id, ToiletCheck.checked_at <= now_utc)
+        .group_by(ToiletCheck.toilet_id)
+        .all()
+    )
+
+    levels = []
+    for toilet in toilets:
+        last_at = _aware(last_checks.get(toilet.id))
+        if last_at is None:
+            # チェック履歴なし（新規導入直後）はアラートにしない
+            levels.append(RealtimeLevel(toilet, "ok", 0, None))
+            continue
+
+        elapsed = int((now_utc - last_at).total_seconds() / 60)
+        level = realtime_level(elapsed)
+        if level == "alert":
+            entered_at = last_at + timedelta(minutes=settings.REALTIME_ALERT_MINUTES)
+        elif level == "warning":
+            entered_at = last_at + timedelta(minutes=settings.REALTIME_WARNING_MINUTES)
+        else:
+            entered_at = last_at
+        levels.append(RealtimeLevel(toilet, level, elapsed, entered_at))
+    return levels
+
+
+def _advance(
+    db: Session,
+    clinic_id: int,
+    states: Dict[str, AlertState],
+    alert_key: str,
+    kind: str,
+    toilet_id: Optional[int],
+    level: str,
+    now_utc: datetime,
+    minutes_elapsed: Optional[int] = None,
+    detail: Optional[dict] = None,
+    entered_at: Optional[datetime] = None,
+) -> None:
+    """状態を1ステップ進め、レベルが変わったら遷移を記録する"""
+    state = states.get(alert_key)
+    entered_at = min(entered_at or now_utc, now_utc)
+
+    if state is None:
+        state = AlertState(
+            clinic_id=clinic_id, alert_key=alert_key, kind=kind, toilet_id=toilet_id, level=level, since=entered_at,
+            minutes_elapsed=minutes_elapsed, detail=detail, evaluated_at=now_utc,
+        )
+        try:
+            with db.begin_nested():
+                db.add(state)
+        except IntegrityError:
+            # 別プロセスが先に作成済み（ロックのない SQLite 複数プロセス）: その行から遷移させる
+            state = db.query(AlertState)\
+                .filter(AlertState.clinic_id == clinic_id, AlertState.alert_key == alert_key).one()
+        else:
+            db.add(AlertTransition(
+                clinic_id=clinic_id, alert_key=alert_key, kind=kind, toilet_id=toilet_id,
+                from_level=None, level=level, started_at=entered_at
+            ))
+        states[alert_key] = state
+    if state.level != level:
+        # 直前の状態が同じ時刻より後に始まっていることはない
+        entered_at = max(entered_at, _aware(state.since))
+        db.query(AlertTransition)\
+            .filter(
+                AlertTransition.clinic_id == clinic_id,
+                AlertTransition.alert_key == alert_key,
+                AlertTransition.ended_at.is_(None),
+            )\
+            .update({AlertTransition.ended_at: entered_at}, synchronize_session=False)
+        db.add(AlertTransition(
+            clinic_id=clinic_id, alert_key=alert_key, kind=kind, toilet_id=toilet_id,
+            from_level=state.level, level=level, started_at=entered_at
+        ))
+        logger.info(f"Alert {clinic_id}/{alert_key}: {state.level} -> {level}")
+        state.level = level
+        state.since = entered_at
+
+    state.minutes_elapsed = minutes_elapsed
+    state.detail = detail
+    state.evaluated_at = now_utc
+
+
+@contextmanager
+def _serialized(db: Session, clinic_id: int):
+    """同じクリニックの評価を重ねない（スケジューラと alerts.evaluate ジョブが同時に動くため）"""
+    if db.get_bind().dialect.name == "postgresql":
+        # トランザクション単位のロック: 評価後の commit で解放される
+        db.execute(text("SELECT pg_advisory_xact_lock(:namespace, :clinic_id)"),
+                   {"namespace": ALERTS_LOCK_NAMESPACE, "clinic_id": clinic_id})
+        yield
+    else:
+        with _evaluate_lock:
+            yield
+
+
+def evaluate_alerts(db: Session, now_utc: Optional[datetime] = None, clinic_id: Optional[int] = None) -> None:
+    """全トイレ・全チェック種別の状態を評価して保存（clinic_id 省略時は全クリニック）"""
+    now_utc = now_utc or datetime.now(timezone.utc)
+    clinic_ids = [clinic_id] if clinic_id is not None else tenancy.active_clinic_ids()
+    for cid in clinic_ids:
+        with _serialized(db, cid):
+            _evaluate_clinic(db, cid, now_utc)
+            db.commit()
+
+
+def _evaluate_clinic(db: Session, clinic_id: int, now_utc: datetime) -> None:
+    now_jst = now_utc.astimezone(JST)
+    states = {state.alert_key: state for state in db.query(AlertState).filter(AlertState.clinic_id == clinic_id)}
+
+    # リアルタイムアラート（トイレごと）
+    for item in compute_realtime_levels(db, now_utc, clinic_id=clinic_id):
+        _advance(
+            db, clinic_id, states, f"realtime:{item.toilet.id}", "realtime", item.toilet.id, item.level, now_utc,
+            minutes_elapsed=item.minutes_elapsed,
+            detail={"toilet_name": item.toilet.name},
+            entered_at=item.entered_at,
+        )
+
+    # 朝・午後・定期チェック（院内全体）
+    day_checks = fetch_day_checks(db, now_jst.date(), clinic_id)
+    for kind, status in zip(CLINIC_KINDS, calculate_simple_statuses(day_checks, now_jst, clinic_id)):
+        minutes = status.minutes_elapsed if isinstance(status, RegularCheckStatus) else None
+        _advance(
+            db, clinic_id, states, kind, kind, None, status.status, now_utc,
+            minutes_elapsed=minutes,
+            detail=status.model_dump(mode="json", exclude={"since"}),
+        )
+
+
+def _is_fresh(state: AlertState, now_utc: datetime, last_check_at: Optional[datetime]) -> bool:
+    evaluated_at = _aware(state.evaluated_at)
+    if now_utc - evaluated_at > timedelta(seconds=settings.ALERT_STATE_MAX_AGE_SECONDS):
+        return False
+    # 評価後に新しいチェックが入っていたら再計算が必要
+    if last_check_at is not None and evaluated_at < _aware(last_check_at):
+        return False
+    return True
+
+
+def read_clinic_statuses(
+    db: Session,
+    now_utc: datetime,
+    last_check: Optional[ToiletCheck],
+    clinic_id: int = DEFAULT_CLINIC_ID,
+) -> Optional[Tuple[ScheduledCheckStatus, ScheduledCheckStatus, RegularCheckStatus]]:
+    """評価済みの朝・午後・定期チェックの状態。古い・欠けている場合は None"""
+    rows = {s.kind: s for s in db.query(AlertState).filter(
+        AlertState.clinic_id == clinic_id, AlertState.alert_key.in_(CLINIC_KINDS)
+    ).all()}
+    last_check_at = last_check.checked_at if last_check else None
+    if len(rows) < len(CLINIC_KINDS) or not all(_is_fresh(s, now_utc, last_check_at) for s in rows.values()):
+        return None
+
+    # 日付が変わった直後の評価前の状態は使わない
+    if any(to_jst(s.evaluated_at).date() != now_utc.astimezone(JST).date() for s in rows.values()):
+        return None
+
+    return (
+        ScheduledCheckStatus(**rows["morning"].detail, since=rows["morning"].since),
+        ScheduledCheckStatus(**rows["afternoon"].detail, since=rows["afternoon"].since),
+        RegularCheckStatus(**rows["regular"].detail, since=rows["regular"].since),
+    )
+
+
+def read_realtime_states(
+    db: Session, now_utc: datetime, toilet_id: Optional[int] = None, clinic_id: int = DEFAULT_CLINIC_ID
+) -> Optional[List[AlertState]]:
+    """評価済みのトイレごとの状態。古い・欠けている場合は None"""
+    query = db.query(AlertState).filter(AlertState.clinic_id == clinic_id, AlertState.kind == "realtime")
+    if toilet_id:
+        query = query.filter(AlertState.toilet_id == toilet_id)
+    rows = query.all()
+
+    active_ids = {t_id for (t_id,) in db.query(Toilet.id).filter(Toilet.clinic_id == clinic_id, Toilet.is_active == True)}
+    if toilet_id:
+        active_ids &= {toilet_id}
+    last_check_at = db.query(func.max(ToiletCheck.checked_at)).filter(ToiletCheck.clinic_id == clinic_id).scalar()
+    if not active_ids <= {s.toilet_id for s in rows} or not all(_is_fresh(s, now_utc, last_check_at) for s in rows):
+        return None
+    return [s for s in rows if s.toilet_id in active_ids]
+
+
+@jobs.handler("alerts.evaluate", concurrency=1)
+def evaluate_alerts_job(db: Session, payload: dict) -> None:
+    """Job: 新しいチェックを反映するため即時に再評価（そのクリニックのみ）"""
+    evaluate_alerts(db, clinic_id=payload.get("clinic_id"))
+
+
+@scheduler.every(settings.ALERT_EVALUATION_INTERVAL_SECONDS)
+def evaluate_alerts_task() -> None:
+    db = SessionLocal()
+    try:
+        evaluate_alerts(db)
+    finally:
+        db.close()
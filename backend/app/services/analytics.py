@@ -0,0 +1,306 @@
+"""
+Staff and interval analytics over long date ranges.
+
+The check columns needed for the aggregates are pulled in bulk as NumPy
+arrays (no ORM objects), and every aggregate is computed vectorized with
+bincount / histogram / percentile. Results are cached per (clinic, date
+range, toilet). New checks and bulk changes (reclassification, archival,
+repair) arrive as events and drop only the clinic's entries whose range
+covers one of the event's days; master data changes drop the clinic's
+entries. A cache hit costs no query at all.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core import events
+from app.core.timeutil import day_bounds_utc
+from app.models import DEFAULT_CLINIC_ID, Staff, Toilet
+from app.services.partitions import check_models_for_range
+from app.services.reclassify import NO_INTERVAL, STATUS_CODES, epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+FETCH_BATCH = 100_000
+HISTOGRAM_BIN_MINUTES = 15
+HISTOGRAM_MAX_MINUTES = 180  # longer intervals go into the last (overflow) bin
+PERCENTILES = (10, 25, 50, 75, 90)
+CACHE_SIZE = 32
+JST_OFFSET_SEC = 9 * 3600
+
+
+@dataclass
+class CheckColumns:
+    staff_ids: np.ndarray  # int64
+    toilet_ids: np.ndarray  # int64
+    epochs: np.ndarray  # float64, unix seconds
+    intervals: np.ndarray  # int64, NO_INTERVAL for the first check of a toilet
+    status_codes: np.ndarray  # int8, index into STATUS_CODES
+
+    def __len__(self) -> int:
+        return len(self.epochs)
+
+
+def load_columns(
+    db: Session, start: date, end: date, toilet_id: Optional[int] = None, clinic_id: int = DEFAULT_CLINIC_ID
+) -> CheckColumns:
+    """Checks of the clinic on JST days start..end (inclusive) as column arrays."""
+    range_start, _ = day_bounds_utc(start)
+    _, range_end = day_bounds_utc(end)
+
+    staff, toilets, epochs, intervals, statuses = [], [], [], [], []
+    # Live table plus the archive when the range reaches into archived months
+    for model in check_models_for_range(db, range_start, range_end):
+        stmt = select(
+            model.staff_id,
+            model.toilet_id,
+            epoch_seconds(db, model.checked_at),
+            model.interval_sec_from_prev,
+            model.status_type,
+        ).where(model.clinic_id == clinic_id, model.checked_at >= range_start, model.checked_at < range_end)
+        if toilet_id:
+            stmt = stmt.where(model.toilet_id == toilet_id)
+
+        result = db.connection().execution_options(yield_per=FETCH_BATCH).execute(stmt)
+        for part in result.partitions():
+            c_staff, c_toilet, c_epoch, c_interval, c_status = zip(*part)
+            staff.extend(c_staff)
+            toilets.extend(c_toilet)
+            epochs.extend(c_epoch)
+            intervals.extend(c_interval)
+            statuses.extend(c_status)
+
+    status_index = {name: i for i, name in enumerate(STATUS_CODES)}
+    return CheckColumns(
+        staff_ids=np.asarray(staff, dtype=np.int64),
+        toilet_ids=np.asarray(toilets, dtype=np.int64),
+        epochs=np.asarray(epochs, dtype=np.float64),
+        intervals=np.asarray([NO_INTERVAL if v is None else v for v in intervals], dtype=np.int64),
+        status_codes=np.asarray([status_index.get(s, 0) for s in statuses], dtype=np.int8),
+    )
+
+
+def _rates(status_codes: np.ndarray) -> Dict[str, float]:
+    counts = np.bincount(status_codes, minlength=len(STATUS_CODES))
+    total = max(int(counts.sum()), 1)
+    return {
+        "too_short_rate": round(float(counts[1]) / total, 4),
+        "too_long_rate": round(float(counts[2]) / total, 4),
+    }
+
+
+def _interval_summary(intervals: np.ndarray) -> dict:
+    """Histogram (minutes) and percentiles of the intervals that have a previous check."""
+    minutes = intervals[intervals != NO_INTERVAL] / 60.0
+    edges = np.arange(0, HISTOGRAM_MAX_MINUTES + HISTOGRAM_BIN_MINUTES, HISTOGRAM_BIN_MINUTES)
+    counts, _ = np.histogram(np.minimum(minutes, HISTOGRAM_MAX_MINUTES), bins=np.append(edges, np.inf))
+    # The last bin collects everything at or above HISTOGRAM_MAX_MINUTES
+    histogram = [
+        {"from_minutes": int(lo), "to_minutes": int(hi) if np.isfinite(hi) else None, "count": int(c)}
+        for lo, hi, c in zip(edges, np.append(edges[1:], np.inf), counts)
+    ]
+    if len(minutes):
+        values = np.percentile(minutes, PERCENTILES)
+        percentiles = {f"p{p}": round(float(v), 1) for p, v in zip(PERCENTILES, values)}
+        mean = round(float(minutes.mean()), 1)
+    else:
+        percentiles = {f"p{p}": None for p in PERCENTILES}
+        mean = None
+    return {"count": int(len(minutes)), "mean_minutes": mean, "percentiles": percentiles, "histogram": histogram}
+
+
+def _per_staff(cols: CheckColumns, staff_names: Dict[int, Tuple[str, str]]) -> List[dict]:
+    staff_ids, inverse = np.unique(cols.staff_ids, return_inverse=True)
+    n = len(staff_ids)
+    counts = np.bincount(inverse, minlength=n)
+    by_status = np.zeros((n, len(STATUS_CODES)), dtype=np.int64)
+    np.add.at(by_status, (inverse, cols.status_codes), 1)
+
+    has_prev = cols.intervals != NO_INTERVAL
+    interval_sums = np.bincount(inverse[has_prev], weights=cols.intervals[has_prev], minlength=n)
+    interval_counts = np.bincount(inverse[has_prev], minlength=n)
+
+    rows = []
+    for i, staff_id in enumerate(staff_ids):
+        name, icon = staff_names.get(int(staff_id), (None, None))
+        total = int(counts[i])
+        rows.append({
+            "staff_id": int(staff_id),
+            "internal_name": name,
+            "icon_code": icon,
+            "checks": total,
+            "by_status": {code: int(by_status[i, j]) for j, code in enumerate(STATUS_CODES)},
+            "too_short_rate": round(float(by_status[i, 1]) / total, 4),
+            "too_long_rate": round(float(by_status[i, 2]) / total, 4),
+            "mean_interval_minutes": (
+                round(float(interval_sums[i]) / interval_counts[i] / 60, 1) if interval_counts[i] else None
+            ),
+        })
+    rows.sort(key=lambda r: r["checks"], reverse=True)
+    return rows
+
+
+def _time_of_day(cols: CheckColumns) -> dict:
+    local = cols.epochs + JST_OFFSET_SEC
+    hours = ((local // 3600) % 24).astype(np.int64)
+    # 1970-01-01 was a Thursday; shift so that Monday == 0
+    weekdays = (((local // 86400) + 3) % 7).astype(np.int64)
+    by_hour = np.bincount(hours, minlength=24)
+    by_hour_status = np.zeros((24, len(STATUS_CODES)), dtype=np.int64)
+    np.add.at(by_hour_status, (hours, cols.status_codes), 1)
+    heatmap = np.zeros((7, 24), dtype=np.int64)
+    np.add.at(heatmap, (weekdays, hours), 1)
+    return {
+        "by_hour": [
+            {
+                "hour": h,
+                "checks": int(by_hour[h]),
+                "too_short": int(by_hour_status[h, 1]),
+                "too_long": int(by_hour_status[h, 2]),
+            }
+            for h in range(24)
+        ],
+        "weekday_hour": heatmap.tolist(),  # [Mon..Sun][0..23]
+    }
+
+
+def _per_month(cols: CheckColumns) -> List[dict]:
+    months = (cols.epochs + JST_OFFSET_SEC).astype("datetime64[s]").astype("datetime64[M]")
+    labels, inverse = np.unique(months, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(labels))
+    by_status = np.zeros((len(labels), len(STATUS_CODES)), dtype=np.int64)
+    np.add.at(by_status, (inverse, cols.status_codes), 1)
+    return [
+        {
+            "month": str(label),
+            "checks": int(counts[i]),
+            "too_short_rate": round(float(by_status[i, 1]) / counts[i], 4),
+            "too_long_rate": round(float(by_status[i, 2]) / counts[i], 4),
+        }
+        for i, label in enumerate(labels)
+    ]
+
+
+def _per_toilet(cols: CheckColumns, toilet_names: Dict[int, str]) -> List[dict]:
+    toilet_ids, counts = np.unique(cols.toilet_ids, return_counts=True)
+    return [
+        {"toilet_id": int(t), "name": toilet_names.get(int(t)), "checks": int(c)}
+        for t, c in zip(toilet_ids, counts)
+    ]
+
+
+@dataclass
+class AnalyticsResult:
+    start: str
+    end: str
+    toilet_id: Optional[int]
+    total_checks: int
+    rates: Dict[str, float]
+    intervals: dict
+    staff: List[dict]
+    toilets: List[dict]
+    time_of_day: dict
+    months: List[dict]
+    elapsed_ms: float = 0.0
+    cached: bool = False
+
+
+def compute_analytics(
+    db: Session, start: date, end: date, toilet_id: Optional[int] = None, clinic_id: int = DEFAULT_CLINIC_ID
+) -> AnalyticsResult:
+    started = time.perf_counter()
+    cols = load_columns(db, start, end, toilet_id, clinic_id)
+    staff_names = {
+        s_id: (name, icon)
+        for s_id, name, icon in db.query(Staff.id, Staff.internal_name, Staff.icon_code).filter(Staff.clinic_id == clinic_id)
+    }
+    toilet_names = dict(db.query(Toilet.id, Toilet.name).filter(Toilet.clinic_id == clinic_id).all())
+
+    result = AnalyticsResult(
+        start=start.isoformat(),
+        end=end.isoformat(),
+        toilet_id=toilet_id,
+        total_checks=len(cols),
+        rates=_rates(cols.status_codes),
+        intervals=_interval_summary(cols.intervals),
+        staff=_per_staff(cols, staff_names),
+        toilets=_per_toilet(cols, toilet_names),
+        time_of_day=_time_of_day(cols),
+        months=_per_month(cols),
+    )
+    result.elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(f"Analytics {start}..{end}: {len(cols)} checks in {result.elapsed_ms:.0f} ms")
+    return result
+
+
+class AnalyticsCache:
+    """LRU of analytics results, dropped on check / master data events for the clinic."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.generation = 0  # bumped by every invalidation
+        self._entries: "OrderedDict[tuple, AnalyticsResult]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def invalidate(self, clinic_id: Optional[int] = None, days: Optional[Iterable[str]] = None) -> None:
+        """Drop the entries of the clinic (every clinic if None) whose range covers one of
+        the JST `days` (YYYY-MM-DD; every range if None)."""
+        covered = None if days is None else sorted(date.fromisoformat(d) for d in days)
+        with self._lock:
+            self.generation += 1
+            for key in list(self._entries):
+                entry_clinic, start, end, _ = key
+                if clinic_id is not None and entry_clinic != clinic_id:
+                    continue
+                if covered is not None and not any(start <= d <= end for d in covered):
+                    continue
+                del self._entries[key]
+
+    def get(
+        self, db: Session, start: date, end: date, toilet_id: Optional[int] = None, clinic_id: int = DEFAULT_CLINIC_ID
+    ) -> AnalyticsResult:
+        key = (clinic_id, start, end, toilet_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return AnalyticsResult(**{**asdict(entry), "cached": True})
+            generation = self.generation
+
+        result = compute_analytics(db, start, end, toilet_id, clinic_id)
+        with self._lock:
+            # An event during the computation may not be reflected in the result: do not keep it
+            if self.generation == generation:
+                self._entries[key] = result
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        return result
+
+
+analytics_cache = AnalyticsCache(size=CACHE_SIZE)
+
+
+@events.subscribe(events.CHECK_CREATED)
+def _on_check_created(payload: dict) -> None:
+    day = payload.get("date")
+    analytics_cache.invalidate(payload.get("clinic_id"), [day] if day else None)
+
+
+@events.subscribe(events.CHECKS_CHANGED)
+def _on_checks_changed(payload: dict) -> None:
+    analytics_cache.invalidate(payload.get("clinic_id"), payload.get("days"))
+
+
+@events.subscribe(events.MASTER_DATA_CHANGED)
+def _on_master_data_changed(payload: dict) -> None:
+    # Staff / toilet names are part of every result
+    analytics_cache.invalidate(payload.get("clinic_id"))
@@ -0,0 +1,198 @@
+"""
+Sparse check listings: only the requested columns, optionally normalized.
+
+The default GET /checks response embeds the full Staff and Toilet of every
+check and each image with its server path, so the same master data is
+repeated on every row. A listing request can instead name what it needs:
+
+    fields=id,checked_at,staff.icon_code,images.url
+    include=staff,toilet,images        (default sub-fields when not named in fields)
+    shape=normalized                   (side tables instead of embedded objects)
+
+Only the requested columns are selected (Core selects, no ORM objects), and
+staff / toilets / images are loaded with one IN query each for the whole
+listing. With shape=normalized the checks carry staff_id / toilet_id and the
+referenced staff and toilets are returned once each:
+
+    {"checks": [{"id": 1, "staff_id": 3, ...}], "staff": [{"id": 3, ...}], "toilets": [...]}
+"""
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import CheckImage, CheckImageArchive, Staff, Toilet, ToiletCheck, ToiletCheckArchive
+from app.services.partitions import check_models_for_range
+
+CHECK_FIELDS = ("id", "toilet_id", "staff_id", "checked_at", "interval_sec_from_prev", "status_type")
+RELATED_FIELDS = {
+    "staff": ("id", "internal_name", "icon_code", "display_order", "is_active"),
+    "toilet": ("id", "name", "floor", "is_active"),
+    "images": ("id", "image_type", "order_index", "url", "near_duplicate_of_id"),
+}
+DEFAULT_FIELDS = {
+    "check": CHECK_FIELDS,
+    "staff": ("id", "internal_name", "icon_code"),
+    "toilet": ("id", "name"),
+    "images": ("id", "image_type", "order_index", "url"),
+}
+SHAPES = ("nested", "normalized")
+FOREIGN_KEYS = {"staff": "staff_id", "toilet": "toilet_id"}
+IMAGE_MODELS = {ToiletCheck: CheckImage, ToiletCheckArchive: CheckImageArchive}
+
+
+@dataclass
+class Fieldset:
+    check: List[str]
+    related: Dict[str, List[str]] = field(default_factory=dict)  # staff / toilet / images -> fields
+    shape: str = "nested"
+
+
+def parse_fieldset(fields: Optional[str], include: Optional[str], shape: str = "nested") -> Fieldset:
+    """Parse fields= / include= / shape=; ValueError on unknown names."""
+    if shape not in SHAPES:
+        raise ValueError(f"shape must be one of: {', '.join(SHAPES)}")
+    check: List[str] = []
+    related: Dict[str, List[str]] = {}
+    for name in (include or "").split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in RELATED_FIELDS:
+            raise ValueError(f"Unknown include: {name}")
+        related.setdefault(name, [])
+    for name in (fields or "").split(","):
+        name = name.strip()
+        if not name:
+            continue
+        relation, _, sub = name.rpartition(".")
+        if not relation:
+            if name not in CHECK_FIELDS:
+                raise ValueError(f"Unknown field: {name}")
+            if name not in check:
+                check.append(name)
+            continue
+        if relation not in RELATED_FIELDS or sub not in RELATED_FIELDS[relation]:
+            raise ValueError(f"Unknown field: {name}")
+        if sub not in related.setdefault(relation, []):
+            related[relation].append(sub)
+
+    for relation, names in related.items():
+        if not names:
+            names.extend(DEFAULT_FIELDS[relation])
+        if relation != "images" and "id" not in names:
+            names.insert(0, "id")
+    if not check:
+        # Only related fields named: the rows carry just their keys
+        check = ["id"] if (fields or "").strip() else list(DEFAULT_FIELDS["check"])
+    # Rows need their id to attach images, and the foreign keys of included relations
+    required = ["id"] if "images" in related else []
+    required += [FOREIGN_KEYS[r] for r in ("staff", "toilet") if r in related]
+    for name in required:
+        if name not in check:
+            check.append(name)
+    return Fieldset(check=check, related=related, shape=shape)
+
+
+def _aware(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def image_url(path: str) -> str:
+    """Public /images URL of a stored image path."""
+    rel = os.path.relpath(path, settings.IMAGE_STORAGE_PATH).replace("\\", "/")
+    return f"/images/{rel}"
+
+
+def _load_checks(db: Session, start_utc: datetime, end_utc: datetime, names: List[str],
+                 toilet_id: Optional[int], clinic_id: Optional[int]) -> List[tuple]:
+    """(model, row dict) for every check in range, oldest first."""
+    keyed = []
+    for model in check_models_for_range(db, start_utc, end_utc):
+        # checked_at / id come last, as the sort key (the archive and live table can overlap in time)
+        stmt = select(*[getattr(model, n) for n in names], model.checked_at, model.id)\
+            .where(model.checked_at >= start_utc, model.checked_at < end_utc)\
+            .order_by(model.checked_at, model.id)
+        if clinic_id is not None:
+            stmt = stmt.where(model.clinic_id == clinic_id)
+        if toilet_id:
+            stmt = stmt.where(model.toilet_id == toilet_id)
+        keyed.extend(
+            (_aware(row[-2]), row[-1], model, {n: _json_value(v) for n, v in zip(names, row)})
+            for row in db.execute(stmt)
+        )
+    keyed.sort(key=lambda item: item[:2])
+    return [(model, row) for _, _, model, row in keyed]
+
+
+def _load_images(db: Session, rows: List[tuple], names: List[str]) -> Dict[int, List[dict]]:
+    by_check: Dict[int, List[dict]] = {}
+    columns = [n for n in names if n != "url"]
+    for model, image_model in IMAGE_MODELS.items():
+        ids = [row["id"] for m, row in rows if m is model]
+        if not ids:
+            continue
+        selected = [getattr(image_model, n) for n in columns] + [image_model.check_id, image_model.image_path]
+        stmt = select(*selected).where(image_model.check_id.in_(ids)).order_by(image_model.check_id, image_model.order_index)
+        for row in db.execute(stmt):
+            image = dict(zip(columns, row))
+            if "url" in names:
+                image["url"] = image_url(row[-1])
+            by_check.setdefault(row[-2], []).append({n: image[n] for n in names})
+    return by_check
+
+
+def _load_related(db: Session, model, names: List[str], ids: set) -> Dict[int, dict]:
+    if not ids:
+        return {}
+    stmt = select(*[getattr(model, n) for n in names]).where(model.id.in_(ids)).order_by(model.id)
+    return {row[0]: dict(zip(names, row)) for row in db.execute(stmt)}
+
+
+def list_checks(
+    db: Session,
+    start_utc: datetime,
+    end_utc: datetime,
+    fieldset: Fieldset,
+    toilet_id: Optional[int] = None,
+    clinic_id: Optional[int] = None,
+    newest_first: bool = False,
+):
+    """Checks in [start_utc, end_utc) with only the fieldset's columns; a list, or a dict when normalized."""
+    rows = _load_checks(db, start_utc, end_utc, fieldset.check, toilet_id, clinic_id)
+    if newest_first:
+        rows.reverse()
+
+    related = fieldset.related
+    images = _load_images(db, rows, related["images"]) if "images" in related else {}
+    tables = {
+        relation: _load_related(db, model, related[relation], {row[FOREIGN_KEYS[relation]] for _, row in rows})
+        for relation, model in (("staff", Staff), ("toilet", Toilet))
+        if relation in related
+    }
+
+    checks = []
+    for _, row in rows:
+        if "images" in related:
+            row["images"] = images.get(row["id"], [])
+        if fieldset.shape == "nested":
+            for relation, table in tables.items():
+                row[relation] = table.get(row[FOREIGN_KEYS[relation]])
+        checks.append(row)
+
+    if fieldset.shape == "nested":
+        return checks
+    result = {"checks": checks}
+    if "staff" in tables:
+        result["staff"] = list(tables["staff"].values())
+    if "toilet" in tables:
+        result["toilets"] = list(tables["toilet"].values())
+    return result
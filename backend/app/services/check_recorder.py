@@ -0,0 +1,161 @@
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List
+
+from fastapi import HTTPException
+from sqlalchemy import desc
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core import events
+from app.core.timeutil import to_jst
+from app.models import DEFAULT_CLINIC_ID, ToiletCheck, CheckImage, Toilet, Staff, Device
+from app.services import image_store, jobs
+from app.services.image_ingest import InvalidImageError, normalize_images
+from app.services.reclassify import classify_interval
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RecordedCheck:
+    check: ToiletCheck
+    ingest_ms: float
+    bytes_saved: int
+
+
+def record_check(
+    db: Session,
+    toilet_id: int,
+    staff_id: int,
+    device_uuid: str,
+    payloads: List[bytes],
+    clinic_id: int = DEFAULT_CLINIC_ID,
+    commit: bool = True,
+) -> RecordedCheck:
+    """
+    Validate, normalize and store the images of one check and create the
+    ToiletCheck / CheckImage rows. Shared by the one-shot multipart upload
+    and the resumable upload finalize step. With commit=False the rows are
+    only flushed, so the caller can commit them together with its own.
+    """
+    # 1. Validation
+    if len(payloads) < 2:
+        raise HTTPException(status_code=400, detail="At least 2 images are required")
+
+    # Verify toilet and staff exist (in this clinic)
+    toilet = db.query(Toilet).filter(Toilet.id == toilet_id, Toilet.clinic_id == clinic_id).first()
+    if not toilet:
+        raise HTTPException(status_code=404, detail="Toilet not found")
+    
+    staff = db.query(Staff).filter(Staff.id == staff_id, Staff.clinic_id == clinic_id).first()
+    if not staff:
+        raise HTTPException(status_code=404, detail="Staff not found")
+
+    # Normalize images (decode, validate, resize, strip EXIF, re-encode)
+    ingest_started = time.perf_counter()
+    try:
+        normalized = normalize_images(payloads)
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    ingest_ms = (time.perf_counter() - ingest_started) * 1000
+    bytes_saved = sum(n.bytes_saved for n in normalized)
+
+    # Handle Device (Create if not exists)
+    device = db.query(Device).filter(Device.device_uuid == device_uuid).first()
+    if not device:
+        device = Device(device_uuid=device_uuid, name="Unknown Device")
+        try:
+            with db.begin_nested():
+                db.add(device)
+        except IntegrityError:
+            # Same device registered concurrently (e.g. a retried finalize)
+            device = db.query(Device).filter(Device.device_uuid == device_uuid).one()
+
+    # 2. Status Calculation
+    # Get previous check for this toilet
+    prev_check = db.query(ToiletCheck)\
+        .filter(ToiletCheck.toilet_id == toilet_id)\
+        .order_by(desc(ToiletCheck.checked_at))\
+        .first()
+
+    current_time = datetime.now(timezone.utc)
+    interval_sec = None
+
+    if prev_check:
+        # Ensure prev_check.checked_at is aware
+        prev_at = prev_check.checked_at
+        if prev_at.tzinfo is None:
+            prev_at = prev_at.replace(tzinfo=timezone.utc)
+        
+        delta = current_time - prev_at
+        interval_sec = int(delta.total_seconds())
+
+    # First check ever -> NORMAL
+    status_type = classify_interval(interval_sec)
+
+    # 3. Save Images
+    # Files are written before any row is committed, so a committed check
+    # always has its images on disk.
+    # Content-addressed: /var/data/toilet-images/blobs/ab/cd/{sha256}.jpg (per clinic)
+    blobs = [
+        image_store.store_blob(db, img.data, phash=img.phash, ext=img.ext, clinic_id=clinic_id)
+        for img in normalized
+    ]
+
+    # 4. Create Check Record + Images in one transaction
+    new_check = ToiletCheck(
+        clinic_id=clinic_id,
+        toilet_id=toilet_id,
+        device_id=device.id,
+        staff_id=staff_id,
+        checked_at=current_time,
+        interval_sec_from_prev=interval_sec,
+        status_type=status_type
+    )
+    db.add(new_check)
+    db.flush()
+
+    images = []
+    for idx, blob in enumerate(blobs):
+        # Determine image type
+        if idx == 0:
+            img_type = "sheet"
+        elif idx == 1:
+            img_type = "overview"
+        else:
+            img_type = "extra"
+
+        db_image = CheckImage(
+            check_id=new_check.id,
+            image_type=img_type,
+            order_index=idx
+        )
+        image_store.attach_blob(db, db_image, blob)
+        db.add(db_image)
+        images.append(db_image)
+    db.flush()
+
+    # 5. Post-commit work is handed to the job queue
+    jobs.enqueue(db, "images.near_duplicates", {"check_id": new_check.id})
+    jobs.enqueue(db, "alerts.evaluate", {"check_id": new_check.id, "clinic_id": clinic_id})
+    jobs.enqueue(db, "images.contact_sheet", {"date": to_jst(current_time).date().isoformat(), "clinic_id": clinic_id})
+    events.publish(db, events.CHECK_CREATED, {
+        "check_id": new_check.id,
+        "clinic_id": clinic_id,
+        "toilet_id": toilet_id,
+        "date": to_jst(current_time).date().isoformat(),
+        "device_uuid": device_uuid,
+        # [image_id, phash]: lets every process add the images to its near-duplicate index
+        "images": [[image.id, blob.phash] for image, blob in zip(images, blobs) if blob.phash],
+    })
+
+    if commit:
+        db.commit()
+        db.refresh(new_check)
+    else:
+        db.flush()
+
+    return RecordedCheck(check=new_check, ingest_ms=ingest_ms, bytes_saved=bytes_saved)
@@ -0,0 +1,213 @@
+"""
+チェック状態の判定ロジック（朝・午後チェック、定期チェック）
+ダッシュボードとアラート評価で共通利用する
+"""
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.timeutil import JST, day_bounds_utc, parse_time, to_jst
+from app.models import DEFAULT_CLINIC_ID, ToiletCheck
+from app.schemas import ScheduledCheckStatus, RegularCheckStatus
+from app.services import clinic_settings
+from app.services.partitions import fetch_checks
+
+
+def calculate_scheduled_check_status(
+    checks: List[ToiletCheck],
+    start_time: time,
+    deadline: time,
+    now_jst: datetime
+) -> ScheduledCheckStatus:
+    """
+    朝チェック・午後チェックの状態を計算
+    - 開始時刻から警告（黄色）
+    - 期限を過ぎたらアラート（赤）
+    - チェック完了したら時刻表示（OK/緑）
+    """
+    time_range = f"{start_time.strftime('%H:%M')}〜{deadline.strftime('%H:%M')}"
+    
+    # この時間帯以降のチェックを探す（開始時刻以降なら期限超過でもOK）
+    matched_check = None
+    for check in checks:
+        check_jst = to_jst(check.checked_at)
+        check_time = check_jst.time()
+        if check_time >= start_time:
+            matched_check = check
+            break
+    
+    if matched_check:
+        # チェック完了 → OK（緑）+ 時刻表示
+        check_jst = to_jst(matched_check.checked_at)
+        check_time_str = check_jst.strftime("%H:%M")
+        
+        return ScheduledCheckStatus(
+            status="ok",
+            time=check_time_str,
+            deadline=deadline.strftime("%H:%M"),
+            time_range=time_range
+        )
+    else:
+        # 未実施
+        now_time = now_jst.time()
+        if now_time < start_time:
+            # 開始時刻前 → 待機中（グレー）
+            status = "pending"
+        elif now_time <= deadline:
+            # 開始〜期限内 → 警告（黄色）
+            status = "warning"
+        else:
+            # 期限超過 → アラート（赤）
+            status = "alert"
+        
+        return ScheduledCheckStatus(
+            status=status,
+            time=None,
+            deadline=deadline.strftime("%H:%M"),
+            time_range=time_range
+        )
+
+
+def calculate_elapsed_excluding_lunch(
+    last_check_jst: datetime,
+    now_jst: datetime,
+    lunch_start: Optional[time] = None,
+    lunch_end: Optional[time] = None
+) -> int:
+    """
+    昼休み (LUNCH_BREAK_START〜LUNCH_BREAK_END、既定 12:00-14:00) を除外した経過時間（分）を計算
+    リプレイ (replay.elapsed_excluding_lunch) と同じ設定を使う
+    """
+    if lunch_start is None:
+        lunch_start = parse_time(settings.LUNCH_BREAK_START)
+    if lunch_end is None:
+        lunch_end = parse_time(settings.LUNCH_BREAK_END)
+    
+    total_minutes = 0
+    current = last_check_jst
+    
+    while current < now_jst:
+        current_time = current.time()
+        
+        # 昼休み中の場合はスキップ
+        if lunch_start <= current_time < lunch_end:
+            # 昼休み終了まで進める
+            lunch_end_dt = datetime.combine(current.date(), lunch_end).replace(tzinfo=JST)
+            if lunch_end_dt > now_jst:
+                break
+            current = lunch_end_dt
+            continue
+        
+        # 次の1分を加算
+        next_minute = current + timedelta(minutes=1)
+        
+        # 昼休み開始前で、次の1分が昼休み中なら昼休み開始まで
+        if current_time < lunch_start and next_minute.time() >= lunch_start:
+            lunch_start_dt = datetime.combine(current.date(), lunch_start).replace(tzinfo=JST)
+            minutes_to_lunch = int((lunch_start_dt - current).total_seconds() / 60)
+            total_minutes += minutes_to_lunch
+            current = lunch_start_dt
+            continue
+        
+        # 通常の1分加算
+        if next_minute > now_jst:
+            remaining = int((now_jst - current).total_seconds() / 60)
+            total_minutes += remaining
+            break
+        
+        total_minutes += 1
+        current = next_minute
+    
+    return total_minutes
+
+
+def calculate_regular_check_status(
+    last_check: Optional[ToiletCheck],
+    now_jst: datetime,
+    clinic_id: int = DEFAULT_CLINIC_ID
+) -> RegularCheckStatus:
+    """
+    定期チェックの状態を計算（時刻・間隔・昼休みはクリニックの設定）
+    """
+    regular_start = parse_time(clinic_settings.get(clinic_id, "REGULAR_CHECK_START"))
+    regular_end = parse_time(clinic_settings.get(clinic_id, "REGULAR_CHECK_END"))
+    threshold = clinic_settings.get(clinic_id, "REGULAR_CHECK_INTERVAL_MINUTES")
+    lunch = (
+        parse_time(clinic_settings.get(clinic_id, "LUNCH_BREAK_START")),
+        parse_time(clinic_settings.get(clinic_id, "LUNCH_BREAK_END")),
+    )
+    
+    now_time = now_jst.time()
+    is_active = regular_start <= now_time <= regular_end
+    
+    if not last_check:
+        # チェックなし - 営業開始からの経過時間
+        if is_active:
+            start_dt = datetime.combine(now_jst.date(), regular_start).replace(tzinfo=JST)
+            elapsed = calculate_elapsed_excluding_lunch(start_dt, now_jst, *lunch)
+        else:
+            elapsed = 0
+    else:
+        last_check_jst = to_jst(last_check.checked_at)
+        elapsed = calculate_elapsed_excluding_lunch(last_check_jst, now_jst, *lunch)
+    
+    # ステータス判定
+    if elapsed <= threshold:
+        status = "ok"
+    elif elapsed <= threshold * 2:
+        status = "warning"
+    else:
+        status = "alert"
+    
+    return RegularCheckStatus(
+        status=status,
+        minutes_elapsed=elapsed,
+        next_check_in=threshold - elapsed,
+        threshold=threshold,
+        is_active=is_active
+    )
+
+
+def fetch_day_checks(db: Session, target_date: date, clinic_id: int = DEFAULT_CLINIC_ID) -> List[ToiletCheck]:
+    """JSTの指定日のチェック（クリニック単位）を時刻順に取得"""
+    return fetch_checks(db, *day_bounds_utc(target_date), clinic_id=clinic_id)
+
+
+def calculate_simple_statuses(
+    day_checks: List[ToiletCheck],
+    now_jst: datetime,
+    clinic_id: int = DEFAULT_CLINIC_ID
+) -> Tuple[ScheduledCheckStatus, ScheduledCheckStatus, RegularCheckStatus]:
+    """
+    朝チェック・午後チェック・定期チェックの状態をまとめて計算
+    day_checks は当日のチェック（時刻順）
+    """
+    # 時刻設定を取得（クリニックごとの上書きがあればそれを使う）
+    morning_start = parse_time(clinic_settings.get(clinic_id, "MORNING_CHECK_START"))
+    morning_deadline = parse_time(clinic_settings.get(clinic_id, "MORNING_CHECK_DEADLINE"))
+    afternoon_start = parse_time(clinic_settings.get(clinic_id, "AFTERNOON_CHECK_START"))
+    afternoon_deadline = parse_time(clinic_settings.get(clinic_id, "AFTERNOON_CHECK_DEADLINE"))
+    
+    # 朝チェック判定（8:00〜14:00のチェックを対象）
+    morning_checks = [c for c in day_checks 
+                      if morning_start <= to_jst(c.checked_at).time() < afternoon_start]
+    
+    morning_status = calculate_scheduled_check_status(
+        morning_checks, morning_start, morning_deadline, now_jst
+    )
+    
+    # 午後チェック判定（14:00〜のチェックを対象）
+    afternoon_checks = [c for c in day_checks 
+                        if to_jst(c.checked_at).time() >= afternoon_start]
+    
+    afternoon_status = calculate_scheduled_check_status(
+        afternoon_checks, afternoon_start, afternoon_deadline, now_jst
+    )
+    
+    # 定期チェック判定
+    last_check = day_checks[-1] if day_checks else None
+    regular_status = calculate_regular_check_status(last_check, now_jst, clinic_id)
+
+    return morning_status, afternoon_status, regular_status
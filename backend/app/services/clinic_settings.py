@@ -0,0 +1,98 @@
+"""
+Per-clinic overrides of the check schedule.
+
+The schedule settings (morning / afternoon check windows, regular check
+hours and interval, lunch break) in Settings are the defaults for every
+clinic. A clinic overrides any of them with a `clinic_config` row of the
+same key, e.g. `POST /api/admin/settings?key=MORNING_CHECK_START` with
+`{"value": "08:30"}` (or the `settings` section of a bulk import).
+
+Overrides are few and rarely change, so they are cached per process and
+reloaded when a CONFIG_CHANGED event for the clinic arrives.
+"""
+import threading
+from typing import Dict, Optional, Union
+
+from sqlalchemy import select
+
+from app.core import events
+from app.core.config import settings
+from app.core.timeutil import parse_time
+from app.db.session import SessionLocal
+from app.models import ClinicConfig
+
+SCHEDULE_KEYS = (
+    "MORNING_CHECK_START",
+    "MORNING_CHECK_DEADLINE",
+    "AFTERNOON_CHECK_START",
+    "AFTERNOON_CHECK_DEADLINE",
+    "REGULAR_CHECK_START",
+    "REGULAR_CHECK_END",
+    "REGULAR_CHECK_INTERVAL_MINUTES",
+    "LUNCH_BREAK_START",
+    "LUNCH_BREAK_END",
+)
+
+_lock = threading.Lock()
+_overrides: Dict[int, Dict[str, str]] = {}
+
+
+def validate(key: str, value: str) -> None:
+    """Raise ValueError if `value` is not valid for a schedule key (other keys are free-form)."""
+    if key not in SCHEDULE_KEYS:
+        return
+    if isinstance(getattr(settings, key), int):
+        if not value.strip().isdigit() or int(value) <= 0:
+            raise ValueError(f"{key} must be a positive number of minutes")
+        return
+    try:
+        parse_time(value.strip())
+    except ValueError:
+        raise ValueError(f"{key} must be HH:MM")
+
+
+def _load(clinic_id: int) -> Dict[str, str]:
+    with _lock:
+        cached = _overrides.get(clinic_id)
+    if cached is not None:
+        return cached
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(ClinicConfig.key, ClinicConfig.value)
+            .where(ClinicConfig.clinic_id == clinic_id, ClinicConfig.key.in_(SCHEDULE_KEYS))
+        ).all()
+    finally:
+        db.close()
+    loaded = {}
+    for key, value in rows:
+        try:
+            validate(key, value)
+        except ValueError:
+            continue  # rows written before validation existed: fall back to the default
+        loaded[key] = value.strip()
+    with _lock:
+        _overrides[clinic_id] = loaded
+    return loaded
+
+
+def get(clinic_id: int, key: str) -> Union[str, int]:
+    """Schedule setting `key` for the clinic: its override, else the Settings default."""
+    default = getattr(settings, key)
+    value = _load(clinic_id).get(key)
+    if value is None:
+        return default
+    return int(value) if isinstance(default, int) else value
+
+
+def invalidate(clinic_id: Optional[int] = None) -> None:
+    with _lock:
+        if clinic_id is None:
+            _overrides.clear()
+        else:
+            _overrides.pop(clinic_id, None)
+
+
+@events.subscribe(events.CONFIG_CHANGED)
+def _on_config_changed(payload: dict) -> None:
+    invalidate(payload.get("clinic_id"))
@@ -0,0 +1,426 @@
+"""
+Consistency scan between image files on disk and the image rows.
+
+Problems it finds (both live and archive tables are considered):
+
+- missing_files: CheckImage rows whose file does not exist
+- missing_blobs: ImageBlob rows whose file does not exist
+- stale_image_paths: CheckImage.image_path differs from its blob's path
+- ref_count_mismatches: ImageBlob.ref_count differs from the rows using it
+- unreferenced_blobs: ImageBlob rows no image uses any more
+- orphan_files: files under blobs/ (clinics/{id}/blobs/ for the other
+  clinics) or the legacy YYYY/MM/DD/{check_id}/ directories that no row
+  points at
+- checks_without_images: checks that have no image rows
+
+The disk walk is split per directory shard (blobs/ab, YYYY/MM) over a
+thread pool of os.scandir walkers, and image rows are streamed with
+yield_per, so a full scan of a few hundred thousand files stays in the
+seconds range. `day=` limits the scan to one JST day: only that day's rows,
+the files they reference and the legacy directories of that day.
+
+The scan is a dry run by default. With `apply`, ref counts and stale paths
+are fixed in set-based statements, unreferenced blobs are deleted and orphan
+files are removed. Files and blobs younger than CONSISTENCY_GRACE_SECONDS
+are never touched (uploads write their files before the rows commit).
+Missing files and checks without images are only reported: the bytes are
+gone and the checks stay part of the history.
+"""
+import logging
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, delete, exists, func, select, update
+from sqlalchemy.orm import Session
+
+from app.core import events, scheduler
+from app.core.config import settings
+from app.core.tenancy import CLINICS_DIR
+from app.core.timeutil import JST, day_bounds_utc, to_jst
+from app.db.session import SessionLocal
+from app.models import CheckImage, CheckImageArchive, ImageBlob, ToiletCheck, ToiletCheckArchive
+from app.services.image_store import BLOB_DIR
+from app.services import snapshots
+from app.services.partitions import check_models_for_range
+
+logger = logging.getLogger(__name__)
+
+STREAM_BATCH = 10_000
+UPDATE_BATCH = 10_000
+YEAR_DIR = re.compile(r"^\d{4}$")
+
+IMAGE_MODELS = {ToiletCheck: CheckImage, ToiletCheckArchive: CheckImageArchive}
+
+
+@dataclass
+class ConsistencyReport:
+    scope: str  # "all" or YYYY-MM-DD (JST)
+    files_scanned: int = 0
+    image_rows: int = 0
+    blob_rows: int = 0
+    counts: Dict[str, int] = field(default_factory=dict)
+    samples: Dict[str, list] = field(default_factory=dict)
+    repaired: Dict[str, int] = field(default_factory=dict)
+    applied: bool = False
+    elapsed_ms: float = 0.0
+    affected_days: List[str] = field(default_factory=list)
+
+    def add(self, kind: str, item, limit: int) -> None:
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        bucket = self.samples.setdefault(kind, [])
+        if len(bucket) < limit:
+            bucket.append(item)
+
+    @property
+    def problems(self) -> int:
+        return sum(self.counts.values())
+
+
+def _norm(path: str) -> str:
+    return os.path.normpath(path)
+
+
+def _aware(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+# --- Disk ---
+
+def _walk(root: str) -> List[str]:
+    """All regular files below `root` (iterative os.scandir walk)."""
+    files, stack = [], [root]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    files.append(_norm(entry.path))
+    return files
+
+
+def _shards(root: str) -> Tuple[List[str], List[str]]:
+    """Subdirectories of `root` (one walker each) and the files directly in it."""
+    dirs, files = [], []
+    try:
+        with os.scandir(root) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    files.append(_norm(entry.path))
+    except FileNotFoundError:
+        pass
+    return dirs, files
+
+
+def _scan_roots(pool: ThreadPoolExecutor, roots: Iterable[str]) -> Set[str]:
+    shard_dirs, found = [], set()
+    for root in roots:
+        dirs, files = _shards(root)
+        shard_dirs.extend(dirs)
+        found.update(files)
+    for files in pool.map(_walk, shard_dirs):
+        found.update(files)
+    return found
+
+
+def _managed_roots(day: Optional[date]) -> List[str]:
+    """Directories whose files must all be referenced by a row."""
+    base = settings.IMAGE_STORAGE_PATH
+    if day is not None:
+        # Legacy per-check directories are named after the UTC date of the check
+        start, end = day_bounds_utc(day)
+        days = {start.date(), (end - timedelta(microseconds=1)).date()}
+        return [os.path.join(base, d.strftime("%Y/%m/%d")) for d in sorted(days)]
+    roots = [os.path.join(base, BLOB_DIR)]
+    try:
+        with os.scandir(base) as it:
+            roots.extend(e.path for e in it if e.is_dir(follow_symlinks=False) and YEAR_DIR.match(e.name))
+    except FileNotFoundError:
+        pass
+    # Blob stores of the other clinics (their contact sheets are not row-backed either)
+    try:
+        with os.scandir(os.path.join(base, CLINICS_DIR)) as it:
+            roots.extend(os.path.join(e.path, BLOB_DIR) for e in it if e.is_dir(follow_symlinks=False))
+    except FileNotFoundError:
+        pass
+    return roots
+
+
+def _older_than_grace(path: str, now: float) -> bool:
+    try:
+        return now - os.stat(path).st_mtime > settings.CONSISTENCY_GRACE_SECONDS
+    except FileNotFoundError:
+        return False
+
+
+# --- Rows ---
+
+def _image_rows(db: Session, check_model, start_utc=None, end_utc=None):
+    """(image_id, check_id, blob_id, image_path, checked_at) in batches."""
+    image_model = IMAGE_MODELS[check_model]
+    stmt = select(
+        image_model.id, image_model.check_id, image_model.blob_id, image_model.image_path, check_model.checked_at
+    ).join(check_model, check_model.id == image_model.check_id).order_by(image_model.id)
+    if start_utc is not None:
+        stmt = stmt.where(check_model.checked_at >= start_utc, check_model.checked_at < end_utc)
+    result = db.connection().execution_options(yield_per=STREAM_BATCH).execute(stmt)
+    for part in result.partitions():
+        yield part
+
+
+def _actual_refs(db: Session, blob_ids: Optional[Set[int]] = None) -> Counter:
+    refs: Counter = Counter()
+    for image_model in IMAGE_MODELS.values():
+        stmt = select(image_model.blob_id, func.count()).where(image_model.blob_id.isnot(None))
+        if blob_ids is not None:
+            stmt = stmt.where(image_model.blob_id.in_(bindparam("ids", expanding=True)))
+        stmt = stmt.group_by(image_model.blob_id)
+        if blob_ids is None:
+            refs.update(dict(db.execute(stmt).all()))
+        else:
+            ids = sorted(blob_ids)
+            for start in range(0, len(ids), UPDATE_BATCH):
+                refs.update(dict(db.execute(stmt, {"ids": ids[start:start + UPDATE_BATCH]}).all()))
+    return refs
+
+
+def _paths_under(db: Session, roots: List[str]) -> Set[str]:
+    paths = set()
+    for image_model in IMAGE_MODELS.values():
+        for root in roots:
+            stmt = select(image_model.image_path).where(image_model.image_path.startswith(root + os.sep, autoescape=True))
+            paths.update(_norm(p) for (p,) in db.execute(stmt))
+    return paths
+
+
+def _unused(model):
+    """WHERE clause: no live or archived image uses the blob."""
+    return ~exists().where(CheckImage.blob_id == model.id) & ~exists().where(CheckImageArchive.blob_id == model.id)
+
+
+def _checks_without_images(db: Session, models, start_utc=None, end_utc=None) -> List[Tuple[int, datetime]]:
+    rows = []
+    for check_model in models:
+        image_model = IMAGE_MODELS[check_model]
+        stmt = select(check_model.id, check_model.checked_at)\
+            .where(~exists().where(image_model.check_id == check_model.id))\
+            .order_by(check_model.id)
+        if start_utc is not None:
+            stmt = stmt.where(check_model.checked_at >= start_utc, check_model.checked_at < end_utc)
+        rows.extend(db.execute(stmt).all())
+    return rows
+
+
+# --- Scan ---
+
+def scan(
+    db: Session,
+    day: Optional[date] = None,
+    dry_run: bool = True,
+    sample_limit: int = 50,
+) -> ConsistencyReport:
+    started = time.perf_counter()
+    report = ConsistencyReport(scope=day.isoformat() if day else "all", applied=not dry_run)
+    now = time.time()
+    grace_cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.CONSISTENCY_GRACE_SECONDS)
+    affected_days: Set[str] = set()
+
+    if day is not None:
+        start_utc, end_utc = day_bounds_utc(day)
+        check_models = check_models_for_range(db, start_utc, end_utc)
+    else:
+        start_utc = end_utc = None
+        check_models = [ToiletCheck, ToiletCheckArchive]
+
+    def load_blobs(blob_ids: Optional[Set[int]]) -> dict:
+        stmt = select(ImageBlob.id, ImageBlob.path, ImageBlob.ref_count, ImageBlob.created_at)
+        if blob_ids is None:
+            result = db.connection().execution_options(yield_per=STREAM_BATCH).execute(stmt)
+            return {r[0]: r for part in result.partitions() for r in part}
+        stmt = stmt.where(ImageBlob.id.in_(bindparam("ids", expanding=True)))
+        ids, rows = sorted(blob_ids), {}
+        for start in range(0, len(ids), UPDATE_BATCH):
+            rows.update({r[0]: r for r in db.execute(stmt, {"ids": ids[start:start + UPDATE_BATCH]})})
+        return rows
+
+    stale: List[dict] = []
+    referenced: Set[str] = set()
+
+    with ThreadPoolExecutor(max_workers=settings.CONSISTENCY_SCAN_WORKERS, thread_name_prefix="consistency") as pool:
+        managed_files = _scan_roots(pool, _managed_roots(day))
+        report.files_scanned = len(managed_files)
+
+        def existing(paths: Set[str]) -> Set[str]:
+            # Files outside the walked directories are stat()ed in parallel
+            outside = sorted(paths - managed_files)
+            report.files_scanned += len(outside)
+            return (paths & managed_files) | {p for p, ok in zip(outside, pool.map(os.path.exists, outside)) if ok}
+
+        def check_images(rows, archived: bool) -> None:
+            paths = {_norm(row[3]) for row in rows}
+            referenced.update(paths)
+            on_disk = existing(paths | {_norm(blobs[r[2]][1]) for r in rows if r[2] in blobs})
+            for image_id, check_id, blob_id, image_path, checked_at in rows:
+                report.image_rows += 1
+                blob = blobs.get(blob_id) if blob_id is not None else None
+                if blob is not None and _norm(image_path) != _norm(blob[1]) and _norm(blob[1]) in on_disk:
+                    item = {"image_id": image_id, "check_id": check_id, "path": image_path, "blob_path": blob[1], "archived": archived}
+                    report.add("stale_image_paths", item, sample_limit)
+                    stale.append(item)
+                    affected_days.add(to_jst(_aware(checked_at)).date().isoformat())
+                elif _norm(image_path) not in on_disk:
+                    report.add("missing_files", {
+                        "image_id": image_id, "check_id": check_id, "path": image_path, "archived": archived,
+                        "date": to_jst(_aware(checked_at)).date().isoformat(),
+                    }, sample_limit)
+
+        if day is None:
+            # Full scan: image rows are checked batch by batch as they stream in
+            blobs = load_blobs(None)
+            refs = _actual_refs(db)
+            for check_model in check_models:
+                for part in _image_rows(db, check_model):
+                    check_images(part, check_model is ToiletCheckArchive)
+        else:
+            # One day: only the blobs that day's images use
+            day_rows = [(m, list(part)) for m in check_models for part in _image_rows(db, m, start_utc, end_utc)]
+            day_blob_ids = {row[2] for _, part in day_rows for row in part if row[2] is not None}
+            blobs = load_blobs(day_blob_ids)
+            refs = _actual_refs(db, day_blob_ids)
+            for check_model, part in day_rows:
+                check_images(part, check_model is ToiletCheckArchive)
+        report.blob_rows = len(blobs)
+
+        blob_paths = {_norm(b[1]) for b in blobs.values()}
+        referenced.update(blob_paths)
+        blobs_on_disk = existing(blob_paths)
+
+    # Blobs
+    mismatched, unreferenced = [], []
+    for blob_id, path, ref_count, created_at in blobs.values():
+        actual = refs.get(blob_id, 0)
+        if _norm(path) not in blobs_on_disk:
+            report.add("missing_blobs", {"blob_id": blob_id, "path": path, "ref_count": ref_count}, sample_limit)
+        if ref_count != actual:
+            report.add("ref_count_mismatches", {"blob_id": blob_id, "ref_count": ref_count, "actual": actual}, sample_limit)
+            mismatched.append(blob_id)
+        if actual == 0 and (created_at is None or _aware(created_at) < grace_cutoff):
+            report.add("unreferenced_blobs", {"blob_id": blob_id, "path": path}, sample_limit)
+            unreferenced.append(blob_id)
+
+    # Files
+    if day is not None:
+        # Legacy directories are per UTC date and also hold checks of the neighbouring JST days
+        referenced |= _paths_under(db, _managed_roots(day))
+    orphans = [p for p in sorted(managed_files - referenced) if _older_than_grace(p, now)]
+    if orphans:
+        # Same bytes may have been uploaded again since the walk
+        stmt = select(ImageBlob.path).where(ImageBlob.path.in_(bindparam("paths", expanding=True)))
+        known = set()
+        for start in range(0, len(orphans), UPDATE_BATCH):
+            known.update(_norm(p) for (p,) in db.execute(stmt, {"paths": orphans[start:start + UPDATE_BATCH]}))
+        orphans = [p for p in orphans if p not in known]
+    for path in orphans:
+        report.add("orphan_files", path, sample_limit)
+
+    # Checks
+    for check_id, checked_at in _checks_without_images(db, check_models, start_utc, end_utc):
+        report.add("checks_without_images", {
+            "check_id": check_id, "date": to_jst(_aware(checked_at)).date().isoformat(),
+        }, sample_limit)
+
+    if not dry_run:
+        report.repaired = _repair(db, stale, mismatched, unreferenced, orphans)
+        if report.repaired.get("stale_image_paths"):
+            report.affected_days = sorted(affected_days)
+            snapshots.invalidate(db, report.affected_days)
+            events.publish(db, events.CHECKS_CHANGED, {
+                "reason": "consistency_repair", "days": events.event_days(report.affected_days),
+            })
+            db.commit()
+
+    report.elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+    logger.info(
+        f"Consistency scan ({report.scope}): {report.files_scanned} files, {report.image_rows} images, "
+        f"{report.blob_rows} blobs, problems {report.counts or 'none'}"
+        + (f", repaired {report.repaired}" if report.applied else "")
+    )
+    return report
+
+
+# --- Repair ---
+
+def _repair(db: Session, stale: List[dict], mismatched: List[int], unreferenced: List[int], orphans: List[str]) -> Dict[str, int]:
+    repaired = {"stale_image_paths": 0, "ref_counts": 0, "unreferenced_blobs": 0, "orphan_files": 0}
+    conn = db.connection()
+
+    for archived in (False, True):
+        table = (CheckImageArchive if archived else CheckImage).__table__
+        rows = [{"b_id": s["image_id"], "b_path": s["blob_path"]} for s in stale if s["archived"] == archived]
+        stmt = update(table).where(table.c.id == bindparam("b_id")).values(image_path=bindparam("b_path"))
+        for start in range(0, len(rows), UPDATE_BATCH):
+            conn.execute(stmt, rows[start:start + UPDATE_BATCH])
+        repaired["stale_image_paths"] += len(rows)
+
+    # Recount in SQL, so images inserted since the scan are counted too
+    live_refs = select(func.count()).where(CheckImage.blob_id == ImageBlob.id).scalar_subquery()
+    archived_refs = select(func.count()).where(CheckImageArchive.blob_id == ImageBlob.id).scalar_subquery()
+    for start in range(0, len(mismatched), UPDATE_BATCH):
+        conn.execute(
+            update(ImageBlob)
+            .where(ImageBlob.id.in_(mismatched[start:start + UPDATE_BATCH]))
+            .values(ref_count=live_refs + archived_refs)
+            .execution_options(synchronize_session=False)
+        )
+    repaired["ref_counts"] = len(mismatched)
+
+    # Delete blob rows still unused at this point, then their files
+    blob_files = []
+    for start in range(0, len(unreferenced), UPDATE_BATCH):
+        batch = unreferenced[start:start + UPDATE_BATCH]
+        rows = db.execute(select(ImageBlob.id, ImageBlob.path).where(ImageBlob.id.in_(batch), _unused(ImageBlob))).all()
+        if rows:
+            db.execute(
+                delete(ImageBlob).where(ImageBlob.id.in_([r[0] for r in rows]), _unused(ImageBlob))
+                .execution_options(synchronize_session=False)
+            )
+            blob_files.extend(r[1] for r in rows)
+    repaired["unreferenced_blobs"] = len(blob_files)
+    db.commit()
+
+    for path in blob_files:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    for path in orphans:
+        try:
+            os.remove(path)
+            repaired["orphan_files"] += 1
+        except FileNotFoundError:
+            pass
+    return repaired
+
+
+@scheduler.every(settings.CONSISTENCY_SCAN_INTERVAL_SECONDS)
+def consistency_scan_task() -> None:
+    """Report-only scan of the previous JST day."""
+    db = SessionLocal()
+    try:
+        report = scan(db, day=datetime.now(JST).date() - timedelta(days=1))
+    finally:
+        db.close()
+    if report.problems:
+        logger.warning(f"Consistency problems on {report.scope}: {report.counts}")
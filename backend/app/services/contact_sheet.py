@@ -0,0 +1,215 @@
+"""
+Daily contact sheets: all thumbnails of a JST day composited into one sprite.
+
+The dashboard timeline shows two thumbnails per check, which on a busy day
+means hundreds of image requests. Instead, each day gets one JPEG sprite
+(square tiles in a fixed-width grid, oldest check first) plus a JSON map of
+tile offsets, stored under IMAGE_STORAGE_PATH/sheets/ (clinics/{id}/sheets/
+for clinics other than the default one) and served by the /images static mount.
+
+Sheets are built incrementally: a job appends the tiles of each new check
+to the existing sprite, so only the new source images are decoded. If the
+day's checks no longer match the tiles already on the sheet (a check was
+removed or its images changed), the sheet is rebuilt from scratch. The
+sprite file name carries a version so clients can cache it forever.
+"""
+import io
+import json
+import logging
+import os
+import threading
+from dataclasses import asdict, dataclass, field
+from datetime import date
+from typing import List, Optional
+
+from PIL import Image, ImageOps
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.tenancy import storage_prefix
+from app.core.timeutil import day_bounds_utc
+from app.models import DEFAULT_CLINIC_ID
+from app.services import jobs
+from app.services.image_store import write_atomic
+from app.services.partitions import fetch_checks
+
+logger = logging.getLogger(__name__)
+
+SHEET_DIR = "sheets"
+PLACEHOLDER_COLOR = (226, 232, 240)
+
+_build_lock = threading.Lock()
+
+
+@dataclass
+class SheetTile:
+    image_id: int
+    check_id: int
+    x: int
+    y: int
+
+
+@dataclass
+class SheetMap:
+    date: str
+    version: int
+    tile_size: int
+    columns: int
+    width: int
+    height: int
+    tiles: List[SheetTile] = field(default_factory=list)
+    clinic_id: int = DEFAULT_CLINIC_ID
+
+    @property
+    def filename(self) -> str:
+        return f"{self.date}.v{self.version}.jpg"
+
+    @property
+    def url(self) -> str:
+        return "/".join(filter(None, ["/images", storage_prefix(self.clinic_id), SHEET_DIR, self.filename]))
+
+
+def sheet_dir(clinic_id: int = DEFAULT_CLINIC_ID) -> str:
+    return os.path.join(settings.IMAGE_STORAGE_PATH, storage_prefix(clinic_id), SHEET_DIR)
+
+
+def map_path(day: date, clinic_id: int = DEFAULT_CLINIC_ID) -> str:
+    return os.path.join(sheet_dir(clinic_id), f"{day.isoformat()}.json")
+
+
+def load_map(day: date, clinic_id: int = DEFAULT_CLINIC_ID) -> Optional[SheetMap]:
+    try:
+        with open(map_path(day, clinic_id), encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    tiles = [SheetTile(**t) for t in data.pop("tiles")]
+    sheet = SheetMap(**data, tiles=tiles)
+    if not os.path.exists(os.path.join(sheet_dir(clinic_id), sheet.filename)):
+        return None
+    return sheet
+
+
+def _day_images(db: Session, day: date, clinic_id: int) -> list:
+    """(check, image) pairs the timeline shows for the day, oldest check first."""
+    pairs = []
+    for check in fetch_checks(db, *day_bounds_utc(day), clinic_id=clinic_id):
+        images = sorted(check.images, key=lambda x: x.order_index)
+        for image in images[:settings.CONTACT_SHEET_THUMBNAILS_PER_CHECK]:
+            pairs.append((check, image))
+    return pairs
+
+
+def _tile(image_path: str, size: int) -> Image.Image:
+    try:
+        with Image.open(image_path) as src:
+            src.draft("RGB", (size * 2, size * 2))  # JPEG: decode at reduced scale
+            return ImageOps.fit(src.convert("RGB"), (size, size))
+    except Exception:
+        logger.warning(f"Contact sheet: cannot read {image_path}", exc_info=True)
+        return Image.new("RGB", (size, size), PLACEHOLDER_COLOR)
+
+
+def _write(sheet: SheetMap, canvas: Image.Image, previous: Optional[SheetMap]) -> None:
+    directory = sheet_dir(sheet.clinic_id)
+    buf = io.BytesIO()
+    canvas.save(buf, format="JPEG", quality=settings.IMAGE_QUALITY, optimize=True, progressive=True)
+    write_atomic(os.path.join(directory, sheet.filename), buf.getvalue())
+    write_atomic(map_path(date.fromisoformat(sheet.date), sheet.clinic_id), json.dumps(asdict(sheet)).encode("utf-8"))
+
+    # Keep the previous version for clients still holding the old map
+    if previous and previous.version > 1:
+        older = os.path.join(directory, f"{sheet.date}.v{previous.version - 1}.jpg")
+        if os.path.exists(older):
+            os.remove(older)
+
+
+def update_sheet(db: Session, day: date, clinic_id: int = DEFAULT_CLINIC_ID) -> Optional[SheetMap]:
+    """Bring the day's sheet up to date (append new tiles, or rebuild). None if the day has no images."""
+    with _build_lock:
+        pairs = _day_images(db, day, clinic_id)
+        if not pairs:
+            invalidate_day(day, clinic_id)
+            return None
+
+        current = load_map(day, clinic_id)
+        image_ids = [image.id for _, image in pairs]
+        if current and (
+            current.tile_size != settings.CONTACT_SHEET_TILE_SIZE
+            or current.columns != settings.CONTACT_SHEET_COLUMNS
+            or [t.image_id for t in current.tiles] != image_ids[:len(current.tiles)]
+        ):
+            logger.info(f"Contact sheet {day}: tiles changed, rebuilding")
+            base = None
+        else:
+            base = current
+        if base and len(base.tiles) == len(pairs):
+            return base
+
+        size = settings.CONTACT_SHEET_TILE_SIZE
+        columns = settings.CONTACT_SHEET_COLUMNS
+        rows = -(-len(pairs) // columns)
+        canvas = Image.new("RGB", (columns * size, rows * size), PLACEHOLDER_COLOR)
+
+        tiles = list(base.tiles) if base else []
+        if base:
+            with Image.open(os.path.join(sheet_dir(clinic_id), base.filename)) as old:
+                canvas.paste(old.convert("RGB"), (0, 0))
+
+        for index in range(len(tiles), len(pairs)):
+            check, image = pairs[index]
+            x, y = (index % columns) * size, (index // columns) * size
+            canvas.paste(_tile(image.image_path, size), (x, y))
+            tiles.append(SheetTile(image_id=image.id, check_id=check.id, x=x, y=y))
+
+        sheet = SheetMap(
+            date=day.isoformat(),
+            version=(current.version + 1) if current else 1,
+            tile_size=size,
+            columns=columns,
+            width=canvas.width,
+            height=canvas.height,
+            tiles=tiles,
+            clinic_id=clinic_id,
+        )
+        _write(sheet, canvas, current)
+        logger.info(f"Contact sheet {day}: v{sheet.version}, {len(tiles)} tiles ({len(tiles) - len(base.tiles) if base else len(tiles)} new)")
+        return sheet
+
+
+def get_sheet(
+    db: Session, day: date, clinic_id: int = DEFAULT_CLINIC_ID, primary: Optional[Session] = None
+) -> Optional[SheetMap]:
+    """
+    Current sheet for the day, updating it first if checks were added since it
+    was built. `db` may be a replica session: the sheet is only ever built from
+    `primary` (default `db`), so a lagging replica never rewrites it without
+    the newest tiles.
+    """
+    sheet = load_map(day, clinic_id)
+    if sheet is not None:
+        image_ids = [image.id for _, image in _day_images(db, day, clinic_id)]
+        if [t.image_id for t in sheet.tiles] == image_ids:
+            return sheet
+    return update_sheet(primary or db, day, clinic_id)
+
+
+def invalidate_day(day: date, clinic_id: int = DEFAULT_CLINIC_ID) -> None:
+    """Remove the day's sheet; the next request rebuilds it."""
+    prefix = f"{day.isoformat()}."
+    directory = sheet_dir(clinic_id)
+    try:
+        names = [n for n in os.listdir(directory) if n.startswith(prefix)]
+    except FileNotFoundError:
+        return
+    for name in names:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+
+@jobs.handler("images.contact_sheet", concurrency=1)
+def update_sheet_job(db: Session, payload: dict) -> None:
+    """Job: append a newly recorded check to its day's contact sheet."""
+    update_sheet(db, date.fromisoformat(payload["date"]), payload.get("clinic_id", DEFAULT_CLINIC_ID))
@@ -0,0 +1,82 @@
+"""
+Delta sync for dashboard polling.
+
+A dashboard response carries a cursor `<last_check_id>.<timeline_digest>.<status_digest>`.
+When a client polls again with `since=<cursor>`, the server rebuilds the view
+and compares:
+
+- timeline: if the items the client already has (id <= last_check_id) are
+  unchanged, only the newer items are sent; otherwise the full timeline is sent
+  (a check was deleted, reclassified or flagged as a near-duplicate).
+- status: the status parts are sent only when their digest changed.
+
+If nothing changed at all the endpoint answers 304 Not Modified.
+"""
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Any, List, NamedTuple, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+CURSOR_HEADER = "X-Dashboard-Cursor"
+
+
+class Cursor(NamedTuple):
+    last_id: int
+    timeline_digest: str
+    status_digest: str
+
+    def __str__(self) -> str:
+        return f"{self.last_id}.{self.timeline_digest}.{self.status_digest}"
+
+
+def digest(value: Any) -> str:
+    encoded = json.dumps(jsonable_encoder(value), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()[:12]
+
+
+def parse_cursor(value: Optional[str]) -> Optional[Cursor]:
+    """Malformed cursors are treated as absent (the client gets a full response)."""
+    if not value:
+        return None
+    parts = value.split(".")
+    if len(parts) != 3 or not parts[0].isdigit():
+        return None
+    return Cursor(int(parts[0]), parts[1], parts[2])
+
+
+@dataclass
+class Delta:
+    cursor: Cursor
+    is_delta: bool
+    timeline: List[Any] = field(default_factory=list)
+    status_changed: bool = True
+
+    @property
+    def not_modified(self) -> bool:
+        return self.is_delta and not self.timeline and not self.status_changed
+
+
+def compute_delta(timeline: List[Any], status: Any, since: Optional[str]) -> Delta:
+    """
+    `timeline` is newest first and every item has an `id`; `status` is any
+    JSON-encodable value holding the non-timeline parts of the response.
+    """
+    last_id = max((item.id for item in timeline), default=0)
+    cursor = Cursor(last_id, digest(timeline), digest(status))
+
+    previous = parse_cursor(since)
+    if previous is None:
+        return Delta(cursor, is_delta=False, timeline=timeline)
+
+    known = [item for item in timeline if item.id <= previous.last_id]
+    if digest(known) != previous.timeline_digest:
+        return Delta(cursor, is_delta=False, timeline=timeline)
+
+    return Delta(
+        cursor,
+        is_delta=True,
+        timeline=[item for item in timeline if item.id > previous.last_id],
+        status_changed=cursor.status_digest != previous.status_digest,
+    )
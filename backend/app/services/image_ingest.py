@@ -0,0 +1,204 @@
+"""
+Image normalization at ingest.
+
+Uploads are decoded, validated, capped in size, stripped of EXIF and
+re-encoded in a process pool so Pillow's decode/encode work never runs on
+the API process. Functions executed in the pool only depend on Pillow so
+the worker processes stay light.
+"""
+import io
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import List, Optional
+
+from PIL import Image, ImageOps
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_INPUT_FORMATS = {"JPEG", "PNG", "WEBP", "MPO"}
+OUTPUT_EXTENSIONS = {"jpeg": "jpg", "webp": "webp"}
+
+
+class InvalidImageError(ValueError):
+    pass
+
+
+@dataclass
+class NormalizedImage:
+    data: bytes
+    ext: str
+    width: int
+    height: int
+    original_bytes: int
+    phash: str
+    elapsed_ms: float
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - len(self.data)
+
+
+def dhash(img: Image.Image) -> str:
+    """64-bit difference hash (dHash) as 16 hex chars."""
+    # 9x8 grayscale, compare each pixel with its right neighbour -> 64 bits
+    small = img.convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return f"{value:016x}"
+
+
+def normalize_image(data: bytes, max_dimension: int, output_format: str, quality: int, max_pixels: int) -> NormalizedImage:
+    """Decode, validate, resize, strip metadata and re-encode one image."""
+    started = time.perf_counter()
+    Image.MAX_IMAGE_PIXELS = max_pixels
+
+    try:
+        img = Image.open(io.BytesIO(data))
+        if img.format not in ALLOWED_INPUT_FORMATS:
+            raise InvalidImageError(f"Unsupported image format: {img.format}")
+        # MAX_IMAGE_PIXELS only warns below twice the limit: check the header size explicitly
+        if img.width * img.height > max_pixels:
+            raise InvalidImageError(f"Image too large: {img.width}x{img.height} pixels")
+        img.load()
+    except InvalidImageError:
+        raise
+    except Image.DecompressionBombError:
+        # Raised by Image.open itself from twice the limit on
+        raise InvalidImageError(f"Image too large: more than {max_pixels} pixels")
+    except Exception as e:
+        raise InvalidImageError(f"Could not decode image: {e}")
+
+    # Apply the camera orientation before EXIF is dropped
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+
+    out = io.BytesIO()
+    if output_format == "webp":
+        img.save(out, format="WEBP", quality=quality, method=4)
+    else:
+        img.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+
+    return NormalizedImage(
+        data=out.getvalue(),
+        ext=OUTPUT_EXTENSIONS[output_format],
+        width=img.width,
+        height=img.height,
+        original_bytes=len(data),
+        phash=dhash(img),
+        elapsed_ms=(time.perf_counter() - started) * 1000,
+    )
+
+
+class IngestStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.rejected = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, result: NormalizedImage) -> None:
+        with self._lock:
+            self.images += 1
+            self.bytes_in += result.original_bytes
+            self.bytes_out += len(result.data)
+            self.total_ms += result.elapsed_ms
+            self.max_ms = max(self.max_ms, result.elapsed_ms)
+
+    def record_rejected(self) -> None:
+        with self._lock:
+            self.rejected += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "images": self.images,
+                "rejected": self.rejected,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "bytes_saved": self.bytes_in - self.bytes_out,
+                "avg_ms": round(self.total_ms / self.images, 2) if self.images else 0.0,
+                "max_ms": round(self.max_ms, 2),
+            }
+
+
+ingest_stats = IngestStats()
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: the API process is multi-threaded, so forking is unsafe
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_INGEST_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def normalize_images(payloads: List[bytes]) -> List[NormalizedImage]:
+    """
+    Normalize several uploads in parallel in the process pool.
+    Raises InvalidImageError if any of them is not a usable image.
+    """
+    pool = get_pool()
+    futures = [
+        pool.submit(
+            normalize_image,
+            data,
+            settings.IMAGE_MAX_DIMENSION,
+            settings.IMAGE_OUTPUT_FORMAT,
+            settings.IMAGE_QUALITY,
+            settings.IMAGE_MAX_PIXELS,
+        )
+        for data in payloads
+    ]
+
+    results = []
+    for idx, future in enumerate(futures):
+        try:
+            result = future.result()
+        except InvalidImageError:
+            ingest_stats.record_rejected()
+            for f in futures:
+                f.cancel()
+            raise
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); start a fresh pool on the next call
+            shutdown_pool()
+            raise
+        ingest_stats.record(result)
+        logger.info(
+            f"Image {idx}: {result.original_bytes} -> {len(result.data)} bytes "
+            f"({result.width}x{result.height}, {result.elapsed_ms:.1f} ms)"
+        )
+        results.append(result)
+    return results
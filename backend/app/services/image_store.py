@@ -0,0 +1,97 @@
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Optional
+
+from sqlalchemy import event, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.tenancy import storage_prefix
+from app.models import DEFAULT_CLINIC_ID, CheckImage, ImageBlob
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = "blobs"
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def blob_path(sha256: str, ext: str = "jpg", clinic_id: int = DEFAULT_CLINIC_ID) -> str:
+    # /var/data/toilet-images/blobs/ab/cd/abcd....jpg (other clinics: .../clinics/{id}/blobs/...)
+    return os.path.join(
+        settings.IMAGE_STORAGE_PATH, storage_prefix(clinic_id), BLOB_DIR, sha256[:2], sha256[2:4], f"{sha256}.{ext}"
+    )
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def store_blob(
+    db: Session, data: bytes, phash: Optional[str] = None, ext: str = "jpg", clinic_id: int = DEFAULT_CLINIC_ID
+) -> ImageBlob:
+    """
+    Store image bytes under their content hash and return the ImageBlob row.
+    Identical bytes are written to disk only once per clinic; the caller
+    attaches the blob to a CheckImage (which bumps ref_count). `phash` is
+    the dHash computed at ingest (image_ingest.normalize_image).
+    """
+    sha256 = content_hash(data)
+    blob = db.query(ImageBlob).filter(ImageBlob.clinic_id == clinic_id, ImageBlob.sha256 == sha256).first()
+    if blob:
+        if not os.path.exists(blob.path):
+            # File went missing on disk; restore it from the re-uploaded bytes
+            write_atomic(blob.path, data)
+        return blob
+
+    path = blob_path(sha256, ext, clinic_id)
+    if not os.path.exists(path):
+        write_atomic(path, data)
+
+    blob = ImageBlob(clinic_id=clinic_id, sha256=sha256, path=path, size_bytes=len(data), phash=phash, ref_count=0)
+    try:
+        with db.begin_nested():
+            db.add(blob)
+    except IntegrityError:
+        # Same bytes inserted concurrently by another request
+        blob = db.query(ImageBlob).filter(ImageBlob.clinic_id == clinic_id, ImageBlob.sha256 == sha256).one()
+    return blob
+
+
+def attach_blob(db: Session, image: CheckImage, blob: ImageBlob) -> None:
+    """Point a CheckImage at a blob and take a reference on it."""
+    image.blob_id = blob.id
+    image.image_path = blob.path
+    db.execute(
+        update(ImageBlob)
+        .where(ImageBlob.id == blob.id)
+        .values(ref_count=ImageBlob.ref_count + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+@event.listens_for(CheckImage, "after_delete")
+def _release_blob(mapper, connection, target: CheckImage) -> None:
+    # Drop the reference held by a deleted CheckImage. Blobs that reach zero
+    # are left on disk and cleaned up by the maintenance tooling.
+    if target.blob_id is None:
+        return
+    connection.execute(
+        update(ImageBlob)
+        .where(ImageBlob.id == target.blob_id)
+        .values(ref_count=ImageBlob.ref_count - 1)
+    )
@@ -0,0 +1,379 @@
+"""
+Database-backed job queue.
+
+Request handlers enqueue jobs in the same transaction as the rows they
+create, so post-commit work is never lost: if the process dies, the job is
+still in the `jobs` table and a worker picks it up. Workers claim jobs with
+a conditional UPDATE (plus SKIP LOCKED on Postgres), retry failures with
+exponential backoff and respect a per-job-type concurrency limit counted
+across all workers. The running count and the claim happen under a lock
+per job type (a transaction-level advisory lock on Postgres), so the limit
+holds when several workers poll at once.
+
+Run a worker with `python -m app.worker`, or set RUN_EMBEDDED_WORKER to run
+worker threads inside the API process.
+"""
+import importlib
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import func, text, update
+from sqlalchemy.orm import Session
+
+from app.core import scheduler
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models import Job
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+JOB_LOCK_NAMESPACE = 0x4B4A4A42  # "KJJB", advisory locks per job type
+_claim_lock = threading.Lock()  # SQLite (single host): claims in this process take turns
+
+# Modules that register job handlers; imported by workers on start
+HANDLER_MODULES = [
+    "app.services.near_duplicates",
+    "app.services.alerts",
+    "app.services.contact_sheet",
+]
+
+
+@dataclass
+class JobHandler:
+    job_type: str
+    func: Callable[[Session, dict], None]
+    concurrency: int
+    max_attempts: int
+
+
+_handlers: Dict[str, JobHandler] = {}
+
+
+def handler(job_type: str, concurrency: int = 1, max_attempts: int = 5):
+    """Register `func(db, payload)` as the handler for `job_type`."""
+    def decorator(func: Callable[[Session, dict], None]):
+        _handlers[job_type] = JobHandler(job_type, func, concurrency, max_attempts)
+        return func
+    return decorator
+
+
+def load_handlers() -> None:
+    for module in HANDLER_MODULES:
+        importlib.import_module(module)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is not None and dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def enqueue(db: Session, job_type: str, payload: dict, delay_seconds: float = 0) -> Job:
+    """
+    Add a job to the session. It becomes visible to workers when the
+    caller commits, together with whatever else the transaction wrote.
+    """
+    registered = _handlers.get(job_type)
+    job = Job(
+        job_type=job_type,
+        payload=payload,
+        status=QUEUED,
+        attempts=0,
+        max_attempts=registered.max_attempts if registered else 5,
+        run_after=_utcnow() + timedelta(seconds=delay_seconds),
+    )
+    db.add(job)
+    return job
+
+
+def _running_counts(db: Session, job_type: Optional[str] = None) -> Dict[str, int]:
+    query = db.query(Job.job_type, func.count(Job.id)).filter(Job.status == RUNNING)
+    if job_type is not None:
+        query = query.filter(Job.job_type == job_type)
+    return dict(query.group_by(Job.job_type).all())
+
+
+def _lock_job_type(db: Session, job_type: str) -> bool:
+    """Per-type claim lock until the transaction ends (Postgres); False if another worker holds it."""
+    if db.get_bind().dialect.name != "postgresql":
+        return True  # _claim_lock already serializes claims
+    return db.execute(
+        text("SELECT pg_try_advisory_xact_lock(:namespace, hashtext(:job_type))"),
+        {"namespace": JOB_LOCK_NAMESPACE, "job_type": job_type},
+    ).scalar()
+
+
+def claim_next(db: Session, worker_id: str) -> Optional[int]:
+    """Claim the next runnable job and return its id, or None."""
+    if db.get_bind().dialect.name == "postgresql":
+        return _claim_next(db, worker_id)
+    with _claim_lock:
+        return _claim_next(db, worker_id)
+
+
+def _claim_next(db: Session, worker_id: str) -> Optional[int]:
+    running = _running_counts(db)
+    available = [t for t, h in _handlers.items() if running.get(t, 0) < h.concurrency]
+    if not available:
+        return None
+
+    now = _utcnow()
+    candidates = db.query(Job.id, Job.job_type)\
+        .filter(Job.status == QUEUED, Job.run_after <= now, Job.job_type.in_(available))\
+        .order_by(Job.run_after, Job.id)\
+        .limit(10)\
+        .with_for_update(skip_locked=True)\
+        .all()
+
+    full = set()
+    for job_id, job_type in candidates:
+        if job_type in full:
+            continue
+        # Count and claim under the type's lock: two workers can never both see the last free slot
+        if not _lock_job_type(db, job_type) or \
+                _running_counts(db, job_type).get(job_type, 0) >= _handlers[job_type].concurrency:
+            full.add(job_type)
+            continue
+        # Conditional update so two workers can never claim the same job
+        result = db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == QUEUED)
+            .values(
+                status=RUNNING,
+                locked_by=worker_id,
+                locked_at=now,
+                started_at=now,
+                attempts=Job.attempts + 1,
+            )
+        )
+        if result.rowcount == 1:
+            db.commit()
+            return job_id
+    db.commit()
+    return None
+
+
+def retry_delay(attempts: int) -> float:
+    delay = min(settings.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.JOB_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def run_job(job_id: int) -> None:
+    """Execute a claimed job and record success, retry or failure."""
+    db = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).one()
+        registered = _handlers.get(job.job_type)
+        started = time.perf_counter()
+        try:
+            if registered is None:
+                raise RuntimeError(f"No handler registered for job type {job.job_type}")
+            registered.func(db, job.payload)
+            db.commit()
+        except Exception:
+            db.rollback()
+            error = traceback.format_exc()
+            job = db.query(Job).filter(Job.id == job_id).one()
+            job.last_error = error[-4000:]
+            job.locked_by = None
+            job.locked_at = None
+            if job.attempts < job.max_attempts:
+                delay = retry_delay(job.attempts)
+                job.status = QUEUED
+                job.run_after = _utcnow() + timedelta(seconds=delay)
+                logger.warning(f"Job {job.id} ({job.job_type}) failed, retrying in {delay:.0f}s")
+            else:
+                job.status = FAILED
+                job.finished_at = _utcnow()
+                logger.error(f"Job {job.id} ({job.job_type}) failed permanently:\n{error}")
+            db.commit()
+            return
+
+        job.status = DONE
+        job.finished_at = _utcnow()
+        job.locked_by = None
+        job.locked_at = None
+        db.commit()
+        logger.info(f"Job {job.id} ({job.job_type}) done in {(time.perf_counter() - started) * 1000:.1f} ms")
+    finally:
+        db.close()
+
+
+def requeue_stale(db: Session) -> int:
+    """
+    Return jobs whose worker vanished mid-run to the queue. Jobs that have
+    used up their attempts (e.g. one that kills its worker every time) fail
+    instead of being requeued forever.
+    """
+    now = _utcnow()
+    stale = (Job.status == RUNNING) & (Job.locked_at < now - timedelta(seconds=settings.JOB_VISIBILITY_TIMEOUT_SECONDS))
+    failed = db.execute(
+        update(Job)
+        .where(stale, Job.attempts >= Job.max_attempts)
+        .values(
+            status=FAILED, locked_by=None, locked_at=None, finished_at=now,
+            last_error=f"Worker stopped responding (no result after {settings.JOB_VISIBILITY_TIMEOUT_SECONDS}s)",
+        )
+    )
+    requeued = db.execute(
+        update(Job)
+        .where(stale)
+        .values(status=QUEUED, locked_by=None, locked_at=None, run_after=now)
+    )
+    db.commit()
+    if failed.rowcount:
+        logger.error(f"Failed {failed.rowcount} stale jobs that used up their attempts")
+    if requeued.rowcount:
+        logger.warning(f"Requeued {requeued.rowcount} stale jobs")
+    return requeued.rowcount
+
+
+def purge_finished(db: Session) -> int:
+    cutoff = _utcnow() - timedelta(days=settings.JOB_RETENTION_DAYS)
+    deleted = db.query(Job)\
+        .filter(Job.status.in_([DONE, FAILED]), Job.finished_at < cutoff)\
+        .delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+@scheduler.every(3600)
+def purge_finished_jobs_task() -> None:
+    db = SessionLocal()
+    try:
+        purge_finished(db)
+    finally:
+        db.close()
+
+
+def queue_stats(db: Session) -> dict:
+    """Queue depth, oldest waiting job and recent wait/run latency per job type."""
+    now = _utcnow()
+    counts: Dict[str, Dict[str, int]] = {}
+    for job_type, status, count in db.query(Job.job_type, Job.status, func.count(Job.id))\
+            .group_by(Job.job_type, Job.status).all():
+        counts.setdefault(job_type, {})[status] = count
+
+    oldest = dict(
+        db.query(Job.job_type, func.min(Job.created_at))
+        .filter(Job.status == QUEUED)
+        .group_by(Job.job_type)
+        .all()
+    )
+
+    recent = db.query(Job.job_type, Job.created_at, Job.started_at, Job.finished_at)\
+        .filter(Job.status == DONE, Job.finished_at >= now - timedelta(hours=1))\
+        .all()
+    latencies: Dict[str, Dict[str, list]] = {}
+    for job_type, created_at, started_at, finished_at in recent:
+        bucket = latencies.setdefault(job_type, {"wait": [], "run": []})
+        bucket["wait"].append((_aware(started_at) - _aware(created_at)).total_seconds())
+        bucket["run"].append((_aware(finished_at) - _aware(started_at)).total_seconds())
+
+    def avg(values: list) -> Optional[float]:
+        return round(sum(values) / len(values), 3) if values else None
+
+    stats = {}
+    for job_type in sorted(set(counts) | set(_handlers)):
+        by_status = counts.get(job_type, {})
+        bucket = latencies.get(job_type, {"wait": [], "run": []})
+        oldest_at = _aware(oldest.get(job_type))
+        registered = _handlers.get(job_type)
+        stats[job_type] = {
+            "queued": by_status.get(QUEUED, 0),
+            "running": by_status.get(RUNNING, 0),
+            "failed": by_status.get(FAILED, 0),
+            "done_last_hour": len(bucket["run"]),
+            "oldest_queued_seconds": (now - oldest_at).total_seconds() if oldest_at else None,
+            "avg_wait_seconds": avg(bucket["wait"]),
+            "avg_run_seconds": avg(bucket["run"]),
+            "concurrency": registered.concurrency if registered else None,
+        }
+    return stats
+
+
+class Worker:
+    """Polls the queue and runs jobs on a small thread pool."""
+
+    def __init__(self, threads: int = None, worker_id: str = None):
+        self.threads = threads or settings.JOB_WORKER_THREADS
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="job")
+        self._slots = threading.Semaphore(self.threads)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _execute(self, job_id: int) -> None:
+        try:
+            run_job(job_id)
+        except Exception:
+            logger.error(f"Worker crashed while running job {job_id}", exc_info=True)
+        finally:
+            self._slots.release()
+
+    def _claim(self) -> Optional[int]:
+        db = SessionLocal()
+        try:
+            return claim_next(db, self.worker_id)
+        finally:
+            db.close()
+
+    def _requeue_stale(self) -> None:
+        db = SessionLocal()
+        try:
+            requeue_stale(db)
+        finally:
+            db.close()
+
+    def run_forever(self) -> None:
+        load_handlers()
+        logger.info(f"Job worker {self.worker_id} started with {self.threads} threads")
+        last_reap = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() - last_reap > 60:
+                    self._requeue_stale()
+                    last_reap = time.monotonic()
+
+                if not self._slots.acquire(timeout=settings.JOB_POLL_INTERVAL_SECONDS):
+                    continue
+                try:
+                    job_id = self._claim()
+                except Exception:
+                    self._slots.release()
+                    raise
+                if job_id is None:
+                    self._slots.release()
+                    self._stop.wait(settings.JOB_POLL_INTERVAL_SECONDS)
+                    continue
+                self._executor.submit(self._execute, job_id)
+            except Exception:
+                logger.error("Job worker loop error", exc_info=True)
+                self._stop.wait(settings.JOB_POLL_INTERVAL_SECONDS)
+
+        self._executor.shutdown(wait=True)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.run_forever, name="job-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
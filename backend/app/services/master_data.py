@@ -0,0 +1,333 @@
+"""
+Bulk import / export of a clinic's master data.
+
+Setting up or migrating a site used to mean one admin request (and one
+transaction) per staff member, toilet, checkpoint and setting. A batch
+carries all of them:
+
+    {
+      "staff": [{"icon_code": "cat", "internal_name": "..."}, {"id": 3, "display_order": 2}],
+      "toilets": [...], "major_checkpoints": [...], "settings": [{"key": "...", "value": "..."}],
+      "order": {"staff": [3, 1, 2]},
+      "deactivate": {"staff": [4]}
+    }
+
+Upserts name the row by id, or without an id by its natural key (staff:
+icon_code, toilets / checkpoints: name, settings: key); unmatched rows are
+created. Checkpoints can point at a toilet by `target_toilet_name`, so a
+batch exported without ids can be loaded into another clinic.
+
+The whole batch is validated first against the clinic's rows (one SELECT per
+table) and every problem is reported at once. It is then written with
+set-based statements in the caller's transaction: executemany INSERTs and
+UPDATEs grouped by the columns they set, and one UPDATE ... IN per
+deactivation list.
+"""
+import logging
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.core import events
+from app.models import ClinicConfig, MajorCheckpoint, Staff, Toilet
+from app.schemas import BulkRequest
+from app.services import clinic_settings
+
+logger = logging.getLogger(__name__)
+
+KINDS = {"staff": Staff, "toilets": Toilet, "major_checkpoints": MajorCheckpoint}
+EVENT_KINDS = {"staff": "staff", "toilets": "toilet", "major_checkpoints": "major_checkpoint"}
+NATURAL_KEYS = {"staff": "icon_code", "toilets": "name", "major_checkpoints": "name"}
+REQUIRED = {
+    "staff": ("internal_name", "icon_code"),
+    "toilets": ("name",),
+    "major_checkpoints": ("name", "start_time", "end_time"),
+}
+COLUMNS = {
+    "staff": ("internal_name", "icon_code", "display_order", "is_active"),
+    "toilets": ("name", "floor", "is_active"),
+    "major_checkpoints": ("name", "start_time", "end_time", "target_toilet_id", "is_active", "display_order"),
+}
+CREATE_DEFAULTS = {  # same as the single-row create schemas
+    "staff": {"display_order": 0, "is_active": True},
+    "toilets": {"is_active": True},
+    "major_checkpoints": {"is_active": True, "display_order": 0},
+}
+MAX_TOILETS = 2
+MAX_SETTING_LENGTH = 500
+
+
+class BulkValidationError(ValueError):
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+@dataclass
+class BulkResult:
+    created: Dict[str, int] = field(default_factory=dict)
+    updated: Dict[str, int] = field(default_factory=dict)
+    reordered: Dict[str, int] = field(default_factory=dict)
+    deactivated: Dict[str, int] = field(default_factory=dict)
+    applied: bool = False
+    elapsed_ms: float = 0.0
+
+
+@dataclass
+class _Plan:
+    creates: Dict[str, List[dict]] = field(default_factory=lambda: defaultdict(list))
+    updates: Dict[str, List[Tuple[int, dict]]] = field(default_factory=lambda: defaultdict(list))
+    target_names: Dict[int, str] = field(default_factory=dict)  # index of a checkpoint create -> toilet name
+    target_names_by_id: Dict[int, str] = field(default_factory=dict)  # checkpoint id -> toilet name
+    settings_new: List[dict] = field(default_factory=list)
+    settings_changed: List[dict] = field(default_factory=list)
+
+
+def _existing(db: Session, kind: str, clinic_id: int) -> Dict[int, dict]:
+    model = KINDS[kind]
+    names = ("id",) + COLUMNS[kind]
+    stmt = select(*[getattr(model, n) for n in names]).where(model.clinic_id == clinic_id)
+    return {row[0]: dict(zip(names, row)) for row in db.execute(stmt)}
+
+
+def _plan_upserts(kind: str, items: list, existing: Dict[int, dict], plan: _Plan, errors: List[str]) -> None:
+    key = NATURAL_KEYS[kind]
+    by_key = defaultdict(list)
+    for row_id, row in existing.items():
+        by_key[row[key]].append(row_id)
+    seen = set()
+    for i, item in enumerate(items):
+        where = f"{kind}[{i}]"
+        values = item.model_dump(include=set(COLUMNS[kind]) & item.model_fields_set)
+        row_id = item.id
+        if row_id is None and values.get(key) is not None:
+            matches = by_key.get(values[key], [])
+            if len(matches) > 1:
+                errors.append(f"{where}: {key} {values[key]!r} matches {len(matches)} rows, give the id")
+                continue
+            row_id = matches[0] if matches else None
+        if row_id is not None:
+            if row_id not in existing:
+                errors.append(f"{where}: id {row_id} not found")
+                continue
+            if row_id in seen:
+                errors.append(f"{where}: id {row_id} appears more than once")
+                continue
+            seen.add(row_id)
+            missing = [n for n in REQUIRED[kind] if n in values and values[n] is None]
+            if missing:
+                errors.append(f"{where}: {', '.join(missing)} cannot be null")
+                continue
+            if kind == "major_checkpoints" and item.target_toilet_name is not None:
+                plan.target_names_by_id[row_id] = item.target_toilet_name
+            plan.updates[kind].append((row_id, values))
+        else:
+            missing = [n for n in REQUIRED[kind] if values.get(n) is None]
+            if missing:
+                errors.append(f"{where}: {', '.join(missing)} required for a new row")
+                continue
+            if kind == "major_checkpoints" and item.target_toilet_name is not None:
+                plan.target_names[len(plan.creates[kind])] = item.target_toilet_name
+            row = dict(CREATE_DEFAULTS[kind])
+            row.update(values)
+            plan.creates[kind].append({n: row.get(n) for n in COLUMNS[kind]})
+
+
+def _final(kind: str, existing: Dict[int, dict], plan: _Plan) -> List[dict]:
+    """Rows of the kind as they will be after the upserts."""
+    rows = {row_id: dict(row) for row_id, row in existing.items()}
+    for row_id, values in plan.updates[kind]:
+        rows[row_id].update(values)
+    return list(rows.values()) + plan.creates[kind]
+
+
+def _check_ids(where: str, ids: List[int], existing: Dict[int, dict], errors: List[str]) -> None:
+    unknown = sorted(set(ids) - set(existing))
+    if unknown:
+        errors.append(f"{where}: ids not found: {unknown}")
+    duplicated = sorted(i for i, n in Counter(ids).items() if n > 1)
+    if duplicated:
+        errors.append(f"{where}: ids appear more than once: {duplicated}")
+
+
+def validate(db: Session, batch: BulkRequest, clinic_id: int) -> _Plan:
+    """Plan of the writes; BulkValidationError listing every problem of the batch."""
+    errors: List[str] = []
+    plan = _Plan()
+    existing = {kind: _existing(db, kind, clinic_id) for kind in KINDS}
+    for kind in KINDS:
+        _plan_upserts(kind, getattr(batch, kind), existing[kind], plan, errors)
+
+    icons = Counter(row["icon_code"] for row in _final("staff", existing["staff"], plan))
+    for icon, n in icons.items():
+        if n > 1:
+            errors.append(f"staff: icon_code {icon!r} used by {n} staff")
+
+    toilets = _final("toilets", existing["toilets"], plan)
+    if len(toilets) > MAX_TOILETS:
+        errors.append(f"toilets: max {MAX_TOILETS} toilets allowed, the batch would leave {len(toilets)}")
+    toilet_names = Counter(row["name"] for row in toilets)
+    for i, item in enumerate(batch.major_checkpoints):
+        where = f"major_checkpoints[{i}]"
+        if item.target_toilet_name is not None:
+            if "target_toilet_id" in item.model_fields_set:
+                errors.append(f"{where}: give target_toilet_id or target_toilet_name, not both")
+            elif toilet_names[item.target_toilet_name] != 1:
+                errors.append(f"{where}: target_toilet_name {item.target_toilet_name!r} "
+                              f"matches {toilet_names[item.target_toilet_name]} toilets")
+        elif item.target_toilet_id is not None and item.target_toilet_id not in existing["toilets"]:
+            errors.append(f"{where}: target toilet {item.target_toilet_id} not found")
+
+    stored = dict(db.execute(
+        select(ClinicConfig.key, ClinicConfig.value).where(ClinicConfig.clinic_id == clinic_id)
+    ).all())
+    keys = Counter(s.key for s in batch.settings)
+    for key, n in keys.items():
+        if n > 1:
+            errors.append(f"settings: key {key!r} appears {n} times")
+    for i, setting in enumerate(batch.settings):
+        try:
+            clinic_settings.validate(setting.key, setting.value)
+        except ValueError as e:
+            errors.append(f"settings[{i}]: {e}")
+            continue
+        if len(setting.value) > MAX_SETTING_LENGTH:
+            errors.append(f"settings[{i}]: value longer than {MAX_SETTING_LENGTH} characters")
+        elif setting.key not in stored:
+            plan.settings_new.append({"key": setting.key, "value": setting.value})
+        elif stored[setting.key] != setting.value:
+            plan.settings_changed.append({"key": setting.key, "value": setting.value})
+
+    for kind in ("staff", "major_checkpoints"):
+        ids = getattr(batch.order, kind)
+        if ids:
+            _check_ids(f"order.{kind}", ids, existing[kind], errors)
+    for kind in KINDS:
+        _check_ids(f"deactivate.{kind}", getattr(batch.deactivate, kind), existing[kind], errors)
+
+    if errors:
+        raise BulkValidationError(errors)
+    return plan
+
+
+def _update_rows(db: Session, model, clinic_id: int, updates: List[Tuple[int, dict]]) -> None:
+    """executemany UPDATEs, one per set of columns."""
+    groups = defaultdict(list)
+    for row_id, values in updates:
+        if values:
+            groups[tuple(sorted(values))].append(dict({f"b_{n}": v for n, v in values.items()}, b_id=row_id))
+    table = model.__table__
+    for names, params in groups.items():
+        stmt = update(table)\
+            .where(table.c.id == bindparam("b_id"), table.c.clinic_id == clinic_id)\
+            .values({n: bindparam(f"b_{n}") for n in names})
+        db.execute(stmt, params)
+
+
+def reorder(db: Session, model, clinic_id: int, ids: List[int]) -> None:
+    """display_order = position + 1 for the clinic's rows among ids (others are ignored), in one executemany."""
+    if not ids:
+        return
+    table = model.__table__
+    stmt = update(table)\
+        .where(table.c.id == bindparam("b_id"), table.c.clinic_id == clinic_id)\
+        .values(display_order=bindparam("b_order"))
+    db.execute(stmt, [{"b_id": row_id, "b_order": index + 1} for index, row_id in enumerate(ids)])
+
+
+def apply(db: Session, batch: BulkRequest, clinic_id: int, dry_run: bool = False) -> BulkResult:
+    """Validate and write the batch; the caller commits."""
+    started = time.perf_counter()
+    plan = validate(db, batch, clinic_id)
+    result = BulkResult(
+        created={kind: len(plan.creates[kind]) for kind in KINDS},
+        updated={kind: len(plan.updates[kind]) for kind in KINDS},
+        reordered={kind: len(getattr(batch.order, kind) or []) for kind in ("staff", "major_checkpoints")},
+        deactivated={kind: len(getattr(batch.deactivate, kind)) for kind in KINDS},
+        applied=not dry_run,
+    )
+    result.created["settings"] = len(plan.settings_new)
+    result.updated["settings"] = len(plan.settings_changed)
+    if dry_run:
+        result.elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    # Toilets first: checkpoints may refer to new ones by name
+    _update_rows(db, Toilet, clinic_id, plan.updates["toilets"])
+    if plan.creates["toilets"]:
+        db.execute(insert(Toilet.__table__), [dict(row, clinic_id=clinic_id) for row in plan.creates["toilets"]])
+    if plan.target_names or plan.target_names_by_id:
+        toilet_ids = dict(db.execute(select(Toilet.name, Toilet.id).where(Toilet.clinic_id == clinic_id)).all())
+        for index, name in plan.target_names.items():
+            plan.creates["major_checkpoints"][index]["target_toilet_id"] = toilet_ids[name]
+        for row_id, values in plan.updates["major_checkpoints"]:
+            if row_id in plan.target_names_by_id:
+                values["target_toilet_id"] = toilet_ids[plan.target_names_by_id[row_id]]
+
+    # icon_code is unique per clinic: changed codes are parked first so that swaps go through
+    existing_icons = dict(db.execute(
+        select(Staff.id, Staff.icon_code).where(Staff.clinic_id == clinic_id)
+    ).all())
+    _update_rows(db, Staff, clinic_id, [
+        (row_id, {"icon_code": f"~{row_id}"}) for row_id, values in plan.updates["staff"]
+        if "icon_code" in values and values["icon_code"] != existing_icons[row_id]
+    ])
+    _update_rows(db, Staff, clinic_id, plan.updates["staff"])
+    _update_rows(db, MajorCheckpoint, clinic_id, plan.updates["major_checkpoints"])
+    for kind in ("staff", "major_checkpoints"):
+        if plan.creates[kind]:
+            db.execute(insert(KINDS[kind].__table__), [dict(row, clinic_id=clinic_id) for row in plan.creates[kind]])
+
+    if plan.settings_changed:
+        table = ClinicConfig.__table__
+        stmt = update(table)\
+            .where(table.c.key == bindparam("b_key"), table.c.clinic_id == clinic_id)\
+            .values(value=bindparam("b_value"))
+        db.execute(stmt, [{"b_key": row["key"], "b_value": row["value"]} for row in plan.settings_changed])
+    if plan.settings_new:
+        db.execute(insert(ClinicConfig.__table__), [dict(row, clinic_id=clinic_id) for row in plan.settings_new])
+
+    for kind in ("staff", "major_checkpoints"):
+        reorder(db, KINDS[kind], clinic_id, getattr(batch.order, kind) or [])
+    for kind, model in KINDS.items():
+        ids = getattr(batch.deactivate, kind)
+        if ids:
+            table = model.__table__
+            db.execute(update(table).where(table.c.id.in_(ids), table.c.clinic_id == clinic_id).values(is_active=False))
+
+    for kind in KINDS:
+        if result.created[kind] or result.updated[kind] or result.deactivated[kind] or result.reordered.get(kind):
+            events.publish(db, events.MASTER_DATA_CHANGED, {"kind": EVENT_KINDS[kind], "clinic_id": clinic_id})
+    for row in plan.settings_new + plan.settings_changed:
+        events.publish(db, events.CONFIG_CHANGED, {"key": row["key"], "clinic_id": clinic_id})
+
+    result.elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(f"Bulk master data for clinic {clinic_id}: created {result.created}, updated {result.updated}, "
+                f"deactivated {result.deactivated} in {result.elapsed_ms:.0f} ms")
+    return result
+
+
+def export(db: Session, clinic_id: int, with_ids: bool = True) -> dict:
+    """The clinic's master data as a batch; without ids it can be loaded into another clinic."""
+    toilets = _existing(db, "toilets", clinic_id)
+    batch = {"settings": [
+        {"key": key, "value": value} for key, value in db.execute(
+            select(ClinicConfig.key, ClinicConfig.value)
+            .where(ClinicConfig.clinic_id == clinic_id).order_by(ClinicConfig.key)
+        )
+    ]}
+    for kind in KINDS:
+        rows = toilets if kind == "toilets" else _existing(db, kind, clinic_id)
+        ordered = sorted(rows.values(), key=lambda row: (row.get("display_order") or 0, row["id"]))
+        for row in ordered:
+            if not with_ids:
+                row.pop("id")
+                if kind == "major_checkpoints":
+                    target = row.pop("target_toilet_id")
+                    row["target_toilet_name"] = toilets[target]["name"] if target else None
+        batch[kind] = ordered
+    return batch
@@ -0,0 +1,155 @@
+import logging
+import threading
+from collections import deque
+from typing import Deque, Dict, NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core import events
+from app.core.config import settings
+from app.models import CheckImage, ImageBlob, ToiletCheck
+from app.services import jobs
+
+logger = logging.getLogger(__name__)
+
+
+class IndexedImage(NamedTuple):
+    phash: int
+    image_id: int
+    check_id: int
+
+
+class NearDuplicateMatch(NamedTuple):
+    image_id: int
+    check_id: int
+    distance: int
+
+
+class NearDuplicateIndex:
+    """
+    In-memory index of the most recent perceptual hashes per toilet.
+
+    Each toilet keeps a bounded window (NEAR_DUPLICATE_WINDOW) of 64-bit
+    hashes; a lookup is a linear scan of XOR + popcount over plain ints,
+    which stays well under a millisecond for a few hundred entries.
+    The window is warmed from the database the first time a toilet is seen.
+    """
+
+    def __init__(self, window: int, max_distance: int):
+        self.window = window
+        self.max_distance = max_distance
+        self._entries: Dict[int, Deque[IndexedImage]] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, db: Session, toilet_id: int) -> Deque[IndexedImage]:
+        rows = db.query(CheckImage.id, CheckImage.check_id, ImageBlob.phash)\
+            .join(ImageBlob, CheckImage.blob_id == ImageBlob.id)\
+            .join(ToiletCheck, CheckImage.check_id == ToiletCheck.id)\
+            .filter(ToiletCheck.toilet_id == toilet_id, ImageBlob.phash.isnot(None))\
+            .order_by(CheckImage.id.desc())\
+            .limit(self.window)\
+            .all()
+        entries: Deque[IndexedImage] = deque(maxlen=self.window)
+        for image_id, check_id, phash in reversed(rows):
+            entries.append(IndexedImage(int(phash, 16), image_id, check_id))
+        return entries
+
+    def _toilet_entries(self, db: Session, toilet_id: int) -> Deque[IndexedImage]:
+        entries = self._entries.get(toilet_id)
+        if entries is None:
+            entries = self._load(db, toilet_id)
+            self._entries[toilet_id] = entries
+        return entries
+
+    def find(self, db: Session, toilet_id: int, phash: str, exclude_check_id: Optional[int] = None) -> Optional[NearDuplicateMatch]:
+        """Closest earlier image of this toilet within max_distance, if any."""
+        value = int(phash, 16)
+        with self._lock:
+            entries = list(self._toilet_entries(db, toilet_id))
+
+        best: Optional[NearDuplicateMatch] = None
+        for entry in entries:
+            if entry.check_id == exclude_check_id:
+                continue
+            distance = (value ^ entry.phash).bit_count()
+            if distance <= self.max_distance and (best is None or distance < best.distance):
+                best = NearDuplicateMatch(entry.image_id, entry.check_id, distance)
+                if distance == 0:
+                    break
+        return best
+
+    def add(self, db: Session, toilet_id: int, phash: str, image_id: int, check_id: int) -> None:
+        with self._lock:
+            entries = self._toilet_entries(db, toilet_id)
+            # A freshly warmed window may already contain this image
+            if any(e.image_id == image_id for e in entries):
+                return
+            entries.append(IndexedImage(int(phash, 16), image_id, check_id))
+
+    def add_if_loaded(self, toilet_id: int, phash: str, image_id: int, check_id: int) -> None:
+        """Index an image recorded elsewhere; windows not warmed yet will read it from the database."""
+        with self._lock:
+            entries = self._entries.get(toilet_id)
+            if entries is None or any(e.image_id == image_id for e in entries):
+                return
+            entries.append(IndexedImage(int(phash, 16), image_id, check_id))
+
+    def clear(self, toilet_id: Optional[int] = None) -> None:
+        with self._lock:
+            if toilet_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(toilet_id, None)
+
+
+near_duplicate_index = NearDuplicateIndex(
+    window=settings.NEAR_DUPLICATE_WINDOW,
+    max_distance=settings.NEAR_DUPLICATE_MAX_DISTANCE,
+)
+
+
+@events.subscribe(events.CHECK_CREATED)
+def _index_new_check(payload: dict) -> None:
+    # The near-duplicate job of a later check may run in any process: keep every index current
+    for image_id, phash in payload.get("images") or []:
+        near_duplicate_index.add_if_loaded(payload["toilet_id"], phash, image_id, payload["check_id"])
+
+
+@events.subscribe(events.CHECKS_CHANGED)
+def _reset_index(payload: dict) -> None:
+    # Bulk changes (archival, repair) may have removed indexed images
+    near_duplicate_index.clear()
+
+
+@events.subscribe(events.MASTER_DATA_CHANGED)
+def _reset_toilet(payload: dict) -> None:
+    if payload.get("kind") == "toilet":
+        near_duplicate_index.clear(payload.get("id"))
+
+
+def flag_near_duplicate(db: Session, toilet_id: int, image: CheckImage, phash: Optional[str]) -> None:
+    """Record the closest earlier match on the image, then index it."""
+    if not phash:
+        return
+    match = near_duplicate_index.find(db, toilet_id, phash, exclude_check_id=image.check_id)
+    if match:
+        image.near_duplicate_of_id = match.image_id
+        image.near_duplicate_distance = match.distance
+    near_duplicate_index.add(db, toilet_id, phash, image.id, image.check_id)
+
+
+@jobs.handler("images.near_duplicates", concurrency=1)
+def flag_check_near_duplicates(db: Session, payload: dict) -> None:
+    """Job: compare each image of a newly recorded check with the toilet's recent images."""
+    check = db.query(ToiletCheck).filter(ToiletCheck.id == payload["check_id"]).first()
+    if not check:
+        return
+    for image in sorted(check.images, key=lambda x: x.order_index):
+        if image.near_duplicate_of_id is not None or image.blob is None:
+            continue
+        flag_near_duplicate(db, check.toilet_id, image, image.blob.phash)
+        if image.near_duplicate_of_id:
+            logger.warning(
+                f"Check {check.id}: image {image.order_index} ({image.image_type}) is a near-duplicate of "
+                f"image {image.near_duplicate_of_id} (distance {image.near_duplicate_distance})"
+            )
@@ -0,0 +1,165 @@
+"""
+Archival of cold check history.
+
+Checks of whole JST months older than ARCHIVE_AFTER_MONTHS are moved, with
+their images, to `toilet_checks_archive` / `check_images_archive` (keeping
+their ids) in batches, so `toilet_checks` / `check_images` and their indexes
+stay small. Archival moves rows; `toilet_checks` is a plain table (declarative
+partitioning would need checked_at in its primary key and in every foreign
+key that references a check).
+
+Day and range reads go through `fetch_checks`, which filters on a
+`checked_at` range (so the index is used) and only touches the archive when
+it holds checks in the queried range. Live rows are not assumed to be newer
+than the archive: a backfilled or late check stays live until the next
+maintenance run.
+"""
+import logging
+from datetime import date, datetime, timezone
+from typing import List, Optional, Type, Union
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from app.core import events, scheduler
+from app.core.config import settings
+from app.core.timeutil import JST
+from app.db.session import SessionLocal
+from app.models import CheckImage, CheckImageArchive, ToiletCheck, ToiletCheckArchive, UploadSession
+from app.services import snapshots
+
+logger = logging.getLogger(__name__)
+
+CheckModel = Union[Type[ToiletCheck], Type[ToiletCheckArchive]]
+
+
+def _aware(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is not None and dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def add_months(month: date, months: int) -> date:
+    """First day of the month `months` after the month of `month`."""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_start_utc(month: date) -> datetime:
+    """00:00 JST on the first day of the month, in UTC."""
+    return datetime(month.year, month.month, 1, tzinfo=JST).astimezone(timezone.utc)
+
+
+def archive_cutoff(today: date) -> datetime:
+    """Checks before this instant belong to archived months."""
+    return month_start_utc(add_months(today, -settings.ARCHIVE_AFTER_MONTHS))
+
+
+# --- Reads ---
+
+def check_models_for_range(db: Session, start_utc: datetime, end_utc: datetime) -> List[CheckModel]:
+    """Tables holding checks in [start_utc, end_utc): the archive (if it has any in range) and the live table."""
+    archived = db.query(ToiletCheckArchive.id)\
+        .filter(ToiletCheckArchive.checked_at >= start_utc, ToiletCheckArchive.checked_at < end_utc)\
+        .limit(1)\
+        .first()
+    return [ToiletCheckArchive, ToiletCheck] if archived else [ToiletCheck]
+
+
+def fetch_checks(
+    db: Session,
+    start_utc: datetime,
+    end_utc: datetime,
+    toilet_id: Optional[int] = None,
+    newest_first: bool = False,
+    clinic_id: Optional[int] = None,
+) -> list:
+    """Checks in [start_utc, end_utc) from the live and, if needed, archive tables (of one clinic if given)."""
+    checks = []
+    for model in check_models_for_range(db, start_utc, end_utc):
+        query = db.query(model)\
+            .options(selectinload(model.images), joinedload(model.staff))\
+            .filter(model.checked_at >= start_utc, model.checked_at < end_utc)
+        if clinic_id is not None:
+            query = query.filter(model.clinic_id == clinic_id)
+        if toilet_id:
+            query = query.filter(model.toilet_id == toilet_id)
+        checks.extend(query.order_by(model.checked_at, model.id).all())
+    # Both tables can hold checks of the same range (e.g. a late check not archived yet)
+    checks.sort(key=lambda check: (_aware(check.checked_at), check.id))
+    if newest_first:
+        checks.reverse()
+    return checks
+
+
+# --- Archive tables ---
+
+def archive_before(db: Session, cutoff_utc: datetime) -> int:
+    """Move checks older than the cutoff (and their images) to the archive tables."""
+    checks = ToiletCheck.__table__
+    images = CheckImage.__table__
+    check_columns = [c.name for c in checks.columns]
+    image_columns = [c.name for c in images.columns]
+    moved = 0
+
+    while True:
+        ids = db.execute(
+            select(checks.c.id)
+            .where(checks.c.checked_at < cutoff_utc)
+            .order_by(checks.c.checked_at)
+            .limit(settings.ARCHIVE_BATCH_SIZE)
+        ).scalars().all()
+        if not ids:
+            break
+
+        db.execute(insert(ToiletCheckArchive.__table__).from_select(
+            check_columns, select(*[checks.c[name] for name in check_columns]).where(checks.c.id.in_(ids))
+        ))
+        db.execute(insert(CheckImageArchive.__table__).from_select(
+            image_columns, select(*[images.c[name] for name in image_columns]).where(images.c.check_id.in_(ids))
+        ))
+
+        # Live rows must not keep foreign keys to the rows being moved
+        moved_images = select(images.c.id).where(images.c.check_id.in_(ids))
+        db.execute(
+            update(images)
+            .where(images.c.near_duplicate_of_id.in_(moved_images), images.c.check_id.notin_(ids))
+            .values(near_duplicate_of_id=None, near_duplicate_distance=None)
+        )
+        db.execute(
+            update(UploadSession.__table__)
+            .where(UploadSession.__table__.c.check_id.in_(ids))
+            .values(check_id=None)
+        )
+        db.execute(delete(images).where(images.c.check_id.in_(ids)))
+        db.execute(delete(checks).where(checks.c.id.in_(ids)))
+        db.commit()
+        moved += len(ids)
+
+    if moved:
+        # Archived images can no longer be near-duplicate targets, cached aggregates are stale
+        # (clearing near-duplicate links can change the views of days near the cutoff)
+        snapshots.invalidate(db)
+        events.publish(db, events.CHECKS_CHANGED, {"reason": "archive"})
+        db.commit()
+        logger.info(f"Archived {moved} checks older than {cutoff_utc.isoformat()}")
+    return moved
+
+
+def run_maintenance(db: Session, now_utc: Optional[datetime] = None) -> dict:
+    now_utc = now_utc or datetime.now(timezone.utc)
+    cutoff = archive_cutoff(now_utc.astimezone(JST).date())
+    archived = archive_before(db, cutoff)
+    return {
+        "archive_cutoff": cutoff.isoformat(),
+        "archived_checks": archived,
+    }
+
+
+@scheduler.every(settings.PARTITION_MAINTENANCE_INTERVAL_SECONDS)
+def partition_maintenance_task() -> None:
+    db = SessionLocal()
+    try:
+        run_maintenance(db)
+    finally:
+        db.close()
@@ -0,0 +1,234 @@
+"""
+Check interval classification and bulk reclassification of history.
+
+`interval_sec_from_prev` and `status_type` are frozen into each ToiletCheck
+at insert time. When the thresholds change (or rows were inserted out of
+order), `reclassify` recomputes both for every check: timestamps are pulled
+per toilet as NumPy arrays, intervals and classes are computed vectorized,
+and only the rows that differ are written back in batched executemany
+UPDATEs. Archived history (toilet_checks_archive) is left as it was, but
+the first live check of a toilet measures its interval from the newest
+archived check before it.
+"""
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session
+
+from app.core import events
+from app.core.config import settings
+from app.models import ToiletCheck, ToiletCheckArchive
+from app.services import snapshots
+
+logger = logging.getLogger(__name__)
+
+STATUS_CODES = ["NORMAL", "TOO_SHORT", "TOO_LONG"]
+NO_INTERVAL = -1  # stands in for NULL (first check of a toilet)
+FETCH_BATCH = 100_000
+UPDATE_BATCH = 10_000
+
+
+def classify_interval(interval_sec: Optional[int], too_short_sec: int = None, too_long_sec: int = None) -> str:
+    # < TOO_SHORT (45 min) -> TOO_SHORT
+    # TOO_SHORT..TOO_LONG -> NORMAL
+    # > TOO_LONG (90 min) -> TOO_LONG
+    too_short_sec = settings.CHECK_INTERVAL_TOO_SHORT_SEC if too_short_sec is None else too_short_sec
+    too_long_sec = settings.CHECK_INTERVAL_TOO_LONG_SEC if too_long_sec is None else too_long_sec
+    if interval_sec is None:
+        return "NORMAL"
+    if interval_sec < too_short_sec:
+        return "TOO_SHORT"
+    if interval_sec > too_long_sec:
+        return "TOO_LONG"
+    return "NORMAL"
+
+
+def classify_intervals(intervals: np.ndarray, too_short_sec: int, too_long_sec: int) -> np.ndarray:
+    """Vectorized classify_interval; returns indexes into STATUS_CODES."""
+    codes = np.zeros(len(intervals), dtype=np.int8)
+    has_prev = intervals != NO_INTERVAL
+    codes[has_prev & (intervals < too_short_sec)] = 1
+    codes[has_prev & (intervals > too_long_sec)] = 2
+    return codes
+
+
+def epoch_seconds(db: Session, column):
+    if db.get_bind().dialect.name == "postgresql":
+        return func.extract("epoch", column)
+    # SQLite: julian day -> unix seconds; a double holds a julian day to ~40 us,
+    # so round to ms or whole-second intervals can truncate to one second less
+    return func.round((func.julianday(column) - 2440587.5) * 86400.0, 3)
+
+
+def _archived_predecessors(db: Session, toilet_id: Optional[int], clinic_id: Optional[int]) -> Dict[int, float]:
+    """Per toilet: epoch of the newest archived check before its oldest live check."""
+    archive = ToiletCheckArchive
+    oldest_live = select(func.min(ToiletCheck.checked_at))\
+        .where(ToiletCheck.toilet_id == archive.toilet_id)\
+        .scalar_subquery()
+    stmt = select(archive.toilet_id, epoch_seconds(db, func.max(archive.checked_at)))\
+        .where(archive.checked_at < oldest_live)\
+        .group_by(archive.toilet_id)
+    if clinic_id is not None:
+        stmt = stmt.where(archive.clinic_id == clinic_id)
+    if toilet_id:
+        stmt = stmt.where(archive.toilet_id == toilet_id)
+    return {toilet: epoch for toilet, epoch in db.execute(stmt)}
+
+
+@dataclass
+class ReclassifyResult:
+    total: int
+    changed: int
+    interval_changed: int
+    transitions: Dict[str, int]
+    samples: List[dict] = field(default_factory=list)
+    applied: bool = False
+    elapsed_ms: float = 0.0
+    changed_days: List[str] = field(default_factory=list)
+
+
+def reclassify(
+    db: Session,
+    dry_run: bool = True,
+    toilet_id: Optional[int] = None,
+    too_short_sec: Optional[int] = None,
+    too_long_sec: Optional[int] = None,
+    sample_limit: int = 50,
+    clinic_id: Optional[int] = None,
+) -> ReclassifyResult:
+    """
+    Recompute intervals and classes. With dry_run=False the changed rows are
+    updated, the affected snapshots dropped and CHECKS_CHANGED published, all
+    in the caller's transaction: the caller commits.
+    """
+    started = time.perf_counter()
+    too_short_sec = settings.CHECK_INTERVAL_TOO_SHORT_SEC if too_short_sec is None else too_short_sec
+    too_long_sec = settings.CHECK_INTERVAL_TOO_LONG_SEC if too_long_sec is None else too_long_sec
+
+    stmt = select(
+        ToiletCheck.id,
+        ToiletCheck.toilet_id,
+        epoch_seconds(db, ToiletCheck.checked_at),
+        ToiletCheck.interval_sec_from_prev,
+        ToiletCheck.status_type,
+    ).order_by(ToiletCheck.toilet_id, ToiletCheck.checked_at, ToiletCheck.id)
+    if clinic_id is not None:
+        stmt = stmt.where(ToiletCheck.clinic_id == clinic_id)
+    if toilet_id:
+        stmt = stmt.where(ToiletCheck.toilet_id == toilet_id)
+
+    # Column-wise load in batches (Core connection: skips ORM row processing)
+    ids, toilets, epochs, old_intervals, old_statuses = [], [], [], [], []
+    result = db.connection().execution_options(yield_per=FETCH_BATCH).execute(stmt)
+    for part in result.partitions():
+        c_id, c_toilet, c_epoch, c_interval, c_status = zip(*part)
+        ids.extend(c_id)
+        toilets.extend(c_toilet)
+        epochs.extend(c_epoch)
+        old_intervals.extend(c_interval)
+        old_statuses.extend(c_status)
+
+    n = len(ids)
+    if n == 0:
+        return ReclassifyResult(total=0, changed=0, interval_changed=0, transitions={}, applied=not dry_run)
+
+    ids_arr = np.asarray(ids, dtype=np.int64)
+    toilet_arr = np.asarray(toilets, dtype=np.int64)
+    epoch_arr = np.asarray(epochs, dtype=np.float64)
+    old_interval_arr = np.asarray(
+        [NO_INTERVAL if v is None else v for v in old_intervals], dtype=np.int64
+    )
+    old_status_arr = np.asarray(old_statuses, dtype=object)
+
+    # Interval from the previous check of the same toilet (truncated like int(timedelta.total_seconds()))
+    new_interval_arr = np.full(n, NO_INTERVAL, dtype=np.int64)
+    same_toilet = toilet_arr[1:] == toilet_arr[:-1]
+    diffs = np.trunc(np.diff(epoch_arr)).astype(np.int64)
+    new_interval_arr[1:] = np.where(same_toilet, diffs, NO_INTERVAL)
+
+    # The first live check of a toilet follows its last archived one, if any
+    predecessors = _archived_predecessors(db, toilet_id, clinic_id)
+    if predecessors:
+        for i in np.flatnonzero(np.r_[True, ~same_toilet]):
+            previous = predecessors.get(int(toilet_arr[i]))
+            if previous is not None:
+                new_interval_arr[i] = int(np.trunc(epoch_arr[i] - previous))
+
+    new_code_arr = classify_intervals(new_interval_arr, too_short_sec, too_long_sec)
+    status_names = np.asarray(STATUS_CODES, dtype=object)
+    new_status_arr = status_names[new_code_arr]
+
+    interval_changed = new_interval_arr != old_interval_arr
+    status_changed = new_status_arr != old_status_arr
+    changed = interval_changed | status_changed
+    changed_idx = np.flatnonzero(changed)
+
+    transitions: Dict[str, int] = {}
+    if status_changed.any():
+        pairs, counts = np.unique(
+            old_status_arr[status_changed].astype(str) + "->" + new_status_arr[status_changed].astype(str),
+            return_counts=True,
+        )
+        transitions = {str(p): int(c) for p, c in zip(pairs, counts)}
+
+    def to_interval(value: int) -> Optional[int]:
+        return None if value == NO_INTERVAL else int(value)
+
+    samples = [
+        {
+            "id": int(ids_arr[i]),
+            "toilet_id": int(toilet_arr[i]),
+            "old_interval": to_interval(old_interval_arr[i]),
+            "new_interval": to_interval(new_interval_arr[i]),
+            "old_status": old_status_arr[i],
+            "new_status": new_status_arr[i],
+        }
+        for i in changed_idx[:sample_limit]
+    ]
+
+    # JST days touched, so cached per-day views can be invalidated
+    jst_days = (epoch_arr[changed_idx] + 9 * 3600) // 86400
+    changed_days = [
+        str(np.datetime64(int(day), "D")) for day in np.unique(jst_days)
+    ]
+
+    if not dry_run and len(changed_idx):
+        table = ToiletCheck.__table__
+        stmt = update(table)\
+            .where(table.c.id == bindparam("b_id"))\
+            .values(interval_sec_from_prev=bindparam("b_interval"), status_type=bindparam("b_status"))
+        conn = db.connection()
+        for start in range(0, len(changed_idx), UPDATE_BATCH):
+            batch = changed_idx[start:start + UPDATE_BATCH]
+            conn.execute(stmt, [
+                {
+                    "b_id": int(ids_arr[i]),
+                    "b_interval": to_interval(new_interval_arr[i]),
+                    "b_status": new_status_arr[i],
+                }
+                for i in batch
+            ])
+        snapshots.invalidate(db, changed_days, clinic_id)
+        events.publish(db, events.CHECKS_CHANGED, {
+            "reason": "reclassify", "days": events.event_days(changed_days), "clinic_id": clinic_id,
+        })
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(
+        f"Reclassify ({'dry run' if dry_run else 'applied'}): {len(changed_idx)}/{n} rows changed in {elapsed_ms:.0f} ms"
+    )
+    return ReclassifyResult(
+        total=n,
+        changed=len(changed_idx),
+        interval_changed=int(interval_changed.sum()),
+        transitions=transitions,
+        samples=samples,
+        applied=not dry_run,
+        elapsed_ms=round(elapsed_ms, 1),
+        changed_days=changed_days,
+    )
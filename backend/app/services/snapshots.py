@@ -0,0 +1,135 @@
+"""
+Snapshots of the dashboard day view for completed JST days.
+
+Once a day is over, its DashboardDayResponse depends only on the day's
+checks and on the master data used to render it (active major checkpoints,
+staff icons). The first request for such a day stores the serialized
+response in `dashboard_snapshots`; later requests return the stored body as
+is, with an ETag, so clients revalidate with If-None-Match and get 304.
+
+- Master data: each snapshot records a digest of the definitions it was
+  built with. A request whose current digest differs rebuilds the snapshot,
+  so checkpoint or staff edits need no explicit invalidation.
+- Checks: writers that change past checks (reclassification, consistency
+  repairs, archival) call `invalidate` in their transaction.
+
+A day is only snapshotted DASHBOARD_SNAPSHOT_DELAY_SECONDS after it ends,
+so checks still replicating or late near-duplicate jobs are included.
+"""
+import hashlib
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.timeutil import day_bounds_utc
+from app.db.session import SessionLocal
+from app.models import DEFAULT_CLINIC_ID, DashboardSnapshot, MajorCheckpoint, Staff
+from app.services.delta import digest
+
+logger = logging.getLogger(__name__)
+
+ALL_TOILETS = 0
+
+
+@dataclass
+class Snapshot:
+    etag: str
+    cursor: str
+    body: str
+
+    @property
+    def headers(self) -> dict:
+        return {
+            "ETag": f'"{self.etag}"',
+            "Cache-Control": f"private, max-age={settings.DASHBOARD_SNAPSHOT_MAX_AGE_SECONDS}",
+        }
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        if not if_none_match:
+            return False
+        tags = [t.strip().removeprefix("W/").strip('"') for t in if_none_match.split(",")]
+        return self.etag in tags or "*" in tags
+
+
+def is_final(day: date, now_utc: datetime) -> bool:
+    """Whether the day's view can no longer change through new checks."""
+    if not settings.DASHBOARD_SNAPSHOTS_ENABLED:
+        return False
+    _, end_utc = day_bounds_utc(day)
+    return now_utc >= end_utc + timedelta(seconds=settings.DASHBOARD_SNAPSHOT_DELAY_SECONDS)
+
+
+def definitions_digest(db: Session, clinic_id: int = DEFAULT_CLINIC_ID) -> str:
+    """Digest of the clinic's master data a day view is rendered with."""
+    checkpoints = db.query(
+        MajorCheckpoint.id, MajorCheckpoint.name, MajorCheckpoint.start_time, MajorCheckpoint.end_time,
+        MajorCheckpoint.target_toilet_id, MajorCheckpoint.display_order,
+    ).filter(MajorCheckpoint.clinic_id == clinic_id, MajorCheckpoint.is_active == True)\
+        .order_by(MajorCheckpoint.id).all()
+    icons = db.query(Staff.id, Staff.icon_code).filter(Staff.clinic_id == clinic_id).order_by(Staff.id).all()
+    return digest([[list(c) for c in checkpoints], [list(s) for s in icons]])
+
+
+def load(
+    db: Session, day: date, toilet_id: Optional[int], definitions: str, clinic_id: int = DEFAULT_CLINIC_ID
+) -> Optional[Snapshot]:
+    row = db.query(DashboardSnapshot.etag, DashboardSnapshot.cursor, DashboardSnapshot.body)\
+        .filter(
+            DashboardSnapshot.clinic_id == clinic_id,
+            DashboardSnapshot.day == day,
+            DashboardSnapshot.toilet_id == (toilet_id or ALL_TOILETS),
+            DashboardSnapshot.definitions_digest == definitions,
+        ).first()
+    return Snapshot(*row) if row else None
+
+
+def save(
+    day: date, toilet_id: Optional[int], definitions: str, cursor: str, body: str, clinic_id: int = DEFAULT_CLINIC_ID
+) -> Snapshot:
+    """Store the serialized response (on the primary: the request may be reading from a replica)."""
+    snapshot = Snapshot(etag=hashlib.sha256(body.encode("utf-8")).hexdigest()[:32], cursor=cursor, body=body)
+    db = SessionLocal()
+    try:
+        db.execute(delete(DashboardSnapshot).where(
+            DashboardSnapshot.clinic_id == clinic_id,
+            DashboardSnapshot.day == day,
+            DashboardSnapshot.toilet_id == (toilet_id or ALL_TOILETS),
+        ))
+        db.add(DashboardSnapshot(
+            clinic_id=clinic_id,
+            day=day,
+            toilet_id=toilet_id or ALL_TOILETS,
+            definitions_digest=definitions,
+            etag=snapshot.etag,
+            cursor=cursor,
+            body=body,
+        ))
+        db.commit()
+    except IntegrityError:
+        # Built concurrently by another request
+        db.rollback()
+    finally:
+        db.close()
+    return snapshot
+
+
+def invalidate(db: Session, days: Optional[Iterable] = None, clinic_id: Optional[int] = None) -> None:
+    """
+    Drop the snapshots of `days` (date or YYYY-MM-DD), or all of them, of one
+    clinic or of every clinic, in the caller's transaction.
+    """
+    stmt = delete(DashboardSnapshot)
+    if clinic_id is not None:
+        stmt = stmt.where(DashboardSnapshot.clinic_id == clinic_id)
+    if days is not None:
+        days = sorted({d if isinstance(d, date) else date.fromisoformat(d) for d in days})
+        if not days:
+            return
+        stmt = stmt.where(DashboardSnapshot.day.in_(days))
+    db.execute(stmt)
@@ -0,0 +1,116 @@
+"""
+Staging storage for resumable (chunked) uploads.
+
+Each session gets a directory under UPLOAD_STAGING_PATH with one file per
+part (image). The current offset of a part is simply its file size, so a
+client can resume from wherever the last chunk landed. Staging must not be
+served by the /images mount (checked at startup, see core/static_files.py).
+"""
+import fcntl
+import logging
+import os
+import shutil
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from sqlalchemy.orm import Session
+
+from app.core import scheduler
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models import UploadSession
+
+logger = logging.getLogger(__name__)
+
+
+class OffsetMismatch(Exception):
+    def __init__(self, current: int):
+        super().__init__(f"Offset mismatch, current offset is {current}")
+        self.current = current
+
+
+def session_dir(upload_id: str) -> str:
+    return os.path.join(settings.UPLOAD_STAGING_PATH, upload_id)
+
+
+def part_path(upload_id: str, index: int) -> str:
+    return os.path.join(session_dir(upload_id), f"{index}.part")
+
+
+def create_staging(upload_id: str, part_count: int) -> None:
+    os.makedirs(session_dir(upload_id), exist_ok=True)
+    for index in range(part_count):
+        open(part_path(upload_id, index), "ab").close()
+
+
+def part_offset(upload_id: str, index: int) -> int:
+    try:
+        return os.path.getsize(part_path(upload_id, index))
+    except FileNotFoundError:
+        return 0
+
+
+def append_chunk(upload_id: str, index: int, offset: int, chunk: bytes, size: int) -> int:
+    """Append a chunk at `offset` and return the new offset."""
+    path = part_path(upload_id, index)
+    with open(path, "ab") as f:
+        # Concurrent PATCHes of the same part (retries, other workers) take turns:
+        # the later one then sees the moved offset instead of interleaving bytes
+        fcntl.flock(f, fcntl.LOCK_EX)
+        current = f.seek(0, os.SEEK_END)
+        if current != offset:
+            raise OffsetMismatch(current)
+        if offset + len(chunk) > size:
+            raise ValueError(f"Chunk exceeds declared part size ({size} bytes)")
+        f.write(chunk)
+        return f.tell()
+
+
+def read_parts(upload_id: str, part_count: int) -> List[bytes]:
+    payloads = []
+    for index in range(part_count):
+        with open(part_path(upload_id, index), "rb") as f:
+            payloads.append(f.read())
+    return payloads
+
+
+def remove_staging(upload_id: str) -> None:
+    shutil.rmtree(session_dir(upload_id), ignore_errors=True)
+
+
+def expires_at(upload: UploadSession) -> datetime:
+    touched = upload.updated_at or upload.created_at
+    if touched.tzinfo is None:
+        touched = touched.replace(tzinfo=timezone.utc)
+    return touched + timedelta(minutes=settings.UPLOAD_SESSION_TTL_MINUTES)
+
+
+def purge_expired_uploads(db: Session) -> int:
+    """Delete sessions idle for longer than the TTL, and stray staging dirs."""
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=settings.UPLOAD_SESSION_TTL_MINUTES)
+    expired = db.query(UploadSession).filter(UploadSession.updated_at < cutoff).all()
+    for upload in expired:
+        remove_staging(upload.id)
+        db.delete(upload)
+    db.commit()
+
+    # Directories without a session (e.g. the row was never committed)
+    if os.path.isdir(settings.UPLOAD_STAGING_PATH):
+        known = {row.id for row in db.query(UploadSession.id)}
+        for entry in os.scandir(settings.UPLOAD_STAGING_PATH):
+            if entry.is_dir() and entry.name not in known:
+                if datetime.fromtimestamp(entry.stat().st_mtime, timezone.utc) < cutoff:
+                    remove_staging(entry.name)
+
+    if expired:
+        logger.info(f"Purged {len(expired)} expired upload sessions")
+    return len(expired)
+
+
+@scheduler.every(settings.UPLOAD_GC_INTERVAL_SECONDS)
+def purge_expired_uploads_task() -> None:
+    db = SessionLocal()
+    try:
+        purge_expired_uploads(db)
+    finally:
+        db.close()
@@ -0,0 +1,27 @@
+"""
+Standalone job worker.
+
+    python -m app.worker
+"""
+import logging
+import signal
+
+from app.core import events
+from app.core.config import settings
+from app.services.jobs import Worker
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    worker = Worker(threads=settings.JOB_WORKER_THREADS)
+    # Keep this process's caches (near-duplicate index, ...) in sync with the API
+    listener = events.Listener()
+    listener.start()
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    signal.signal(signal.SIGINT, lambda *_: worker.stop())
+    worker.run_forever()
+    listener.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Test setup: a throwaway SQLite database and image directories per session,
+emptied before every test. Settings are read at import time, so the
+environment is prepared before anything from `app` is imported.
+"""
+import io
+import os
+import shutil
+import tempfile
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="kj-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_tmp}/test.db",
+    "DATABASE_REPLICA_URL": "",
+    "IMAGE_STORAGE_PATH": f"{_tmp}/images",
+    "UPLOAD_STAGING_PATH": f"{_tmp}/uploads",
+    "PROFILE_OUTPUT_PATH": f"{_tmp}/profiles",
+    "ADMIN_USERNAME": "admin",
+    "ADMIN_PASSWORD": "admin",
+    "RUN_SCHEDULER": "false",
+    "RUN_EMBEDDED_WORKER": "false",
+    "RATE_LIMIT_ENABLED": "false",
+    "IMAGE_INGEST_WORKERS": "1",
+})
+
+from fastapi.testclient import TestClient  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from app.core import tenancy  # noqa: E402
+from app.db.base import Base  # noqa: E402
+from app.db.session import SessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services import clinic_settings, image_ingest  # noqa: E402
+from app.services.analytics import analytics_cache  # noqa: E402
+from app.services.near_duplicates import near_duplicate_index  # noqa: E402
+
+API = "/api"
+ADMIN = ("admin", "admin")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _cleanup():
+    yield
+    image_ingest.shutdown_pool()
+    engine.dispose()
+    shutil.rmtree(_tmp, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def _empty_database():
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    tenancy.ensure_default_clinic(engine)
+    tenancy.invalidate()
+    clinic_settings.invalidate()
+    analytics_cache.invalidate()
+    near_duplicate_index.clear()
+    yield
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client():
+    # Without the context manager: startup hooks (scheduler, listener) do not run
+    return TestClient(app)
+
+
+@pytest.fixture
+def master(client):
+    """One toilet and one staff member in the default clinic: (toilet_id, staff_id)."""
+    toilet = client.post(f"{API}/admin/toilets", json={"name": "1F"}, auth=ADMIN)
+    staff = client.post(f"{API}/admin/staff", json={"internal_name": "a", "icon_code": "dog"}, auth=ADMIN)
+    assert toilet.status_code == 200 and staff.status_code == 200
+    return toilet.json()["id"], staff.json()["id"]
+
+
+def png(color=(200, 10, 10), size=(64, 48)) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", size, color).save(out, "PNG")
+    return out.getvalue()
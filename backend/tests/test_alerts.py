@@ -0,0 +1,42 @@
+import threading
+from datetime import datetime, timezone
+
+from app.db.session import SessionLocal
+from app.models import AlertState, AlertTransition
+from app.services.alerts import evaluate_alerts
+
+
+def test_concurrent_evaluations_record_each_state_once(db, master):
+    now = datetime(2026, 10, 19, 1, 0, tzinfo=timezone.utc)
+    errors = []
+
+    def evaluate():
+        session = SessionLocal()
+        try:
+            evaluate_alerts(session, now)
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=evaluate) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    keys = sorted(key for (key,) in db.query(AlertState.alert_key))
+    assert keys == sorted(["afternoon", "morning", "regular", f"realtime:{master[0]}"])
+    assert db.query(AlertTransition).count() == len(keys)
+
+
+def test_level_change_closes_the_open_transition(db, master):
+    # morning: pending before its start, then warning / alert after it (no checks today)
+    evaluate_alerts(db, datetime(2026, 10, 18, 22, 0, tzinfo=timezone.utc))  # 07:00 JST
+    evaluate_alerts(db, datetime(2026, 10, 19, 3, 0, tzinfo=timezone.utc))   # 12:00 JST
+
+    morning = db.query(AlertTransition).filter(AlertTransition.alert_key == "morning")\
+        .order_by(AlertTransition.id).all()
+    assert [(t.from_level, t.level) for t in morning] == [(None, "pending"), ("pending", "alert")]
+    assert morning[0].ended_at is not None and morning[1].ended_at is None
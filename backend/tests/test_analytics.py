@@ -0,0 +1,128 @@
+from datetime import date, datetime, timezone
+
+from app.core import events
+from app.core.timeutil import JST, to_jst
+from app.db.session import SessionLocal
+from app.models import DEFAULT_CLINIC_ID, ToiletCheck
+from app.services import analytics
+from app.services.analytics import analytics_cache, compute_analytics
+
+from .conftest import ADMIN, API, png
+
+MONDAY = "2026-01-05"
+
+
+def _add_check(db, toilet_id, staff_id, hhmm, interval, status, day=MONDAY):
+    at = datetime.fromisoformat(f"{day}T{hhmm}:00").replace(tzinfo=JST).astimezone(timezone.utc)
+    db.add(ToiletCheck(
+        toilet_id=toilet_id, staff_id=staff_id, checked_at=at, interval_sec_from_prev=interval, status_type=status,
+    ))
+    db.commit()
+
+
+def _second_staff(client):
+    staff = client.post(f"{API}/admin/staff", json={"internal_name": "b", "icon_code": "cat"}, auth=ADMIN)
+    return staff.json()["id"]
+
+
+def _analytics(client, start=MONDAY, end=MONDAY, headers=None):
+    response = client.get(f"{API}/admin/analytics", params={"start": start, "end": end}, headers=headers or {}, auth=ADMIN)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_vectorized_aggregates(client, db, master):
+    toilet_id, first = master
+    second = _second_staff(client)
+    _add_check(db, toilet_id, first, "09:00", None, "NORMAL")
+    _add_check(db, toilet_id, first, "09:30", 1800, "TOO_SHORT")
+    _add_check(db, toilet_id, second, "11:00", 5400, "NORMAL")
+    _add_check(db, toilet_id, second, "13:00", 7200, "TOO_LONG")
+
+    result = compute_analytics(db, date(2026, 1, 5), date(2026, 1, 5))
+
+    assert result.total_checks == 4
+    assert result.rates == {"too_short_rate": 0.25, "too_long_rate": 0.25}
+    assert result.intervals["count"] == 3
+    assert result.intervals["mean_minutes"] == 80.0
+    assert result.intervals["percentiles"]["p50"] == 90.0
+    assert {b["from_minutes"]: b["count"] for b in result.intervals["histogram"] if b["count"]} == {30: 1, 90: 1, 120: 1}
+    assert [(s["staff_id"], s["checks"], s["mean_interval_minutes"]) for s in result.staff] == [
+        (first, 2, 30.0), (second, 2, 105.0),
+    ]
+    assert result.staff[0]["by_status"] == {"NORMAL": 1, "TOO_SHORT": 1, "TOO_LONG": 0}
+    assert result.toilets == [{"toilet_id": toilet_id, "name": "1F", "checks": 4}]
+    by_hour = {h["hour"]: h["checks"] for h in result.time_of_day["by_hour"] if h["checks"]}
+    assert by_hour == {9: 2, 11: 1, 13: 1}
+    assert result.time_of_day["weekday_hour"][0][9] == 2  # Monday
+    assert [(m["month"], m["checks"]) for m in result.months] == [("2026-01", 4)]
+
+
+def test_endpoint_serves_repeated_ranges_from_the_cache(client, db, master):
+    toilet_id, staff_id = master
+    _add_check(db, toilet_id, staff_id, "09:00", None, "NORMAL")
+
+    first = _analytics(client)
+    assert (first["total_checks"], first["cached"]) == (1, False)
+    assert _analytics(client)["cached"] is True
+
+    bad = client.get(f"{API}/admin/analytics", params={"start": "2026-02-01", "end": "2026-01-01"}, auth=ADMIN)
+    assert bad.status_code == 400
+
+
+def test_new_checks_only_drop_ranges_that_cover_their_day(client, db, master):
+    toilet_id, staff_id = master
+    today = to_jst(datetime.now(timezone.utc)).date().isoformat()
+    east = client.post(f"{API}/admin/clinics", json={"slug": "east", "name": "East"}, auth=ADMIN)
+    assert east.status_code == 200
+    _add_check(db, toilet_id, staff_id, "09:00", None, "NORMAL")
+    _analytics(client)
+    _analytics(client, start=today, end=today)
+    _analytics(client, start=today, end=today, headers={"X-Clinic": "east"})
+
+    posted = client.post(
+        f"{API}/checks/",
+        data={"toilet_id": toilet_id, "staff_id": staff_id, "device_uuid": "dev-1"},
+        files=[("images", ("a.png", png(), "image/png")), ("images", ("b.png", png(), "image/png"))],
+    )
+    assert posted.status_code == 200
+
+    assert _analytics(client)["cached"] is True
+    assert _analytics(client, start=today, end=today, headers={"X-Clinic": "east"})["cached"] is True
+    refreshed = _analytics(client, start=today, end=today)
+    assert (refreshed["total_checks"], refreshed["cached"]) == (1, False)
+
+
+def test_bulk_changes_drop_the_ranges_of_their_days(client, db, master):
+    toilet_id, staff_id = master
+    _add_check(db, toilet_id, staff_id, "09:00", None, "NORMAL")
+    _add_check(db, toilet_id, staff_id, "09:00", None, "NORMAL", day="2026-03-02")
+    _analytics(client)
+    _analytics(client, start="2026-03-01", end="2026-03-31")
+
+    session = SessionLocal()
+    try:
+        events.publish(session, events.CHECKS_CHANGED, {"reason": "reclassify", "days": ["2026-03-02"], "clinic_id": DEFAULT_CLINIC_ID})
+        session.commit()
+    finally:
+        session.close()
+    assert _analytics(client)["cached"] is True
+    assert _analytics(client, start="2026-03-01", end="2026-03-31")["cached"] is False
+
+    # Renaming staff changes every result of the clinic
+    client.patch(f"{API}/admin/staff/{staff_id}", json={"internal_name": "renamed"}, auth=ADMIN)
+    assert _analytics(client)["cached"] is False
+
+
+def test_results_computed_during_an_invalidation_are_not_kept(db, master, monkeypatch):
+    compute = analytics.compute_analytics
+
+    def racing_compute(*args, **kwargs):
+        result = compute(*args, **kwargs)
+        analytics_cache.invalidate(DEFAULT_CLINIC_ID, [MONDAY])  # a check arrives while computing
+        return result
+
+    monkeypatch.setattr(analytics, "compute_analytics", racing_compute)
+    analytics_cache.get(db, date(2026, 1, 5), date(2026, 1, 5))
+    monkeypatch.setattr(analytics, "compute_analytics", compute)
+    assert analytics_cache.get(db, date(2026, 1, 5), date(2026, 1, 5)).cached is False
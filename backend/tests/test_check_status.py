@@ -0,0 +1,37 @@
+from datetime import datetime
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.timeutil import JST
+from app.services.check_status import calculate_elapsed_excluding_lunch
+from app.services.replay import Schedule, elapsed_excluding_lunch
+
+
+def _jst(hour, minute=0):
+    return datetime(2026, 10, 19, hour, minute, tzinfo=JST)
+
+
+def test_lunch_break_follows_the_settings(monkeypatch):
+    assert calculate_elapsed_excluding_lunch(_jst(11), _jst(15)) == 120
+
+    monkeypatch.setattr(settings, "LUNCH_BREAK_START", "12:30")
+    monkeypatch.setattr(settings, "LUNCH_BREAK_END", "13:30")
+    assert calculate_elapsed_excluding_lunch(_jst(11), _jst(15)) == 180
+    assert calculate_elapsed_excluding_lunch(_jst(12, 45), _jst(13, 40)) == 10
+
+
+def test_live_and_replay_agree(monkeypatch):
+    monkeypatch.setattr(settings, "LUNCH_BREAK_START", "11:45")
+    monkeypatch.setattr(settings, "LUNCH_BREAK_END", "13:15")
+    schedule = Schedule.from_settings()
+    pairs = [((9, 0), (10, 30)), ((11, 0), (12, 0)), ((12, 0), (14, 0)), ((10, 10), (16, 5))]
+
+    live = [calculate_elapsed_excluding_lunch(_jst(*a), _jst(*b)) for a, b in pairs]
+    replayed = elapsed_excluding_lunch(
+        np.array([a[0] * 3600 + a[1] * 60 for a, _ in pairs]),
+        np.array([b[0] * 3600 + b[1] * 60 for _, b in pairs]),
+        schedule.seconds("lunch_start"),
+        schedule.seconds("lunch_end"),
+    )
+    assert live == replayed.tolist()
@@ -0,0 +1,42 @@
+from datetime import datetime, timezone
+
+from app.core.timeutil import to_jst
+
+from .conftest import API, png
+
+
+def _post_check(client, master):
+    toilet_id, staff_id = master
+    posted = client.post(
+        f"{API}/checks/",
+        data={"toilet_id": toilet_id, "staff_id": staff_id, "device_uuid": "dev-1"},
+        files=[("images", ("a.png", png(), "image/png")), ("images", ("b.png", png(), "image/png"))],
+    )
+    assert posted.status_code == 200
+    return posted.json()
+
+
+def test_full_sparse_and_normalized_shapes(client, master):
+    check = _post_check(client, master)
+    today = to_jst(datetime.now(timezone.utc)).date().isoformat()
+
+    full = client.get(f"{API}/checks/", params={"date": today}).json()
+    assert [c["id"] for c in full] == [check["id"]]
+    assert {"toilet_id", "staff_id", "status_type", "images"} <= set(full[0])
+
+    sparse = client.get(f"{API}/checks/", params={"date": today, "fields": "id,status_type"}).json()
+    assert sparse == [{"id": check["id"], "status_type": check["status_type"]}]
+
+    normalized = client.get(
+        f"{API}/checks/", params={"date": today, "fields": "id,staff.icon_code", "shape": "normalized"}
+    ).json()
+    assert normalized["checks"] == [{"id": check["id"], "staff_id": master[1]}]
+    assert normalized["staff"] == [{"id": master[1], "icon_code": "dog"}]
+
+
+def test_openapi_documents_every_shape(client):
+    spec = client.get(f"{API}/openapi.json").json()
+    schema = spec["paths"][f"{API}/checks/"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+    refs = {str(option) for option in schema["anyOf"]}
+    assert any("CheckResponse" in ref for ref in refs)
+    assert any("NormalizedChecksResponse" in ref for ref in refs)
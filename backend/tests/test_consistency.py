@@ -0,0 +1,145 @@
+import os
+import shutil
+import time
+from datetime import date, datetime, timezone
+
+import pytest
+from sqlalchemy import update
+
+from app.core.config import settings
+from app.models import CheckImage, ImageBlob, ToiletCheck
+from app.services import consistency
+from app.services.image_store import BLOB_DIR
+
+from .conftest import API, png
+
+DAY = date(2026, 3, 10)  # JST; its legacy directories are 2026/03/09 and 2026/03/10 (UTC)
+
+
+@pytest.fixture(autouse=True)
+def storage():
+    shutil.rmtree(settings.IMAGE_STORAGE_PATH, ignore_errors=True)
+    os.makedirs(settings.IMAGE_STORAGE_PATH)
+    yield settings.IMAGE_STORAGE_PATH
+
+
+def _file(*parts, old=True):
+    path = os.path.join(settings.IMAGE_STORAGE_PATH, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x")
+    if old:
+        past = time.time() - 2 * settings.CONSISTENCY_GRACE_SECONDS
+        os.utime(path, (past, past))
+    return os.path.normpath(path)
+
+
+def _post_check(client, master):
+    toilet_id, staff_id = master
+    posted = client.post(
+        f"{API}/checks/",
+        data={"toilet_id": toilet_id, "staff_id": staff_id, "device_uuid": "dev-1"},
+        files=[("images", ("a.png", png(), "image/png")), ("images", ("b.png", png((10, 200, 10)), "image/png"))],
+    )
+    assert posted.status_code == 200
+    return posted.json()["id"]
+
+
+def _legacy_check(db, master, checked_at, with_file=True):
+    """A check from before content addressing: its image lives in YYYY/MM/DD/{check_id}/ (UTC date)."""
+    toilet_id, staff_id = master
+    check = ToiletCheck(toilet_id=toilet_id, staff_id=staff_id, checked_at=checked_at, status_type="NORMAL")
+    db.add(check)
+    db.flush()
+    path = os.path.join(settings.IMAGE_STORAGE_PATH, checked_at.strftime("%Y/%m/%d"), str(check.id), "0.jpg")
+    if with_file:
+        path = _file(os.path.relpath(path, settings.IMAGE_STORAGE_PATH))
+    db.add(CheckImage(check_id=check.id, image_path=path, image_type="sheet", order_index=0))
+    db.commit()
+    return check.id, os.path.normpath(path)
+
+
+def test_orphans_outside_the_grace_period_are_removed(client, db, master):
+    _post_check(client, master)
+    old = _file(BLOB_DIR, "zz", "zz", "old.jpg")
+    new = _file(BLOB_DIR, "zz", "zz", "new.jpg", old=False)
+
+    report = consistency.scan(db)
+    assert report.counts == {"orphan_files": 1}
+    assert report.samples["orphan_files"] == [old]
+    assert os.path.exists(old)  # dry run
+
+    report = consistency.scan(db, dry_run=False)
+    assert report.repaired["orphan_files"] == 1
+    assert not os.path.exists(old)
+    assert os.path.exists(new)
+    assert consistency.scan(db).problems == 0
+
+
+def test_missing_files_are_only_reported(db, master):
+    check_id, path = _legacy_check(db, master, datetime(2026, 3, 10, 3, 0, tzinfo=timezone.utc), with_file=False)
+
+    report = consistency.scan(db, dry_run=False)
+    assert report.counts == {"missing_files": 1}
+    assert report.samples["missing_files"][0]["check_id"] == check_id
+    assert db.query(CheckImage).filter(CheckImage.check_id == check_id).one().image_path == path
+
+
+def test_stale_paths_and_ref_counts_are_repaired(client, db, master):
+    check_id = _post_check(client, master)
+    image = db.query(CheckImage).filter(CheckImage.check_id == check_id).order_by(CheckImage.order_index).first()
+    blob_path = image.blob.path
+    db.execute(update(CheckImage).where(CheckImage.id == image.id).values(image_path="/gone/0.jpg"))
+    db.execute(update(ImageBlob).values(ref_count=5))
+    db.commit()
+
+    report = consistency.scan(db)
+    assert report.counts == {"stale_image_paths": 1, "ref_count_mismatches": 2}
+
+    report = consistency.scan(db, dry_run=False)
+    assert report.repaired["stale_image_paths"] == 1
+    assert report.repaired["ref_counts"] == 2
+    db.expire_all()
+    assert db.get(CheckImage, image.id).image_path == blob_path
+    assert [b.ref_count for b in db.query(ImageBlob)] == [1, 1]
+    assert consistency.scan(db).problems == 0
+
+
+def test_blobs_in_use_are_never_deleted(client, db, master):
+    _post_check(client, master)
+    used_id, used_path = db.query(ImageBlob.id, ImageBlob.path).order_by(ImageBlob.id).first()
+    unused_path = _file(BLOB_DIR, "ff", "ff", "unused.jpg")
+    db.add(ImageBlob(sha256="f" * 64, path=unused_path, size_bytes=1, ref_count=0))
+    db.commit()
+    old = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    db.execute(update(ImageBlob).values(created_at=old))
+    db.commit()
+
+    report = consistency.scan(db, dry_run=False)
+    assert report.counts == {"unreferenced_blobs": 1}
+    assert report.repaired["unreferenced_blobs"] == 1
+    assert not os.path.exists(unused_path)
+    assert db.query(ImageBlob).count() == 2 and os.path.exists(used_path)
+
+    # A blob found unused by the scan but attached again before the repair is kept
+    repaired = consistency._repair(db, [], [], [used_id], [])
+    assert repaired["unreferenced_blobs"] == 0
+    assert db.get(ImageBlob, used_id) is not None
+    assert os.path.exists(used_path)
+
+
+def test_day_scope_covers_both_utc_directories(db, master):
+    # 08:00 JST on DAY is 23:00 UTC the day before, 20:00 JST is 11:00 UTC on DAY
+    _, morning_path = _legacy_check(db, master, datetime(2026, 3, 9, 23, 0, tzinfo=timezone.utc))
+    _, evening_path = _legacy_check(db, master, datetime(2026, 3, 10, 11, 0, tzinfo=timezone.utc))
+    # The previous JST day shares the 2026/03/09 directory
+    _, neighbour_path = _legacy_check(db, master, datetime(2026, 3, 9, 3, 0, tzinfo=timezone.utc))
+    orphans = [_file("2026", "03", "09", "999", "0.jpg"), _file("2026", "03", "10", "999", "0.jpg")]
+    other_day = _file("2026", "03", "11", "999", "0.jpg")
+
+    report = consistency.scan(db, day=DAY, dry_run=False)
+    assert report.image_rows == 2
+    assert sorted(report.samples["orphan_files"]) == sorted(orphans)
+    assert report.repaired["orphan_files"] == 2
+    assert not any(os.path.exists(p) for p in orphans)
+    assert all(os.path.exists(p) for p in (morning_path, evening_path, neighbour_path, other_day))
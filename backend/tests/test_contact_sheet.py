@@ -0,0 +1,129 @@
+import os
+import shutil
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api import deps
+from app.core.config import settings
+from app.core.timeutil import to_jst
+from app.models import CheckImage, ToiletCheck
+from app.services import contact_sheet
+
+from .conftest import API, png
+
+
+@pytest.fixture(autouse=True)
+def _no_sheets():
+    shutil.rmtree(contact_sheet.sheet_dir(), ignore_errors=True)
+
+
+@pytest.fixture
+def today():
+    return to_jst(datetime.now(timezone.utc)).date()
+
+
+@pytest.fixture
+def decoded(monkeypatch):
+    """Image paths decoded into tiles, in order."""
+    paths = []
+    tile = contact_sheet._tile
+
+    def counting_tile(image_path, size):
+        paths.append(image_path)
+        return tile(image_path, size)
+
+    monkeypatch.setattr(contact_sheet, "_tile", counting_tile)
+    return paths
+
+
+def _post_check(client, master, color):
+    toilet_id, staff_id = master
+    posted = client.post(
+        f"{API}/checks/",
+        data={"toilet_id": toilet_id, "staff_id": staff_id, "device_uuid": "dev-1"},
+        files=[("images", ("a.png", png(color), "image/png")), ("images", ("b.png", png(color[::-1]), "image/png"))],
+    )
+    assert posted.status_code == 200
+    return posted.json()["id"]
+
+
+def _sheet(client, day):
+    return client.get(f"{API}/dashboard/day/contact-sheet", params={"date_str": day.isoformat()})
+
+
+def _sprite(sheet):
+    return os.path.join(contact_sheet.sheet_dir(), f"{sheet['date']}.v{sheet['version']}.jpg")
+
+
+def test_new_checks_are_appended(client, db, master, today, decoded):
+    first = _post_check(client, master, (200, 10, 10))
+    v1 = _sheet(client, today).json()
+    assert v1["version"] == 1
+    assert [t["check_id"] for t in v1["tiles"]] == [first, first]
+
+    second = _post_check(client, master, (10, 200, 10))
+    decoded.clear()
+    sheet = contact_sheet.update_sheet(db, today)  # the images.contact_sheet job
+    assert sheet.version == 2
+    assert [t.check_id for t in sheet.tiles] == [first, first, second, second]
+    assert [(t["x"], t["y"]) for t in v1["tiles"]] == [(t.x, t.y) for t in sheet.tiles[:2]]
+    assert len(decoded) == 2  # only the new check's images
+
+    # Up to date: served as is
+    assert _sheet(client, today).json()["version"] == 2
+    assert os.path.exists(_sprite(v1))  # kept for clients holding the previous map
+
+
+def test_changed_tiles_rebuild_the_sheet(client, db, master, today, decoded):
+    first = _post_check(client, master, (200, 10, 10))
+    _post_check(client, master, (10, 200, 10))
+    assert len(_sheet(client, today).json()["tiles"]) == 4
+
+    image = db.query(CheckImage).filter(CheckImage.check_id == first).order_by(CheckImage.order_index).first()
+    db.delete(image)
+    db.commit()
+    decoded.clear()
+
+    rebuilt = _sheet(client, today).json()
+    assert rebuilt["version"] == 2
+    assert len(rebuilt["tiles"]) == 3
+    assert len(decoded) == 3
+
+
+def test_invalidate_day_removes_the_sheet(client, master, today):
+    _post_check(client, master, (200, 10, 10))
+    sheet = _sheet(client, today).json()
+    assert os.path.exists(_sprite(sheet))
+
+    contact_sheet.invalidate_day(today)
+    assert contact_sheet.load_map(today) is None
+    assert not os.path.exists(_sprite(sheet))
+    assert _sheet(client, today).json()["version"] == 1
+
+
+def test_day_without_checks_is_404(client, master, today):
+    assert _sheet(client, today).status_code == 404
+    assert _sheet(client, today).json()["detail"] == "No checks on this day"
+
+
+def test_lagging_replica_never_rewrites_the_sheet(client, db, master, today, monkeypatch):
+    first = _post_check(client, master, (200, 10, 10))
+    primary_path = settings.DATABASE_URL.removeprefix("sqlite:///")
+    replica_path = os.path.join(os.path.dirname(primary_path), "replica.db")
+    shutil.copyfile(primary_path, replica_path)  # the replica stops after the first check
+    replica = create_engine(f"sqlite:///{replica_path}")
+    monkeypatch.setattr(deps, "ReplicaSessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=replica))
+    try:
+        second = _post_check(client, master, (10, 200, 10))
+        built = contact_sheet.update_sheet(db, today)
+
+        served = _sheet(client, today).json()
+        assert served["version"] == built.version
+        assert [t["check_id"] for t in served["tiles"]] == [first, first, second, second]
+        assert db.query(ToiletCheck).count() == 2
+    finally:
+        replica.dispose()
+        os.remove(replica_path)
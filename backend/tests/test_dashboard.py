@@ -0,0 +1,106 @@
+import argparse
+from datetime import datetime, timezone
+
+from app import cli
+from app.core.timeutil import JST
+from app.models import DashboardSnapshot, ToiletCheck
+
+from .conftest import ADMIN, API
+
+LIVE_DAY = "2026-10-19"
+AT = "2026-10-19T12:00:00"  # JST
+PAST_DAY = "2025-06-02"
+
+
+def _add_check(db, master, day, hour, minute=0):
+    toilet_id, staff_id = master
+    at = datetime.fromisoformat(f"{day}T{hour:02d}:{minute:02d}:00").replace(tzinfo=JST).astimezone(timezone.utc)
+    check = ToiletCheck(toilet_id=toilet_id, staff_id=staff_id, checked_at=at, status_type="NORMAL")
+    db.add(check)
+    db.commit()
+    return check.id
+
+
+def _day(client, day, **params):
+    headers = params.pop("headers", {})
+    auth = ADMIN if "at" in params else None  # time travel is admin only
+    return client.get(f"{API}/dashboard/day", params={"date_str": day, **params}, headers=headers, auth=auth)
+
+
+def test_delta_cursor_sends_only_new_checks_then_304(client, db, master):
+    first = _add_check(db, master, LIVE_DAY, 9)
+    full = _day(client, LIVE_DAY, at=AT)
+    assert full.status_code == 200
+    cursor = full.headers["X-Dashboard-Cursor"]
+    assert full.json()["cursor"] == cursor
+    assert [item["id"] for item in full.json()["timeline"]] == [first]
+
+    unchanged = _day(client, LIVE_DAY, at=AT, since=cursor)
+    assert unchanged.status_code == 304
+    assert unchanged.headers["X-Dashboard-Cursor"] == cursor
+
+    second = _add_check(db, master, LIVE_DAY, 10)
+    delta = _day(client, LIVE_DAY, at=AT, since=cursor)
+    assert delta.status_code == 200
+    assert delta.json()["is_delta"] is True
+    assert [item["id"] for item in delta.json()["timeline"]] == [second]
+
+    # A malformed cursor gets the full view
+    reset = _day(client, LIVE_DAY, at=AT, since="garbage")
+    assert reset.json()["is_delta"] is False
+    assert {item["id"] for item in reset.json()["timeline"]} == {first, second}
+
+
+def test_reclassify_resends_the_full_timeline(client, db, master):
+    _add_check(db, master, LIVE_DAY, 9)
+    _add_check(db, master, LIVE_DAY, 9, 30)
+    cursor = _day(client, LIVE_DAY, at=AT).headers["X-Dashboard-Cursor"]
+
+    applied = client.post(f"{API}/admin/reclassify", params={"dry_run": False}, auth=ADMIN)
+    assert applied.json()["changed"] == 1
+
+    after = _day(client, LIVE_DAY, at=AT, since=cursor)
+    assert after.status_code == 200
+    assert after.json()["is_delta"] is False
+    assert [item["status_type"] for item in after.json()["timeline"]] == ["TOO_SHORT", "NORMAL"]
+
+
+def test_snapshot_etag_until_reclassify_invalidates_it(client, db, master):
+    _add_check(db, master, PAST_DAY, 9)
+    _add_check(db, master, PAST_DAY, 9, 30)
+
+    first = _day(client, PAST_DAY)
+    etag = first.headers["ETag"]
+    assert _day(client, PAST_DAY, headers={"If-None-Match": etag}).status_code == 304
+    assert _day(client, PAST_DAY, since=first.headers["X-Dashboard-Cursor"]).status_code == 304
+
+    client.post(f"{API}/admin/reclassify", params={"dry_run": False}, auth=ADMIN)
+
+    rebuilt = _day(client, PAST_DAY, headers={"If-None-Match": etag})
+    assert rebuilt.status_code == 200
+    assert rebuilt.headers["ETag"] != etag
+    assert [item["status_type"] for item in rebuilt.json()["timeline"]] == ["TOO_SHORT", "NORMAL"]
+
+
+def test_cli_reclassify_drops_snapshots(client, db, master):
+    _add_check(db, master, PAST_DAY, 9)
+    _add_check(db, master, PAST_DAY, 9, 30)
+    _day(client, PAST_DAY)
+    assert db.query(DashboardSnapshot).count() == 1
+
+    cli.cmd_reclassify(argparse.Namespace(
+        apply=True, toilet_id=None, too_short_sec=None, too_long_sec=None, clinic_id=None,
+    ))
+
+    assert db.query(DashboardSnapshot).count() == 0
+    statuses = [c.status_type for c in db.query(ToiletCheck).order_by(ToiletCheck.checked_at)]
+    assert statuses == ["NORMAL", "TOO_SHORT"]
+
+
+def test_time_travel_needs_admin_credentials(client, db, master):
+    params = {"date_str": LIVE_DAY, "at": AT}
+    assert client.get(f"{API}/dashboard/day", params=params).status_code == 401
+    assert client.get(f"{API}/dashboard/day", params=params, auth=("admin", "wrong")).status_code == 401
+    assert client.get(f"{API}/dashboard/simple-status", params={"at": AT}).status_code == 401
+    assert client.get(f"{API}/dashboard/day", params=params, auth=ADMIN).status_code == 200
+    assert client.get(f"{API}/dashboard/day", params={"date_str": LIVE_DAY}).status_code == 200
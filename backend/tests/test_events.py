@@ -0,0 +1,32 @@
+import json
+from datetime import date, timedelta
+
+from app.core import events
+
+
+class _RecordingSession:
+    def __init__(self):
+        self.messages = []
+
+    def execute(self, statement, params):
+        self.messages.append(params["message"])
+
+
+def _days(count):
+    return [(date(2025, 1, 1) + timedelta(days=i)).isoformat() for i in range(count)]
+
+
+def test_long_day_lists_become_all_days():
+    assert events.event_days(reversed(_days(3))) == _days(3)
+    assert events.event_days(_days(events.MAX_EVENT_DAYS + 1)) is None
+
+
+def test_notify_payload_stays_under_the_postgres_limit(monkeypatch):
+    monkeypatch.setattr(events, "uses_notify", lambda: True)
+    session = _RecordingSession()
+
+    events.publish(session, events.CHECKS_CHANGED, {"reason": "reclassify", "days": _days(1000), "clinic_id": 1})
+
+    message = session.messages[0]
+    assert len(message.encode("utf-8")) < 8000
+    assert json.loads(message)["payload"] == {"reason": "reclassify", "days": None, "clinic_id": 1}
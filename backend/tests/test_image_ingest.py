@@ -0,0 +1,88 @@
+import io
+
+import pytest
+from PIL import Image
+
+from app.core.config import settings
+from app.services.image_ingest import InvalidImageError, normalize_image
+
+from .conftest import API, png
+
+
+@pytest.fixture(autouse=True)
+def _restore_pillow_limit():
+    # normalize_image sets the limit of the process it runs in
+    limit = Image.MAX_IMAGE_PIXELS
+    yield
+    Image.MAX_IMAGE_PIXELS = limit
+
+
+def _normalize(data, max_pixels=settings.IMAGE_MAX_PIXELS):
+    return normalize_image(data, settings.IMAGE_MAX_DIMENSION, "jpeg", settings.IMAGE_QUALITY, max_pixels)
+
+
+def _encode(img, fmt, **params) -> bytes:
+    out = io.BytesIO()
+    img.save(out, fmt, **params)
+    return out.getvalue()
+
+
+def _decoded(result):
+    return Image.open(io.BytesIO(result.data))
+
+
+def test_exif_orientation_is_applied_and_dropped():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90° clockwise
+    data = _encode(Image.new("RGB", (64, 32), (200, 10, 10)), "JPEG", exif=exif)
+
+    result = _normalize(data)
+    assert (result.width, result.height) == (32, 64)
+    out = _decoded(result)
+    assert out.size == (32, 64)
+    assert 0x0112 not in out.getexif()
+
+
+@pytest.mark.parametrize("mode", ["RGBA", "L", "P"])
+def test_output_is_rgb(mode):
+    result = _normalize(_encode(Image.new(mode, (40, 30)), "PNG"))
+    out = _decoded(result)
+    assert out.format == "JPEG" and out.mode == "RGB"
+    assert result.ext == "jpg"
+
+
+def test_long_edge_is_capped():
+    result = _normalize(_encode(Image.new("RGB", (3000, 1000), (10, 10, 200)), "PNG"))
+    assert (result.width, result.height) == (settings.IMAGE_MAX_DIMENSION, 427)
+    assert result.bytes_saved > 0
+
+
+def test_images_over_max_pixels_are_rejected():
+    data = _encode(Image.new("RGB", (200, 100)), "PNG")
+    with pytest.raises(InvalidImageError, match="Image too large: 200x100 pixels"):
+        _normalize(data, max_pixels=19_999)
+    # Pillow itself refuses to open images over twice the limit
+    with pytest.raises(InvalidImageError, match="Image too large"):
+        _normalize(data, max_pixels=9_999)
+    assert _normalize(data, max_pixels=20_000).width == 200
+
+
+def test_undecodable_upload_is_a_400(client, master, monkeypatch):
+    toilet_id, staff_id = master
+
+    def post(first):
+        return client.post(
+            f"{API}/checks/",
+            data={"toilet_id": toilet_id, "staff_id": staff_id, "device_uuid": "dev-1"},
+            files=[("images", ("a.png", first, "image/png")), ("images", ("b.png", png(), "image/png"))],
+        )
+
+    broken = post(b"not an image")
+    assert broken.status_code == 400
+    assert broken.json()["detail"].startswith("Could not decode image")
+
+    # The limit is handed to the ingest pool with every image
+    monkeypatch.setattr(settings, "IMAGE_MAX_PIXELS", 1000)
+    too_large = post(png())
+    assert too_large.status_code == 400
+    assert too_large.json()["detail"].startswith("Image too large")
@@ -0,0 +1,59 @@
+import os
+
+from app.core.config import settings
+from app.core.tenancy import CLINICS_DIR
+from app.models import DEFAULT_CLINIC_ID, CheckImage, ImageBlob
+from app.services.image_store import BLOB_DIR
+
+from .conftest import ADMIN, API, png
+
+
+def _post_check(client, toilet_id, staff_id, headers=None):
+    posted = client.post(
+        f"{API}/checks/",
+        data={"toilet_id": toilet_id, "staff_id": staff_id, "device_uuid": "dev-1"},
+        files=[("images", ("a.png", png(), "image/png")), ("images", ("b.png", png((10, 200, 10)), "image/png"))],
+        headers=headers or {},
+    )
+    assert posted.status_code == 200
+    return posted.json()["id"]
+
+
+def test_identical_uploads_share_one_blob(client, db, master):
+    first = _post_check(client, *master)
+    _post_check(client, *master)
+
+    blobs = db.query(ImageBlob).order_by(ImageBlob.id).all()
+    assert [b.ref_count for b in blobs] == [2, 2]
+    for blob in blobs:
+        assert blob.path == os.path.join(
+            settings.IMAGE_STORAGE_PATH, BLOB_DIR, blob.sha256[:2], blob.sha256[2:4], f"{blob.sha256}.jpg"
+        )
+        assert os.path.exists(blob.path)
+        assert {image.image_path for image in blob.images} == {blob.path}
+
+    # Deleting an image releases its reference
+    image = db.query(CheckImage).filter(CheckImage.check_id == first).order_by(CheckImage.order_index).first()
+    db.delete(image)
+    db.commit()
+    db.expire_all()
+    assert [b.ref_count for b in db.query(ImageBlob).order_by(ImageBlob.id)] == [1, 2]
+
+
+def test_blobs_are_per_clinic(client, db, master):
+    east = client.post(f"{API}/admin/clinics", json={"slug": "east", "name": "East"}, auth=ADMIN).json()
+    headers = {"X-Clinic": "east"}
+    toilet = client.post(f"{API}/admin/toilets", json={"name": "East 1F"}, headers=headers, auth=ADMIN).json()
+    staff = client.post(f"{API}/admin/staff", json={"internal_name": "e", "icon_code": "cat"}, headers=headers, auth=ADMIN).json()
+
+    _post_check(client, *master)
+    _post_check(client, toilet["id"], staff["id"], headers=headers)
+
+    default_blobs = db.query(ImageBlob).filter(ImageBlob.clinic_id == DEFAULT_CLINIC_ID).all()
+    east_blobs = db.query(ImageBlob).filter(ImageBlob.clinic_id == east["id"]).all()
+    assert len(default_blobs) == len(east_blobs) == 2
+    assert {b.sha256 for b in default_blobs} == {b.sha256 for b in east_blobs}
+    east_root = os.path.join(settings.IMAGE_STORAGE_PATH, CLINICS_DIR, str(east["id"]), BLOB_DIR)
+    for blob in east_blobs:
+        assert blob.path.startswith(east_root + os.sep) and os.path.exists(blob.path)
+        assert blob.ref_count == 1
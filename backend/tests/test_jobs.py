@@ -0,0 +1,106 @@
+import threading
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, update
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models import Job
+from app.services import jobs
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    monkeypatch.setattr(jobs, "_handlers", {})
+    jobs.handler("test.single", concurrency=1)(lambda db, payload: None)
+    jobs.handler("test.pair", concurrency=2)(lambda db, payload: None)
+    return jobs._handlers
+
+
+def _enqueue(db, job_type, count):
+    for i in range(count):
+        jobs.enqueue(db, job_type, {"n": i})
+    db.commit()
+
+
+def _claim_concurrently(workers):
+    claimed = []
+
+    def claim(worker_id):
+        db = SessionLocal()
+        try:
+            claimed.append(jobs.claim_next(db, worker_id))
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=claim, args=(f"w{i}",)) for i in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return [job_id for job_id in claimed if job_id is not None]
+
+
+def test_concurrency_limit_holds_across_workers(db, handlers):
+    _enqueue(db, "test.single", 5)
+    _enqueue(db, "test.pair", 5)
+
+    claimed = _claim_concurrently(8)
+
+    running = dict(
+        db.query(Job.job_type, func.count(Job.id)).filter(Job.status == jobs.RUNNING).group_by(Job.job_type).all()
+    )
+    assert running == {"test.single": 1, "test.pair": 2}
+    assert len(claimed) == len(set(claimed)) == 3
+
+
+def test_finished_job_frees_its_slot(db, handlers):
+    _enqueue(db, "test.single", 2)
+    first = jobs.claim_next(db, "w1")
+    assert first is not None
+    assert jobs.claim_next(db, "w2") is None
+
+    jobs.run_job(first)
+
+    second = jobs.claim_next(db, "w2")
+    assert second not in (None, first)
+    assert db.get(Job, first).status == jobs.DONE
+
+
+def test_failed_job_is_retried_with_backoff(db, handlers):
+    def fail(db, payload):
+        raise RuntimeError("boom")
+
+    jobs.handler("test.failing", concurrency=1, max_attempts=2)(fail)
+    _enqueue(db, "test.failing", 1)
+
+    job_id = jobs.claim_next(db, "w1")
+    jobs.run_job(job_id)
+    db.expire_all()
+    job = db.get(Job, job_id)
+    assert job.status == jobs.QUEUED and job.attempts == 1 and "boom" in job.last_error
+    # Not runnable again until the backoff has passed
+    assert jobs.claim_next(db, "w1") is None
+
+
+def test_stale_jobs_are_requeued_until_their_attempts_run_out(db, handlers):
+    jobs.handler("test.crashing", concurrency=1, max_attempts=2)(lambda db, payload: None)
+    _enqueue(db, "test.crashing", 1)
+    long_ago = jobs._utcnow() - timedelta(seconds=settings.JOB_VISIBILITY_TIMEOUT_SECONDS + 1)
+
+    # The worker dies during each attempt and never reports back
+    for attempt in (1, 2):
+        job_id = jobs.claim_next(db, "w1")
+        assert job_id is not None
+        db.execute(update(Job).where(Job.id == job_id).values(locked_at=long_ago))
+        db.commit()
+        jobs.requeue_stale(db)
+        db.expire_all()
+        job = db.get(Job, job_id)
+        assert job.attempts == attempt
+        assert job.status == (jobs.QUEUED if attempt < job.max_attempts else jobs.FAILED)
+
+    assert job.locked_by is None and job.finished_at is not None
+    assert "stopped responding" in job.last_error
+    assert jobs.claim_next(db, "w1") is None
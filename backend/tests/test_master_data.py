@@ -0,0 +1,52 @@
+import pytest
+
+from app.models import ClinicConfig, Staff, Toilet
+from app.services import clinic_settings, master_data
+
+from .conftest import ADMIN, API
+
+
+def _counts(db):
+    return db.query(Staff).count(), db.query(Toilet).count(), db.query(ClinicConfig).count()
+
+
+def test_invalid_batch_reports_every_error_and_writes_nothing(client, db, master):
+    before = _counts(db)
+    response = client.post(f"{API}/admin/bulk", json={
+        "staff": [{"icon_code": "cat", "internal_name": "new"}],
+        "toilets": [{"name": "2F"}, {"id": 999, "name": "missing"}],
+        "settings": [{"key": "MORNING_CHECK_START", "value": "soon"}],
+        "deactivate": {"staff": [12345]},
+    }, auth=ADMIN)
+
+    assert response.status_code == 400
+    errors = response.json()["detail"]
+    assert len(errors) == 3
+    assert any("999" in e for e in errors)
+    assert any("MORNING_CHECK_START" in e for e in errors)
+    assert any("12345" in e for e in errors)
+    db.expire_all()
+    assert _counts(db) == before
+
+
+def test_failure_while_applying_rolls_back_the_whole_batch(client, db, master, monkeypatch):
+    before = _counts(db)
+    invalidated = []
+    monkeypatch.setattr(clinic_settings, "invalidate", lambda clinic_id=None: invalidated.append(clinic_id))
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("disk full")
+
+    # Reordering runs after every insert / update of the batch
+    monkeypatch.setattr(master_data, "reorder", fail)
+    with pytest.raises(RuntimeError):
+        client.post(f"{API}/admin/bulk", json={
+            "staff": [{"icon_code": "cat", "internal_name": "new"}],
+            "toilets": [{"name": "2F"}],
+            "settings": [{"key": "MORNING_CHECK_START", "value": "07:30"}],
+            "order": {"staff": [master[1]]},
+        }, auth=ADMIN)
+
+    db.expire_all()
+    assert _counts(db) == before
+    assert invalidated == []  # events of the rolled back batch are never delivered
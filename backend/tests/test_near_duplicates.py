@@ -0,0 +1,65 @@
+import io
+
+from PIL import Image, ImageDraw
+
+from app.models import CheckImage
+from app.services.near_duplicates import flag_check_near_duplicates, near_duplicate_index
+
+from .conftest import API, png
+
+
+def _gradient(box=None) -> bytes:
+    """Left-to-right dark gradient; `box` paints a white rectangle (a small edit of the same scene)."""
+    img = Image.linear_gradient("L").transpose(Image.Transpose.ROTATE_270).resize((72, 64)).convert("RGB")
+    if box:
+        ImageDraw.Draw(img).rectangle(box, fill=(255, 255, 255))
+    out = io.BytesIO()
+    img.save(out, "PNG")
+    return out.getvalue()
+
+
+def _post_check(client, master, *images):
+    toilet_id, staff_id = master
+    posted = client.post(
+        f"{API}/checks/",
+        data={"toilet_id": toilet_id, "staff_id": staff_id, "device_uuid": "dev-1"},
+        files=[("images", (f"{i}.png", data, "image/png")) for i, data in enumerate(images)],
+    )
+    assert posted.status_code == 200
+    return posted.json()["id"]
+
+
+def _images(db, check_id):
+    db.expire_all()
+    return db.query(CheckImage).filter(CheckImage.check_id == check_id).order_by(CheckImage.order_index).all()
+
+
+def _run_job(db, check_id):
+    flag_check_near_duplicates(db, {"check_id": check_id})
+    db.commit()
+
+
+def test_near_duplicate_of_an_earlier_check_is_flagged(client, db, master):
+    # The two images of one check look alike, but only other checks count
+    first = _post_check(client, master, _gradient(), _gradient(box=(16, 0, 23, 15)))
+    _run_job(db, first)
+    assert [i.near_duplicate_of_id for i in _images(db, first)] == [None, None]
+
+    second = _post_check(client, master, _gradient(box=(8, 8, 23, 23)), png())
+    _run_job(db, second)
+    retaken, unrelated = _images(db, second)
+    assert retaken.near_duplicate_of_id in {i.id for i in _images(db, first)}
+    assert 0 < retaken.near_duplicate_distance <= 6
+    assert unrelated.near_duplicate_of_id is None
+
+
+def test_new_checks_reach_an_index_that_is_already_loaded(client, db, master):
+    toilet_id, _ = master
+    first = _post_check(client, master, _gradient(), png())
+    _run_job(db, first)
+    assert toilet_id in near_duplicate_index._entries
+
+    # Recorded by another process: only the CHECK_CREATED event tells this one
+    second = _post_check(client, master, _gradient(box=(16, 0, 23, 15)), png((10, 200, 10)))
+    indexed = {e.image_id for e in near_duplicate_index._entries[toilet_id]}
+    assert {i.id for i in _images(db, second) if i.blob.phash} <= indexed
@@ -0,0 +1,47 @@
+import asyncio
+import os
+
+import pytest
+
+from app.core import profiling, static_files
+from app.core.config import settings
+
+from .conftest import ADMIN, API
+
+
+def test_profile_is_written_off_the_event_loop(client, monkeypatch):
+    saved_on_loop = []
+    save = profiling.Profile.save
+
+    def recording_save(self):
+        try:
+            asyncio.get_running_loop()
+            saved_on_loop.append(True)
+        except RuntimeError:
+            saved_on_loop.append(False)
+        save(self)
+
+    monkeypatch.setattr(profiling.Profile, "save", recording_save)
+
+    response = client.get(f"{API}/toilets", headers={"X-Profile": "1"}, auth=ADMIN)
+
+    assert response.status_code == 200
+    assert saved_on_loop == [False]
+    profile_id = response.headers["X-Profile-Id"]
+    assert [p["id"] for p in profiling.list_profiles()] == [profile_id]
+    assert client.get(f"{API}/admin/profiles/{profile_id}", auth=ADMIN).status_code == 200
+
+
+def test_profiles_are_kept_on_the_disk_but_not_served(client, monkeypatch):
+    hidden = os.path.join(settings.IMAGE_STORAGE_PATH, ".profiles")
+    monkeypatch.setattr(settings, "PROFILE_OUTPUT_PATH", hidden)
+    response = client.get(f"{API}/toilets", headers={"X-Profile": "1"}, auth=ADMIN)
+    profile_id = response.headers["X-Profile-Id"]
+
+    assert os.path.exists(os.path.join(hidden, f"{profile_id}.json"))
+    assert client.get(f"/images/.profiles/{profile_id}.json").status_code == 404
+    static_files.ensure_private("PROFILE_OUTPUT_PATH")
+
+    monkeypatch.setattr(settings, "PROFILE_OUTPUT_PATH", os.path.join(settings.IMAGE_STORAGE_PATH, "profiles"))
+    with pytest.raises(RuntimeError, match="PROFILE_OUTPUT_PATH"):
+        static_files.ensure_private("PROFILE_OUTPUT_PATH")
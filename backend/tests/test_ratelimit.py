@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from app.core import ratelimit
+from app.core.config import settings
+from app.core.ratelimit import ConcurrencyLimit, RateLimiter, UploadAdmissionMiddleware
+
+from .conftest import API, png
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit, "ip_limiter", RateLimiter("ip", 0, 100))
+    monkeypatch.setattr(ratelimit, "device_limiter", RateLimiter("device", 0, 1))
+    monkeypatch.setattr(ratelimit, "upload_concurrency", ConcurrencyLimit(4))
+
+
+def _post_check(client, master, device="dev-1", headers=None):
+    toilet_id, staff_id = master
+    return client.post(
+        f"{API}/checks/",
+        data={"toilet_id": toilet_id, "staff_id": staff_id, "device_uuid": device},
+        files=[("images", ("a.png", png(), "image/png")), ("images", ("b.png", png(), "image/png"))],
+        headers=headers or {},
+    )
+
+
+def test_rejected_upload_is_answered_before_the_body_is_read(limits, monkeypatch):
+    monkeypatch.setattr(ratelimit, "upload_concurrency", ConcurrencyLimit(0))
+    sent = []
+
+    async def app(scope, receive, send):
+        raise AssertionError("endpoint reached")
+
+    async def receive():
+        raise AssertionError("body read")
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": f"{API}/checks/", "headers": [],
+             "query_string": b"", "client": ("10.0.0.1", 1234)}
+    asyncio.run(UploadAdmissionMiddleware(app)(scope, receive, send))
+
+    assert sent[0]["status"] == 429
+    assert (b"retry-after", b"1") in sent[0]["headers"]
+
+
+def test_device_header_is_charged_once_per_check(client, master, limits):
+    assert _post_check(client, master, headers={"X-Device-UUID": "dev-1"}).status_code == 200
+    rejected = _post_check(client, master, headers={"X-Device-UUID": "dev-1"})
+    assert rejected.status_code == 429
+    assert "device" in rejected.json()["detail"]
+    assert rejected.headers["Retry-After"]
+    assert ratelimit.upload_concurrency.in_flight == 0
+
+
+def test_form_device_is_charged_without_the_header(client, master, limits):
+    assert _post_check(client, master, device="dev-2").status_code == 200
+    assert _post_check(client, master, device="dev-2").status_code == 429
+    # The IP bucket was charged by the middleware for both attempts
+    assert [b.tokens for b in ratelimit.ip_limiter._buckets.values()] == [pytest.approx(98)]
@@ -0,0 +1,79 @@
+import os
+import shutil
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from app.api import deps
+from app.core.config import settings
+from app.core.timeutil import to_jst
+from app.db import session
+from app.models import CheckImage, Device, ToiletCheck
+
+from .conftest import API, png
+
+
+@pytest.fixture
+def replica(master, monkeypatch):
+    """A second SQLite file as the replica: a copy of the primary that does not follow later writes."""
+    primary_path = settings.DATABASE_URL.removeprefix("sqlite:///")
+    replica_path = os.path.join(os.path.dirname(primary_path), "replica.db")
+    shutil.copyfile(primary_path, replica_path)
+    monkeypatch.setattr(settings, "DATABASE_REPLICA_URL", f"sqlite:///{replica_path}")
+
+    replica_engine = create_engine(settings.DATABASE_REPLICA_URL)
+    monkeypatch.setattr(session, "replica_engine", replica_engine)
+    monkeypatch.setattr(deps, "ReplicaSessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=replica_engine))
+    monkeypatch.setattr(session, "_recent_writes", {})
+    yield replica_engine
+    replica_engine.dispose()
+    os.remove(replica_path)
+
+
+def _post_check(client, master, device):
+    toilet_id, staff_id = master
+    posted = client.post(
+        f"{API}/checks/",
+        data={"toilet_id": toilet_id, "staff_id": staff_id, "device_uuid": device},
+        files=[("images", ("a.png", png(), "image/png")), ("images", ("b.png", png((10, 200, 10)), "image/png"))],
+    )
+    assert posted.status_code == 200
+    return posted.json()["id"]
+
+
+def _listed(client, device=None):
+    today = to_jst(datetime.now(timezone.utc)).date().isoformat()
+    headers = {"X-Device-UUID": device} if device else {}
+    response = client.get(f"{API}/checks/", params={"date": today, "fields": "id"}, headers=headers)
+    assert response.status_code == 200
+    return [row["id"] for row in response.json()]
+
+
+def test_gets_read_the_replica(client, master, replica):
+    toilet_id, staff_id = master
+    with replica.begin() as conn:
+        conn.execute(ToiletCheck.__table__.insert().values(
+            id=500, toilet_id=toilet_id, staff_id=staff_id, checked_at=datetime.now(timezone.utc), status_type="NORMAL",
+        ))
+    assert _listed(client) == [500]
+
+
+def test_a_device_reads_its_own_write_from_the_primary(client, master, replica, monkeypatch):
+    check_id = _post_check(client, master, "dev-1")
+
+    assert _listed(client, "dev-1") == [check_id]
+    assert _listed(client, "dev-2") == []
+    assert _listed(client) == []
+
+    # Once READ_YOUR_WRITES_SECONDS have passed the device is back on the replica
+    monkeypatch.setattr(settings, "READ_YOUR_WRITES_SECONDS", 0)
+    assert _listed(client, "dev-1") == []
+
+
+def test_writes_never_reach_the_replica(client, master, replica):
+    _post_check(client, master, "dev-1")
+    with replica.connect() as conn:
+        for model in (ToiletCheck, CheckImage, Device):
+            assert conn.execute(select(func.count()).select_from(model)).scalar() == 0
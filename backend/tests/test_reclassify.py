@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta, timezone
+
+from app.models import ToiletCheck, ToiletCheckArchive
+from app.services.check_listing import list_checks, parse_fieldset
+from app.services.partitions import archive_before, fetch_checks
+from app.services.reclassify import reclassify
+
+START = datetime(2026, 1, 31, 14, 0, tzinfo=timezone.utc)  # 23:00 JST, the last hour of January
+
+
+def _add_checks(db, master, offsets_min):
+    toilet_id, staff_id = master
+    for minutes in offsets_min:
+        at = START + timedelta(minutes=minutes)
+        db.add(ToiletCheck(toilet_id=toilet_id, staff_id=staff_id, checked_at=at, status_type="NORMAL"))
+    db.commit()
+
+
+def test_first_live_check_measures_from_the_archive(db, master):
+    # 23:00 and 23:30 JST in January (archived), then 00:10 and 01:10 JST in February
+    _add_checks(db, master, [0, 30, 70, 130])
+    reclassify(db, dry_run=False)
+    before = [c.interval_sec_from_prev for c in db.query(ToiletCheck).order_by(ToiletCheck.checked_at)]
+    assert before == [None, 1800, 2400, 3600]
+
+    assert archive_before(db, datetime(2026, 1, 31, 15, 0, tzinfo=timezone.utc)) == 2
+    assert db.query(ToiletCheckArchive).count() == 2
+
+    # The 00:10 check still follows the archived 23:30 one: nothing to rewrite
+    result = reclassify(db, dry_run=False)
+    assert (result.total, result.changed) == (2, 0)
+    live = db.query(ToiletCheck).order_by(ToiletCheck.checked_at).all()
+    assert [c.interval_sec_from_prev for c in live] == [2400, 3600]
+    assert [c.status_type for c in live] == ["TOO_SHORT", "NORMAL"]
+
+def test_reads_merge_the_archive_and_late_live_checks(db, master):
+    _add_checks(db, master, [0, 30, 70])
+    archive_before(db, datetime(2026, 1, 31, 15, 0, tzinfo=timezone.utc))
+    # A late check inside the archived range stays live until the next archive run
+    _add_checks(db, master, [10])
+
+    checks = fetch_checks(db, START, START + timedelta(hours=2))
+    assert [c.checked_at.replace(tzinfo=timezone.utc) - START for c in checks] == [
+        timedelta(minutes=m) for m in (0, 10, 30, 70)
+    ]
+    assert [type(c) for c in checks] == [ToiletCheckArchive, ToiletCheck, ToiletCheckArchive, ToiletCheck]
+
+    listing = list_checks(db, START, START + timedelta(hours=2), parse_fieldset("id", None))
+    assert [row["id"] for row in listing] == [c.id for c in checks]
@@ -0,0 +1,82 @@
+import pytest
+
+from app.core import tenancy
+
+from .conftest import ADMIN, API, png
+
+AT = "2026-10-19T07:45:00"  # JST
+
+
+@pytest.fixture
+def second_clinic(client):
+    created = client.post(f"{API}/admin/clinics", json={
+        "slug": "east", "name": "East", "admin_username": "east-admin", "admin_password": "s3cret",
+    }, auth=ADMIN)
+    assert created.status_code == 200
+    return {"X-Clinic": "east"}
+
+
+def _status(client, headers):
+    return client.get(f"{API}/dashboard/simple-status", params={"at": AT}, headers=headers, auth=ADMIN).json()
+
+
+def test_master_data_and_checks_stay_in_their_clinic(client, master, second_clinic):
+    east_toilet = client.post(f"{API}/admin/toilets", json={"name": "East 1F"}, headers=second_clinic, auth=ADMIN)
+    assert east_toilet.status_code == 200
+
+    assert [t["name"] for t in client.get(f"{API}/toilets").json()] == ["1F"]
+    assert [t["name"] for t in client.get(f"{API}/toilets", headers=second_clinic).json()] == ["East 1F"]
+
+    # The default clinic's toilet / staff cannot be used through another clinic
+    toilet_id, staff_id = master
+    posted = client.post(
+        f"{API}/checks/",
+        data={"toilet_id": toilet_id, "staff_id": staff_id, "device_uuid": "dev-1"},
+        files=[("images", ("a.png", png(), "image/png")), ("images", ("b.png", png(), "image/png"))],
+        headers=second_clinic,
+    )
+    assert posted.status_code == 404
+
+    assert client.get(f"{API}/toilets", headers={"X-Clinic": "nowhere"}).status_code == 404
+
+
+def test_clinic_admin_only_manages_its_own_clinic(client, second_clinic):
+    east_admin = ("east-admin", "s3cret")
+    assert client.get(f"{API}/admin/settings", headers=second_clinic, auth=east_admin).status_code == 200
+    assert client.get(f"{API}/admin/settings", auth=east_admin).status_code == 401
+    assert client.get(f"{API}/admin/settings", headers=second_clinic, auth=("east-admin", "wrong")).status_code == 401
+    assert client.get(f"{API}/admin/clinics", headers=second_clinic, auth=east_admin).status_code == 403
+
+    # A remembered login does not survive a password change
+    client.patch(f"{API}/admin/clinics/{tenancy.resolve('east').id}", json={"admin_password": "n3w"}, auth=ADMIN)
+    assert client.get(f"{API}/admin/settings", headers=second_clinic, auth=east_admin).status_code == 401
+    assert client.get(f"{API}/admin/settings", headers=second_clinic, auth=("east-admin", "n3w")).status_code == 200
+
+
+def test_login_cache_never_holds_the_password_or_failures(client, second_clinic, monkeypatch):
+    monkeypatch.setattr(tenancy, "_verified", {})
+    client.get(f"{API}/admin/settings", headers=second_clinic, auth=("east-admin", "wrong"))
+    assert tenancy._verified == {}
+    client.get(f"{API}/admin/settings", headers=second_clinic, auth=("east-admin", "s3cret"))
+    [(username, _)] = tenancy._verified
+    assert username == "east-admin"
+    assert b"s3cret" not in repr(tenancy._verified).encode()
+
+
+def test_schedule_overrides_apply_to_one_clinic(client, second_clinic):
+    # 07:45 JST: before the default morning check window (08:00) opens
+    assert _status(client, {})["morning_check"]["status"] == "pending"
+    assert _status(client, second_clinic)["morning_check"]["status"] == "pending"
+
+    set_start = client.post(f"{API}/admin/settings", params={"key": "MORNING_CHECK_START"},
+                            json={"value": "07:30"}, headers=second_clinic, auth=ADMIN)
+    assert set_start.status_code == 200
+
+    assert _status(client, {})["morning_check"]["status"] == "pending"
+    east = _status(client, second_clinic)["morning_check"]
+    assert east["status"] == "warning"
+    assert east["time_range"].startswith("07:30")
+
+    invalid = client.post(f"{API}/admin/settings", params={"key": "MORNING_CHECK_START"},
+                          json={"value": "8.30am"}, headers=second_clinic, auth=ADMIN)
+    assert invalid.status_code == 400
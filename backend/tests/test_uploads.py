@@ -0,0 +1,170 @@
+import os
+import threading
+
+import pytest
+
+from app.api import uploads as uploads_api
+from app.core import static_files
+from app.core.config import settings
+from app.models import ImageBlob, ToiletCheck, UploadSession
+from app.services import uploads
+
+from .conftest import API, png
+
+
+def _create(client, master, parts):
+    toilet_id, staff_id = master
+    r = client.post(f"{API}/uploads/", json={
+        "toilet_id": toilet_id, "staff_id": staff_id, "device_uuid": "dev-1",
+        "part_sizes": [len(p) for p in parts],
+    })
+    assert r.status_code == 201, r.text
+    return r.json()["upload_id"]
+
+
+def _patch(client, upload_id, index, offset, chunk):
+    return client.patch(
+        f"{API}/uploads/{upload_id}/parts/{index}", content=chunk,
+        headers={"Upload-Offset": str(offset), "Content-Type": "application/offset+octet-stream"},
+    )
+
+
+def _upload_all(client, upload_id, parts):
+    for index, data in enumerate(parts):
+        half = len(data) // 2
+        assert _patch(client, upload_id, index, 0, data[:half]).status_code == 204
+        r = _patch(client, upload_id, index, half, data[half:])
+        assert r.status_code == 204 and r.headers["Upload-Offset"] == str(len(data))
+
+
+def test_finalize_is_idempotent(client, master, db):
+    parts = [png(), png((10, 200, 10))]
+    upload_id = _create(client, master, parts)
+    _upload_all(client, upload_id, parts)
+
+    first = client.post(f"{API}/uploads/{upload_id}/finalize")
+    retry = client.post(f"{API}/uploads/{upload_id}/finalize")
+
+    assert first.status_code == 200 and retry.status_code == 200
+    assert first.json()["id"] == retry.json()["id"]
+    assert db.query(ToiletCheck).count() == 1
+    assert db.get(UploadSession, upload_id).check_id == first.json()["id"]
+
+
+def test_resume_reports_current_offset(client, master):
+    parts = [png(), png((10, 200, 10))]
+    upload_id = _create(client, master, parts)
+    assert _patch(client, upload_id, 0, 0, parts[0][:10]).status_code == 204
+
+    # A retried chunk from the old offset is refused with the offset to resume from
+    r = _patch(client, upload_id, 0, 0, parts[0][:10])
+    assert r.status_code == 409 and r.headers["Upload-Offset"] == "10"
+    assert client.head(f"{API}/uploads/{upload_id}/parts/0").headers["Upload-Offset"] == "10"
+
+
+def test_concurrent_appends_do_not_interleave(client, master):
+    parts = [png(), png((10, 200, 10))]
+    upload_id = _create(client, master, parts)
+    chunk = parts[0][:20]
+    outcomes = []
+
+    def append():
+        try:
+            outcomes.append(uploads.append_chunk(upload_id, 0, 0, chunk, len(parts[0])))
+        except uploads.OffsetMismatch as e:
+            outcomes.append(f"mismatch at {e.current}")
+
+    threads = [threading.Thread(target=append) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(outcomes, key=str) == [20, "mismatch at 20"]
+    assert uploads.part_offset(upload_id, 0) == 20
+
+
+def test_failed_finalize_leaves_no_check(client, master, db, monkeypatch):
+    parts = [png(), png((10, 200, 10))]
+    upload_id = _create(client, master, parts)
+    _upload_all(client, upload_id, parts)
+    record_check = uploads_api.record_check
+
+    def crash_after_recording(*args, **kwargs):
+        record_check(*args, **kwargs)
+        raise RuntimeError("worker died")
+
+    monkeypatch.setattr(uploads_api, "record_check", crash_after_recording)
+    assert client.post(f"{API}/uploads/{upload_id}/finalize").status_code == 500
+    assert db.query(ToiletCheck).count() == 0
+
+    monkeypatch.setattr(uploads_api, "record_check", record_check)
+    r = client.post(f"{API}/uploads/{upload_id}/finalize")
+    assert r.status_code == 200
+    assert db.query(ToiletCheck).count() == 1
+
+
+def test_concurrent_finalize_records_one_check(client, master, db):
+    parts = [png(), png((10, 200, 10))]
+    upload_id = _create(client, master, parts)
+    _upload_all(client, upload_id, parts)
+
+    responses = []
+    threads = [
+        threading.Thread(target=lambda: responses.append(client.post(f"{API}/uploads/{upload_id}/finalize")))
+        for _ in range(2)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert [r.status_code for r in responses] == [200, 200]
+    assert responses[0].json()["id"] == responses[1].json()["id"]
+    assert db.query(ToiletCheck).count() == 1
+
+
+def test_cross_origin_clients_can_read_the_upload_offset(client, master):
+    parts = [png(), png((10, 200, 10))]
+    upload_id = _create(client, master, parts)
+    r = client.patch(
+        f"{API}/uploads/{upload_id}/parts/0", content=parts[0][:10],
+        headers={
+            "Origin": "https://kj-toilet-frontend.onrender.com",
+            "Upload-Offset": "0",
+            "Content-Type": "application/offset+octet-stream",
+        },
+    )
+    assert r.status_code == 204 and r.headers["Upload-Offset"] == "10"
+    exposed = {h.strip().lower() for h in r.headers["Access-Control-Expose-Headers"].split(",")}
+    assert {"upload-offset", "retry-after", "x-dashboard-cursor", "x-profile-id", "link", "server-timing"} <= exposed
+
+
+def test_staging_is_never_served_under_images(client, master, db, monkeypatch):
+    staging = os.path.join(settings.IMAGE_STORAGE_PATH, ".uploads")
+    monkeypatch.setattr(settings, "UPLOAD_STAGING_PATH", staging)
+    parts = [png(), png((10, 200, 10))]
+    upload_id = _create(client, master, parts)
+    assert _patch(client, upload_id, 0, 0, parts[0]).status_code == 204
+    assert os.path.exists(uploads.part_path(upload_id, 0))
+
+    assert client.get(f"/images/.uploads/{upload_id}/0.part").status_code == 404
+    assert client.get(f"/images/blobs/../.uploads/{upload_id}/0.part").status_code == 404
+
+    assert not static_files.served_publicly(staging)
+    assert static_files.served_publicly(os.path.join(settings.IMAGE_STORAGE_PATH, "uploads"))
+    assert static_files.served_publicly(settings.IMAGE_STORAGE_PATH)
+    assert not static_files.served_publicly(os.path.dirname(settings.IMAGE_STORAGE_PATH) + "/uploads")
+    monkeypatch.setattr(settings, "UPLOAD_STAGING_PATH", os.path.join(settings.IMAGE_STORAGE_PATH, "uploads"))
+    with pytest.raises(RuntimeError, match="UPLOAD_STAGING_PATH"):
+        static_files.ensure_private("UPLOAD_STAGING_PATH")
+
+
+def test_public_images_are_still_served(client, master, db):
+    parts = [png(), png((10, 200, 10))]
+    upload_id = _create(client, master, parts)
+    _upload_all(client, upload_id, parts)
+    client.post(f"{API}/uploads/{upload_id}/finalize")
+    blob = db.query(ImageBlob).first()
+    relative = os.path.relpath(blob.path, settings.IMAGE_STORAGE_PATH).replace(os.sep, "/")
+    assert client.get(f"/images/{relative}").status_code == 200
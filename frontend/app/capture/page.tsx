@@ -114,23 +114,15 @@ export default function CapturePage() {
 
         setIsSubmitting(true);
         try {
-            const formData = new FormData();
-            formData.append('toilet_id', selectedToiletId.toString());
-            formData.append('staff_id', staffId.toString());
-
             // デバイスUUIDの取得または生成
             let deviceUuid = localStorage.getItem('device_uuid');
             if (!deviceUuid) {
                 deviceUuid = crypto.randomUUID();
                 localStorage.setItem('device_uuid', deviceUuid);
             }
-            formData.append('device_uuid', deviceUuid);
-
-            images.forEach((img) => {
-                formData.append('images', img);
-            });
 
-            await api.submitCheck(formData);
+            // 電波の弱い場所でも途中から再送できるようチャンク送信
+            await api.submitCheckResumable(selectedToiletId, staffId, deviceUuid, images);
 
             // 成功 - ステートをリセットしてから遷移
             setImages([]);
@@ -1,6 +1,6 @@
 'use client';
 
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { api } from '@/lib/api';
 import { SimpleStatusResponse, ScheduledCheckStatus, RegularCheckStatus } from '@/lib/types';
 import clsx from 'clsx';
@@ -60,12 +60,15 @@ function getRegularDisplay(check: RegularCheckStatus): string {
 
 export default function DashboardPage() {
     const [data, setData] = useState<SimpleStatusResponse | null>(null);
+    const dataRef = useRef<SimpleStatusResponse | null>(null);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState<string | null>(null);
 
     const fetchData = async () => {
         try {
-            const res = await api.getSimpleStatus();
+            // 前回の結果を渡して差分だけ取得
+            const res = await api.getSimpleStatus(dataRef.current);
+            dataRef.current = res;
             setData(res);
             setError(null);
         } catch (err) {
@@ -1,54 +1,200 @@
-import { Staff, Toilet, DashboardDayResponse, StaffCreate, StaffUpdate, ToiletCreate, SimpleStatusResponse } from './types';
+import { Staff, Toilet, DashboardDayResponse, StaffCreate, StaffUpdate, ToiletCreate, SimpleStatusResponse, ContactSheet } from './types';
 
 const API_HOST = process.env.NEXT_PUBLIC_API_HOST || 'http://localhost:8000';
 const API_BASE = `${API_HOST}/api`;
 
+const UPLOAD_CHUNK_SIZE = 256 * 1024;
+const UPLOAD_MAX_RETRIES = 5;
+
+// 読み取り系リクエストに端末IDを付ける（自分の送信直後はサーバーがプライマリDBから読む）
+const readHeaders = (): HeadersInit => {
+    const deviceUuid = typeof window !== 'undefined' ? localStorage.getItem('device_uuid') : null;
+    return deviceUuid ? { 'X-Device-UUID': deviceUuid } : {};
+};
+
+// 複数クリニック運用時のクリニック指定（未設定ならサーバー側の既定クリニック）
+const clinicId = (): string | null => {
+    const stored = typeof window !== 'undefined' ? localStorage.getItem('clinic') : null;
+    return stored || process.env.NEXT_PUBLIC_CLINIC || null;
+};
+
+const apiFetch = (input: string, init: RequestInit = {}) => {
+    const clinic = clinicId();
+    if (!clinic) return fetch(input, init);
+    const headers = new Headers(init.headers);
+    headers.set('X-Clinic', clinic);
+    return fetch(input, { ...init, headers });
+};
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// サーバーが返した Upload-Offset。読めない場合（CORS で公開されていない等）は 0 に戻さずエラーにする
+const uploadOffset = (res: Response) => {
+    const header = res.headers.get('Upload-Offset');
+    const offset = header === null ? NaN : Number(header);
+    if (!Number.isInteger(offset) || offset < 0) throw new Error('Upload-Offset missing from response');
+    return offset;
+};
+
+// 429 の Retry-After（秒）。なければ fallbackMs
+const retryAfterMs = (res: Response, fallbackMs: number) => {
+    const seconds = Number(res.headers.get('Retry-After'));
+    return seconds > 0 ? seconds * 1000 : fallbackMs;
+};
+
+// 1パートをチャンク単位で送信。通信断の場合はサーバー側のオフセットを確認して再開する
+const uploadPart = async (uploadId: string, index: number, file: Blob) => {
+    const partUrl = `${API_BASE}/uploads/${uploadId}/parts/${index}`;
+    let offset = 0;
+    let retries = 0;
+
+    while (offset < file.size) {
+        try {
+            const res = await apiFetch(partUrl, {
+                method: 'PATCH',
+                headers: {
+                    'Upload-Offset': offset.toString(),
+                    'Content-Type': 'application/offset+octet-stream',
+                },
+                body: file.slice(offset, offset + UPLOAD_CHUNK_SIZE),
+            });
+            if (res.status === 409) {
+                offset = uploadOffset(res);
+                continue;
+            }
+            if (res.status === 429) {
+                // サーバーが混雑中：指定された時間だけ待って同じオフセットから再送
+                await sleep(retryAfterMs(res, 1000));
+                continue;
+            }
+            if (!res.ok) throw new Error(`Chunk upload failed (${res.status})`);
+            offset = uploadOffset(res);
+            retries = 0;
+        } catch (err) {
+            if (++retries > UPLOAD_MAX_RETRIES) throw err;
+            await sleep(1000 * 2 ** (retries - 1));
+            const head = await apiFetch(partUrl, { method: 'HEAD' }).catch(() => null);
+            if (head?.ok) offset = uploadOffset(head);
+        }
+    }
+};
+
 export const api = {
     // Checks
     submitCheck: async (formData: FormData) => {
-        const res = await fetch(`${API_BASE}/checks/`, {
+        // 端末IDをヘッダーでも送る（サーバーが本文を読む前に送信回数を判定できる）
+        const res = await apiFetch(`${API_BASE}/checks/`, {
             method: 'POST',
+            headers: readHeaders(),
             body: formData,
         });
         if (!res.ok) throw new Error('Failed to submit check');
         return res.json();
     },
 
+    // Resumable upload: create session -> PATCH chunks -> finalize
+    submitCheckResumable: async (toiletId: number, staffId: number, deviceUuid: string, images: Blob[]) => {
+        const res = await apiFetch(`${API_BASE}/uploads/`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                toilet_id: toiletId,
+                staff_id: staffId,
+                device_uuid: deviceUuid,
+                part_sizes: images.map((img) => img.size),
+            }),
+        });
+        if (res.status === 429) throw new Error('送信が多すぎます。しばらく待ってから再度お試しください');
+        if (!res.ok) throw new Error('Failed to start upload');
+        const { upload_id: uploadId } = await res.json();
+
+        for (let index = 0; index < images.length; index++) {
+            await uploadPart(uploadId, index, images[index]);
+        }
+
+        for (let attempt = 0; ; attempt++) {
+            try {
+                const done = await apiFetch(`${API_BASE}/uploads/${uploadId}/finalize`, { method: 'POST' });
+                if (done.status === 429 && attempt < UPLOAD_MAX_RETRIES) {
+                    await sleep(retryAfterMs(done, 1000 * 2 ** attempt));
+                    continue;
+                }
+                if (!done.ok) throw new Error('Failed to submit check');
+                return done.json();
+            } catch (err) {
+                if (attempt >= UPLOAD_MAX_RETRIES) throw err;
+                await sleep(1000 * 2 ** attempt);
+            }
+        }
+    },
+
     getChecks: async (date: string, toiletId?: number) => {
         const params = new URLSearchParams({ date });
         if (toiletId) params.append('toilet_id', toiletId.toString());
 
-        const res = await fetch(`${API_BASE}/checks/?${params}`);
+        const res = await apiFetch(`${API_BASE}/checks/?${params}`, { headers: readHeaders() });
         if (!res.ok) throw new Error('Failed to fetch checks');
         return res.json();
     },
 
     // Dashboard
-    getDashboardDay: async (date: string, toiletId?: number): Promise<DashboardDayResponse> => {
+    // previous を渡すと差分のみ取得して previous にマージする（変化なしなら previous をそのまま返す）
+    getDashboardDay: async (date: string, toiletId?: number, previous?: DashboardDayResponse | null): Promise<DashboardDayResponse> => {
         const params = new URLSearchParams({ date_str: date });
         if (toiletId) params.append('toilet_id', toiletId.toString());
+        if (previous?.cursor) params.append('since', previous.cursor);
 
-        const res = await fetch(`${API_BASE}/dashboard/day?${params}`);
+        const res = await apiFetch(`${API_BASE}/dashboard/day?${params}`, { cache: 'no-store', headers: readHeaders() });
+        if (res.status === 304 && previous) return previous;
         if (!res.ok) throw new Error('Failed to fetch dashboard data');
-        return res.json();
+        const data: DashboardDayResponse = await res.json();
+        if (!data.is_delta || !previous) return data;
+        return {
+            ...data,
+            major_checkpoints: data.major_checkpoints ?? previous.major_checkpoints,
+            realtime_alerts: data.realtime_alerts ?? previous.realtime_alerts,
+            timeline: [...data.timeline, ...previous.timeline],
+        };
+    },
+
+    // 1日分のサムネイルのスプライト（チェックがない日は null）
+    getContactSheet: async (date: string): Promise<ContactSheet | null> => {
+        const params = new URLSearchParams({ date_str: date });
+        const res = await apiFetch(`${API_BASE}/dashboard/day/contact-sheet?${params}`, { headers: readHeaders() });
+        if (res.status === 404) return null;
+        if (!res.ok) throw new Error('Failed to fetch contact sheet');
+        const sheet: ContactSheet = await res.json();
+        return { ...sheet, url: `${API_HOST}${sheet.url}` };
     },
 
     // Simple Status (New Alert System)
-    getSimpleStatus: async (): Promise<SimpleStatusResponse> => {
-        const res = await fetch(`${API_BASE}/dashboard/simple-status`);
+    getSimpleStatus: async (previous?: SimpleStatusResponse | null): Promise<SimpleStatusResponse> => {
+        const params = new URLSearchParams();
+        if (previous?.cursor) params.append('since', previous.cursor);
+
+        const res = await apiFetch(`${API_BASE}/dashboard/simple-status?${params}`, { cache: 'no-store', headers: readHeaders() });
+        if (res.status === 304 && previous) return previous;
         if (!res.ok) throw new Error('Failed to fetch simple status');
-        return res.json();
+        const data: SimpleStatusResponse = await res.json();
+        if (!data.is_delta || !previous) return data;
+        return {
+            ...data,
+            morning_check: data.morning_check ?? previous.morning_check,
+            afternoon_check: data.afternoon_check ?? previous.afternoon_check,
+            regular_check: data.regular_check ?? previous.regular_check,
+            timeline: [...data.timeline, ...previous.timeline],
+        };
     },
 
     // Master Data
     getToilets: async (): Promise<Toilet[]> => {
-        const res = await fetch(`${API_BASE}/toilets`);
+        const res = await apiFetch(`${API_BASE}/toilets`);
         if (!res.ok) throw new Error('Failed to fetch toilets');
         return res.json();
     },
 
     getStaff: async (): Promise<Staff[]> => {
-        const res = await fetch(`${API_BASE}/staff`);
+        const res = await apiFetch(`${API_BASE}/staff`);
         if (!res.ok) throw new Error('Failed to fetch staff');
         return res.json();
     },
@@ -62,7 +208,7 @@ export const api = {
 
         getStaff: async (creds: string, includeInactive: boolean = false): Promise<Staff[]> => {
             const params = includeInactive ? '?include_inactive=true' : '';
-            const res = await fetch(`${API_BASE}/admin/staff${params}`, {
+            const res = await apiFetch(`${API_BASE}/admin/staff${params}`, {
                 headers: { 'Authorization': `Basic ${creds}` }
             });
             if (!res.ok) throw new Error('Failed to fetch staff');
@@ -70,7 +216,7 @@ export const api = {
         },
 
         createStaff: async (creds: string, data: StaffCreate): Promise<Staff> => {
-            const res = await fetch(`${API_BASE}/admin/staff`, {
+            const res = await apiFetch(`${API_BASE}/admin/staff`, {
                 method: 'POST',
                 headers: {
                     'Authorization': `Basic ${creds}`,
@@ -83,7 +229,7 @@ export const api = {
         },
 
         updateStaff: async (creds: string, id: number, data: StaffUpdate): Promise<Staff> => {
-            const res = await fetch(`${API_BASE}/admin/staff/${id}`, {
+            const res = await apiFetch(`${API_BASE}/admin/staff/${id}`, {
                 method: 'PATCH',
                 headers: {
                     'Authorization': `Basic ${creds}`,
@@ -96,7 +242,7 @@ export const api = {
         },
 
         deleteStaff: async (creds: string, id: number) => {
-            const res = await fetch(`${API_BASE}/admin/staff/${id}`, {
+            const res = await apiFetch(`${API_BASE}/admin/staff/${id}`, {
                 method: 'DELETE',
                 headers: { 'Authorization': `Basic ${creds}` }
             });
@@ -105,7 +251,7 @@ export const api = {
         },
 
         reorderStaff: async (creds: string, staffIds: number[]) => {
-            const res = await fetch(`${API_BASE}/admin/staff/reorder`, {
+            const res = await apiFetch(`${API_BASE}/admin/staff/reorder`, {
                 method: 'POST',
                 headers: {
                     'Authorization': `Basic ${creds}`,
@@ -118,7 +264,7 @@ export const api = {
         },
 
         getToilets: async (creds: string): Promise<Toilet[]> => {
-            const res = await fetch(`${API_BASE}/admin/toilets`, {
+            const res = await apiFetch(`${API_BASE}/admin/toilets`, {
                 headers: { 'Authorization': `Basic ${creds}` }
             });
             if (!res.ok) throw new Error('Failed to fetch toilets');
@@ -126,7 +272,7 @@ export const api = {
         },
 
         createToilet: async (creds: string, data: ToiletCreate): Promise<Toilet> => {
-            const res = await fetch(`${API_BASE}/admin/toilets`, {
+            const res = await apiFetch(`${API_BASE}/admin/toilets`, {
                 method: 'POST',
                 headers: {
                     'Authorization': `Basic ${creds}`,
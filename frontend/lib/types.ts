@@ -23,6 +23,7 @@ export interface RealtimeAlert {
     toilet_name: string;
     minutes_elapsed: number;
     alert_level: 'warning' | 'alert';
+    since?: string | null;
 }
 
 export interface TimelineItem {
@@ -37,6 +38,26 @@ export interface DashboardDayResponse {
     major_checkpoints: MajorCheckpointStatus[];
     realtime_alerts: RealtimeAlert[];
     timeline: TimelineItem[];
+    cursor?: string;
+    is_delta?: boolean;
+}
+
+// 1日分のサムネイルをまとめた1枚の画像（スプライト）とタイル位置
+export interface ContactSheetTile {
+    image_id: number;
+    check_id: number;
+    x: number;
+    y: number;
+}
+
+export interface ContactSheet {
+    date: string;
+    version: number;
+    url: string;
+    tile_size: number;
+    width: number;
+    height: number;
+    tiles: ContactSheetTile[];
 }
 
 export interface StaffCreate {
@@ -71,6 +92,7 @@ export interface ScheduledCheckStatus {
     time: string | null;
     deadline: string;
     time_range: string;
+    since?: string | null;
 }
 
 export interface RegularCheckStatus {
@@ -79,9 +101,11 @@ export interface RegularCheckStatus {
     next_check_in: number;
     threshold: number;
     is_active: boolean;
+    since?: string | null;
 }
 
 export interface SimpleTimelineItem {
+    id?: number;
     time: string;
     staff_icon: string;
 }
@@ -94,4 +118,16 @@ export interface SimpleStatusResponse {
     regular_check: RegularCheckStatus;
     last_check_at: string | null;
     timeline: SimpleTimelineItem[];
+    cursor?: string;
+    is_delta?: boolean;
+}
+
+export interface AlertHistoryItem {
+    kind: 'realtime' | 'regular' | 'morning' | 'afternoon';
+    toilet_id: number | null;
+    toilet_name: string | null;
+    level: 'warning' | 'alert';
+    started_at: string;
+    ended_at: string | null;
+    duration_minutes: number;
 }